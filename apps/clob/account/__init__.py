@@ -1,21 +1,20 @@
 from decimal import Decimal
 from typing import Dict
 
+from .ledger import Ledger, LEDGER_DECIMALS, to_units, from_units, quantize
+
+ledger = Ledger()
+
 
 class SpotBalance:
-    _asset: str
-    _available: Decimal
-    _reserved: Decimal
-
-    def __init__(
-        self,
-        asset: str,
-        available: Decimal = Decimal(0),
-        reserved: Decimal = Decimal(0),
-    ):
+    """View over the ledger entry of one asset of an account."""
+
+    __slots__ = ("_account_id", "_asset_id", "_asset")
+
+    def __init__(self, account_id: int, asset: str):
+        self._account_id = account_id
+        self._asset_id = ledger.asset_id(asset)
         self._asset = asset
-        self._available = available
-        self._reserved = reserved
 
     @property
     def asset(self) -> str:
@@ -23,78 +22,68 @@ class SpotBalance:
 
     @property
     def available(self) -> Decimal:
-        return self._available
+        return ledger.balance(self._account_id, self._asset_id)[0]
 
     @property
     def reserved(self) -> Decimal:
-        return self._reserved
+        return ledger.balance(self._account_id, self._asset_id)[1]
 
     @property
     def total(self) -> Decimal:
-        return self._available + self._reserved
+        available, reserved = ledger.balance(self._account_id, self._asset_id)
+        return available + reserved
 
     def on_deposit(self, amount: Decimal):
-        if amount < 0:
-            raise ValueError("Deposit amount must be positive")
-        self._available += amount
+        ledger.deposit(self._account_id, self._asset_id, amount)
 
     def on_withdraw(self, amount: Decimal):
-        if amount < 0:
-            raise ValueError("Withdraw amount must be positive")
-        self._available -= amount
+        ledger.withdraw(self._account_id, self._asset_id, amount)
 
     def on_place_limit_order(self, amount: Decimal):
-        if amount > self._available:
-            raise ValueError("Not enough available balance to place limit order")
-        self._reserved += amount
-        self._available -= amount
+        ledger.reserve(self._account_id, self._asset_id, amount)
 
     def on_cancel_limit_order(self, amount: Decimal):
-        if amount > self._reserved:
-            raise ValueError("Not enough reserved balance to cancel limit order")
-        self._reserved -= amount
-        self._available += amount
-
-    def take_reservation(self, amount: Decimal):
-        if amount > self._reserved:
-            raise ValueError("Not enough reserved balance to take")
-        self._reserved -= amount
+        ledger.release(self._account_id, self._asset_id, amount)
 
 
 class SpotAccount:
+    """View over the ledger entries of one client."""
+
     _client_id: str
-    _balances: Dict[str, SpotBalance]
+    _account_id: int
 
     def __init__(self, client_id: str):
         self._client_id = client_id
-        self._balances = {}
+        self._account_id = ledger.account_id(client_id)
 
     @classmethod
     def new_with_initial_balance(
         cls, client_id: str, asset: str, initial_balance: Decimal
     ):
         account = cls(client_id)
-        account._balances[asset] = SpotBalance(asset, initial_balance)
+        account.get_balance(asset).on_deposit(initial_balance)
         return account
 
+    @property
+    def account_id(self) -> int:
+        return self._account_id
+
     def get_balance(self, asset: str) -> SpotBalance:
-        if asset not in self._balances:
-            self._balances[asset] = SpotBalance(asset)
-        return self._balances[asset]
+        balance = SpotBalance(self._account_id, asset)
+        ledger.open_balance(self._account_id, balance._asset_id)
+        return balance
 
     @property
     def balances(self) -> Dict[str, SpotBalance]:
-        return self._balances
-
-
-_accounts: Dict[str, SpotAccount] = {}
+        return {
+            asset: SpotBalance(self._account_id, asset)
+            for asset, _, _ in ledger.balances(self._account_id)
+        }
 
 
 def get_account(client_id: str) -> SpotAccount:
-    if not _accounts.get(client_id):
-        _accounts[client_id] = SpotAccount(client_id)
-    return _accounts[client_id]
+    return SpotAccount(client_id)
 
 
 def reset_accounts():
-    _accounts.clear()
+    ledger.reset()
@@ -1,3 +1,6 @@
+import os
+import secrets
+
 from fastapi import Security, HTTPException
 from fastapi.security import APIKeyHeader
 
@@ -10,3 +13,15 @@ async def get_api_key(api_key_header_value: str = Security(api_key_header)):
     if not api_key_header_value:
         raise HTTPException(status_code=403, detail="API key missing")
     return api_key_header_value
+
+
+# key of the admin endpoints; they are disabled when it is not set
+ADMIN_API_KEY = os.environ.get("CLOB_ADMIN_API_KEY")
+
+
+async def get_admin_key(api_key_header_value: str = Security(api_key_header)):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints disabled")
+    if not secrets.compare_digest(api_key_header_value, ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Not an admin API key")
+    return api_key_header_value
@@ -0,0 +1,234 @@
+"""
+Per-client admission control, in front of the matching engine.
+
+Every API key (the X-API-Key header, the value `get_api_key` returns) gets a
+token bucket per limit, as advertised in `exchangeInfo.rateLimits`:
+
+- `REQUEST_WEIGHT`: every request costs the weight of its route
+  (`ROUTE_COSTS`, 1 by default);
+- `ORDERS`: order entry and cancels cost 1 more. A batch or mass quote is
+  admitted for 1 order before its body is read, the route charges its other
+  orders once the body is validated (`charge_orders`).
+
+A bucket holds `limit` tokens and refills continuously at `limit` per
+interval, so a client may burst up to the limit and sustain the advertised
+rate. A request is admitted only if all its buckets hold its cost, and a
+rejected request costs nothing (a batch rejected by `charge_orders` keeps
+the order it was admitted for). `RateLimitMiddleware` checks the REST requests
+from their method, path and headers alone, before the body is read or
+validated; the websocket order entry checks each `order.*` request before
+decoding its params. Both draw from the same buckets. Responses carry the
+usage of the client in the Binance headers (`X-MBX-USED-WEIGHT-1M`,
+`X-MBX-ORDER-COUNT-10S`), rejections are 429 with a Retry-After.
+
+Requests without an API key are limited by client address instead, keyed
+`("ip", host)` so that no API key can share (or drain) their buckets. Buckets are per process:
+behind N gateway processes a client gets up to N times the limits.
+"""
+
+import json
+import math
+import os
+import time
+from typing import Iterable, NamedTuple
+
+from metrics import registry
+
+# request weight per minute and orders per 10 seconds of one API key, 0 for no limit
+WEIGHT_PER_MINUTE = int(os.environ.get("CLOB_RATE_LIMIT_WEIGHT", "6000"))
+ORDERS_PER_10S = int(os.environ.get("CLOB_RATE_LIMIT_ORDERS", "100"))
+
+REQUEST_WEIGHT = "REQUEST_WEIGHT"
+ORDERS = "ORDERS"
+
+# Binance error codes
+TOO_MANY_REQUESTS = -1003
+TOO_MANY_ORDERS = -1015
+
+_INTERVAL_S = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400}
+
+# (method, path) -> (request weight, orders); other routes weigh 1 and place no order
+ROUTE_COSTS: dict[tuple[str, str], tuple[int, int]] = {
+    ("POST", "/order"): (1, 1),
+    ("DELETE", "/order"): (1, 1),
+    ("POST", "/order/cancelReplace"): (1, 1),
+    ("PUT", "/order/amend"): (1, 1),
+    ("DELETE", "/order/massCancel"): (1, 1),
+    ("POST", "/order/massQuote"): (5, 1),
+    ("POST", "/batchOrders"): (5, 1),
+    ("DELETE", "/openOrders"): (1, 1),
+    ("GET", "/order"): (4, 0),
+    ("GET", "/openOrders"): (6, 0),
+    ("GET", "/allOrders"): (20, 0),
+    ("GET", "/myTrades"): (20, 0),
+    ("GET", "/account"): (20, 0),
+    ("GET", "/account/openOrders"): (20, 0),
+    ("GET", "/exchangeInfo"): (20, 0),
+    ("GET", "/depth"): (5, 0),
+    ("GET", "/klines"): (2, 0),
+    ("GET", "/ticker/bookTicker"): (2, 0),
+}
+DEFAULT_COST = (1, 0)
+# websocket API method -> (request weight, orders)
+WS_COSTS: dict[str, tuple[int, int]] = {
+    "order.place": (1, 1),
+    "order.cancel": (1, 1),
+    "order.cancelReplace": (1, 1),
+}
+
+# an API key, or ("ip", host) for the requests without one
+ClientKey = str | tuple[str, str]
+
+# idle clients are forgotten once there are more than that
+_PRUNE_AT = 10_000
+
+requests_rejected = registry.counter(
+    "clob_rate_limited_requests_total",
+    "Requests rejected by the per-client rate limits, per limit type.",
+    ("limit",),
+)
+
+
+class RateLimit(NamedTuple):
+    type: str
+    interval: str
+    interval_num: int
+    limit: int
+
+    def seconds(self) -> float:
+        return _INTERVAL_S[self.interval] * self.interval_num
+
+    def header(self) -> str:
+        """Name of the usage header of the limit, as Binance's."""
+        name = "USED-WEIGHT" if self.type == REQUEST_WEIGHT else "ORDER-COUNT"
+        return f"X-MBX-{name}-{self.interval_num}{self.interval[0]}"
+
+    def to_json(self) -> dict:
+        return {
+            "rateLimitType": self.type,
+            "interval": self.interval,
+            "intervalNum": self.interval_num,
+            "limit": self.limit,
+        }
+
+
+class RateLimited(Exception):
+    """The request would exceed `limit`; it has enough tokens again in `retry_after_s`."""
+
+    def __init__(self, limit: RateLimit, retry_after_s: float, used: list[int]):
+        if limit.type == REQUEST_WEIGHT:
+            self.code = TOO_MANY_REQUESTS
+            message = f"Too much request weight used; current limit is {limit.limit} request weight per {limit.interval_num} {limit.interval}."
+        else:
+            self.code = TOO_MANY_ORDERS
+            message = f"Too many new orders; current limit is {limit.limit} orders per {limit.interval_num} {limit.interval}."
+        super().__init__(message)
+        self.limit = limit
+        self.retry_after_s = retry_after_s
+        self.used = used
+
+
+class _Buckets:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: list[float], updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token buckets per client for `limits`, see the module docstring. For one event loop."""
+
+    limits: tuple[RateLimit, ...]
+    _rates: tuple[float, ...]
+    _headers: tuple[bytes, ...]
+    _buckets: dict[ClientKey, _Buckets]
+
+    def __init__(self, limits: Iterable[RateLimit] = ()):
+        self.set_limits(limits)
+
+    def set_limits(self, limits: Iterable[RateLimit]):
+        """Replace the limits (those of 0 are dropped) and forget every client's usage."""
+        self.limits = tuple(limit for limit in limits if limit.limit > 0)
+        self._rates = tuple(limit.limit / limit.seconds() for limit in self.limits)
+        self._headers = tuple(limit.header().lower().encode("latin-1") for limit in self.limits)
+        self._buckets = {}
+        self._rate_limits_json = json.dumps(
+            [limit.to_json() for limit in self.limits], separators=(",", ":")
+        )
+
+    def enabled(self) -> bool:
+        return bool(self.limits)
+
+    def rate_limits_json(self) -> str:
+        """The `rateLimits` array of exchangeInfo."""
+        return self._rate_limits_json
+
+    def acquire(self, client_id: ClientKey, weight: int, orders: int) -> list[int]:
+        """
+        Take the cost of one request of `client_id` from its buckets. Returns
+        the usage per limit, raises `RateLimited` (taking nothing) if any
+        bucket does not hold the cost.
+        """
+        if not self.limits:
+            return []
+        now = time.monotonic()
+        state = self._buckets.get(client_id)
+        if state is None:
+            if len(self._buckets) >= _PRUNE_AT:
+                self._prune(now)
+            state = self._buckets[client_id] = _Buckets(
+                [float(limit.limit) for limit in self.limits], now
+            )
+        else:
+            elapsed = now - state.updated
+            state.tokens = [
+                min(limit.limit, tokens + elapsed * rate)
+                for limit, tokens, rate in zip(self.limits, state.tokens, self._rates)
+            ]
+            state.updated = now
+
+        costs = [weight if limit.type == REQUEST_WEIGHT else orders for limit in self.limits]
+        for limit, tokens, rate, cost in zip(self.limits, state.tokens, self._rates, costs):
+            if cost > tokens:
+                requests_rejected.inc(limit.type)
+                raise RateLimited(limit, (cost - tokens) / rate, self._used(state))
+        state.tokens = [tokens - cost for tokens, cost in zip(state.tokens, costs)]
+        return self._used(state)
+
+    def usage(self, client_id: ClientKey) -> list[int]:
+        """Current usage per limit of `client_id`, as `acquire` returns it."""
+        return self.acquire(client_id, 0, 0)
+
+    def usage_headers(self, used: list[int]) -> list[tuple[bytes, bytes]]:
+        """Response headers of the usage returned by `acquire`."""
+        return [(name, b"%d" % n) for name, n in zip(self._headers, used)]
+
+    def _used(self, state: _Buckets) -> list[int]:
+        return [math.ceil(limit.limit - tokens) for limit, tokens in zip(self.limits, state.tokens)]
+
+    def _prune(self, now: float):
+        """Forget the clients whose buckets are full again, as new ones would be."""
+        refill_s = max(limit.seconds() for limit in self.limits)
+        self._buckets = {
+            client_id: state
+            for client_id, state in self._buckets.items()
+            if now - state.updated < refill_s
+        }
+
+
+rate_limiter = RateLimiter(
+    (
+        RateLimit(REQUEST_WEIGHT, "MINUTE", 1, WEIGHT_PER_MINUTE),
+        RateLimit(ORDERS, "SECOND", 10, ORDERS_PER_10S),
+    )
+)
+
+
+def charge_orders(client_id: str, orders: int, limiter: RateLimiter = rate_limiter):
+    """
+    Charge a validated request placing `orders` orders for those past the one
+    `RateLimitMiddleware` admitted it with. Raises `RateLimited`.
+    """
+    if orders > 1:
+        limiter.acquire(client_id, 0, orders - 1)
@@ -0,0 +1,75 @@
+import asyncio
+import inspect
+import time
+from typing import Awaitable, Callable, Hashable, Optional, Union
+
+# compute functions return the encoded body and, for time dependent responses,
+# the time (ms) until which it stays valid
+Computed = tuple[str, Optional[int]]
+
+
+class ResponseCache:
+    """
+    Cache of encoded public market-data responses.
+
+    Entries are keyed by (endpoint, params) and tagged with the version of the
+    data they were computed from (see `_Exchange.market_version`). A lookup
+    with the current version is a dict hit; any mutation of the book bumps the
+    version so the next lookup recomputes, there is no explicit invalidation.
+    Keeping a single entry per (endpoint, params) bounds the cache to the
+    number of distinct queries, capped by `max_entries`.
+
+    Identical requests arriving while a response is being computed await the
+    same computation instead of running it again.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self._max_entries = max_entries
+        self._entries: dict[tuple, tuple[Hashable, Optional[int], str]] = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+
+    async def get(
+        self,
+        endpoint: str,
+        params: Hashable,
+        version: Hashable,
+        compute: Callable[[], Union[Computed, Awaitable[Computed]]],
+    ) -> str:
+        key = (endpoint, params)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            valid_until = entry[1]
+            if valid_until is None or int(time.time() * 1000) < valid_until:
+                return entry[2]
+
+        flight_key = (endpoint, params, version)
+        inflight = self._inflight.get(flight_key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight_key] = future
+        try:
+            computed = compute()
+            if inspect.isawaitable(computed):
+                computed = await computed
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters get it, do not warn when there are none
+            raise
+        finally:
+            self._inflight.pop(flight_key, None)
+
+        body, valid_until = computed
+        if key not in self._entries and len(self._entries) >= self._max_entries:
+            # evict the oldest entry (dicts keep insertion order)
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (version, valid_until, body)
+        future.set_result(body)
+        return body
+
+    def clear(self):
+        self._entries.clear()
+
+
+response_cache = ResponseCache()
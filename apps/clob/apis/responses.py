@@ -0,0 +1,25 @@
+import math
+
+from starlette.responses import JSONResponse, Response
+
+from apis.rate_limit import RateLimited, RateLimiter, rate_limiter
+
+
+class RawJSONResponse(Response):
+    """Response whose content is JSON text already encoded by `exchange.encoding`."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return b"null" if content is None else content.encode("utf-8")
+
+
+def rate_limited_response(e: RateLimited, limiter: RateLimiter = rate_limiter) -> JSONResponse:
+    """429 answering a request over a rate limit, with its Retry-After and the usage headers."""
+    response = JSONResponse(
+        status_code=429,
+        content=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after_s)))},
+    )
+    response.raw_headers.extend(limiter.usage_headers(e.used))
+    return response
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends
+from apis.timing import TimedRoute
 from exchange import (
     exchange,
+    async_exchange,
 )
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from decimal import Decimal
+from account import quantize
 from apis.api_key import get_api_key
+from apis.responses import RawJSONResponse
 
 router = APIRouter(
+    route_class=TimedRoute,
     prefix="/account",
     tags=["account"],
     responses={404: {"description": "Not found"}},
@@ -18,11 +23,25 @@ async def account(client_id: str = Depends(get_api_key)):
     return exchange.account(client_id)
 
 
+@router.get("/openOrders")
+async def open_orders(client_id: str = Depends(get_api_key)):
+    """Open orders in every market, reserved amounts and open orders per market."""
+    return RawJSONResponse(await async_exchange.open_orders_overview(client_id))
+
+
 class DepositRequest(BaseModel):
     asset: str
     amount: Decimal
 
+    @field_validator("amount")
+    @classmethod
+    def _to_ledger_precision(cls, value: Decimal) -> Decimal:
+        # the ledger keeps 8 decimals, finer amounts are rounded down
+        return quantize(value)
+
 
 @router.post("/deposit")
 async def deposit(request: DepositRequest, client_id: str = Depends(get_api_key)):
-    return exchange.deposit(client_id, request.asset, request.amount)
+    result = await async_exchange.deposit(client_id, request.asset, request.amount)
+    await exchange.wait_durable()
+    return result
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from enum import Enum
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+from apis.api_key import get_admin_key
+from metrics.profiler import (
+    CallProfiler,
+    ProfileGuard,
+    ProfileUnavailable,
+    StackSampler,
+)
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_admin_key)],
+)
+
+profile_guard = ProfileGuard()
+
+
+class ProfileMode(str, Enum):
+    SAMPLE = "sample"
+    CPROFILE = "cprofile"
+
+
+class ProfileQuery(BaseModel):
+    seconds: float = Query(5.0, description="Profile duration, bounded by the server")
+    mode: ProfileMode = Query(ProfileMode.SAMPLE)
+    intervalMs: float = Query(1.0, description="Sampling interval (sample mode)")
+    text: bool = Query(
+        False, description="pstats printout instead of a pstats dump (cprofile mode)"
+    )
+
+
+@router.post("/profile")
+async def profile(query: ProfileQuery = Depends()):
+    """
+    Profile the event loop thread, which runs the API and the matching engine,
+    for `seconds` while it keeps serving. Returns collapsed stacks (sample mode)
+    or a pstats dump (cprofile mode). One profile at a time, with a cooldown
+    after each: 429 with Retry-After otherwise.
+    """
+
+    try:
+        profile_guard.acquire(query.seconds)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content=str(e))
+    except ProfileUnavailable as e:
+        retry_after = str(int(e.retry_after_s) + 1) if e.retry_after_s else "1"
+        return JSONResponse(
+            status_code=429, content=str(e), headers={"Retry-After": retry_after}
+        )
+
+    try:
+        if query.mode == ProfileMode.SAMPLE:
+            sampler = StackSampler(threading.get_ident(), query.intervalMs / 1000)
+            sampler.start()
+            try:
+                await asyncio.sleep(query.seconds)
+            finally:
+                sampler.stop()
+            return Response(
+                sampler.collapsed(),
+                media_type="text/plain",
+                headers={"X-Profile-Samples": str(sampler.samples)},
+            )
+
+        profiler = CallProfiler()
+        try:
+            profiler.start()
+        except ValueError as e:  # another profiler is active in this thread
+            return JSONResponse(status_code=409, content=str(e))
+        try:
+            await asyncio.sleep(query.seconds)
+        finally:
+            profiler.stop()
+        if query.text:
+            return Response(profiler.text(), media_type="text/plain")
+        return Response(
+            profiler.pstats_dump(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="clob.pstats"'},
+        )
+    finally:
+        profile_guard.release()
@@ -0,0 +1,222 @@
+"""
+The REST API of `app`, served by the stateless workers of `gateway_app`: each
+route validates its request here and calls the standalone engine process (see
+`exchange.ipc`), which runs it and returns the response body. Websocket
+streams are only served by `app`, in the engine process.
+"""
+
+from fastapi import APIRouter, Depends
+from apis.timing import TimedRoute
+from apis.api_key import get_api_key
+from apis.rate_limit import RateLimited, charge_orders
+from apis.responses import RawJSONResponse, rate_limited_response
+from apis.routes.account import DepositRequest
+from apis.routes.market_data import (
+    ExchangeInfoQuery,
+    NewBookRequest,
+    _exchange_info_symbols,
+    _requested_symbols,
+    exchange_info_response,
+)
+from exchange import (
+    NewOrderRequest,
+    BatchOrdersRequest,
+    MassQuoteRequest,
+    CancelOrderRequest,
+    CancelReplaceRequest,
+    MassCancelRequest,
+    AmendOrderRequest,
+    OrderQuery,
+    DepthQuery,
+    BookTickerQuery,
+    CurrentOpenOrdersQuery,
+    TradesQuery,
+    CancelAllRequest,
+    AllOrdersQuery,
+    KlineQuery,
+)
+from exchange.ipc import EngineClient
+from starlette.responses import JSONResponse
+import json
+import time
+
+router = APIRouter(
+    route_class=TimedRoute,
+    prefix="",
+    tags=["gateway"],
+    responses={404: {"description": "Not found"}},
+)
+
+engine = EngineClient()
+
+
+async def _call(name: str, *args):
+    try:
+        return RawJSONResponse(await engine.call(name, *args))
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+# MARKET DATA ##################################################################
+
+
+@router.get("/ping")
+async def ping():
+    return {}
+
+
+@router.get("/time")
+async def get_time():
+    return {"serverTime": int(time.time() * 1000)}
+
+
+@router.post("/new_book")
+async def create_new_spot(request: NewBookRequest):
+    try:
+        await engine.call("new_book", request.symbol)
+        return True
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@router.get("/exchangeInfo")
+async def get_exchange_info(query_params: ExchangeInfoQuery = Depends()):
+    try:
+        symbols = _requested_symbols(query_params)
+        if symbols is None:
+            symbols = json.loads(await engine.call("symbols"))
+        return exchange_info_response(_exchange_info_symbols(symbols))
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@router.get("/depth")
+async def get_depth(query_params: DepthQuery = Depends()):
+    return await _call("get_depth", query_params)
+
+
+@router.get("/ticker/bookTicker")
+async def get_book_ticker(query_params: BookTickerQuery = Depends()):
+    return await _call("book_ticker", query_params)
+
+
+@router.get("/klines")
+async def get_klines(query_params: KlineQuery = Depends()):
+    return await _call("klines", query_params)
+
+
+@router.get("/openOrders")
+async def get_open_orders(
+    query_params: CurrentOpenOrdersQuery = Depends(),
+    client_id: str = Depends(get_api_key),
+):
+    return await _call("all_open_orders", client_id, query_params)
+
+
+@router.get("/myTrades")
+async def get_trades(
+    query_params: TradesQuery = Depends(),
+    client_id: str = Depends(get_api_key),
+):
+    return await _call("get_trades", client_id, query_params)
+
+
+@router.delete("/openOrders")
+async def cancel_all(request: CancelAllRequest, client_id: str = Depends(get_api_key)):
+    return await _call("cancel_all", client_id, request)
+
+
+@router.get("/allOrders")
+async def get_all_orders(
+    query_params: AllOrdersQuery = Depends(), client_id: str = Depends(get_api_key)
+):
+    return await _call("all_orders", client_id, query_params)
+
+
+@router.delete("/reset")
+async def reset():
+    try:
+        await engine.call("reset")
+        return True
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+# TRADING ######################################################################
+
+
+@router.post("/order")
+async def new_order(request: NewOrderRequest, client_id: str = Depends(get_api_key)):
+    return await _call("new_order", client_id, request)
+
+
+@router.get("/order")
+async def get_order(
+    query_params: OrderQuery = Depends(), client_id: str = Depends(get_api_key)
+):
+    return await _call("get_order", client_id, query_params)
+
+
+@router.delete("/order")
+async def cancel(
+    query_params: CancelOrderRequest = Depends(), client_id: str = Depends(get_api_key)
+):
+    return await _call("cancel_order", client_id, query_params)
+
+
+@router.delete("/order/massCancel")
+async def mass_cancel(
+    query_params: MassCancelRequest = Depends(), client_id: str = Depends(get_api_key)
+):
+    return await _call("mass_cancel", client_id, query_params)
+
+
+@router.post("/order/cancelReplace")
+async def cancel_replace(
+    request: CancelReplaceRequest, client_id: str = Depends(get_api_key)
+):
+    return await _call("cancel_replace", client_id, request)
+
+
+@router.put("/order/amend")
+async def amend(request: AmendOrderRequest, client_id: str = Depends(get_api_key)):
+    return await _call("amend_order", client_id, request)
+
+
+@router.post("/order/massQuote")
+async def mass_quote(request: MassQuoteRequest, client_id: str = Depends(get_api_key)):
+    try:
+        charge_orders(client_id, len(request.bids) + len(request.asks))
+    except RateLimited as e:
+        return rate_limited_response(e)
+    return await _call("mass_quote", client_id, request.symbol, request.bids, request.asks)
+
+
+@router.post("/batchOrders")
+async def new_orders(
+    request: BatchOrdersRequest, client_id: str = Depends(get_api_key)
+):
+    try:
+        charge_orders(client_id, len(request.batchOrders))
+    except RateLimited as e:
+        return rate_limited_response(e)
+    return await _call("new_orders", client_id, request.batchOrders)
+
+
+# ACCOUNT ######################################################################
+
+
+@router.get("/account")
+async def account(client_id: str = Depends(get_api_key)):
+    return await _call("account", client_id)
+
+
+@router.get("/account/openOrders")
+async def open_orders(client_id: str = Depends(get_api_key)):
+    """Open orders in every market, reserved amounts and open orders per market."""
+    return await _call("open_orders_overview", client_id)
+
+
+@router.post("/account/deposit")
+async def deposit(request: DepositRequest, client_id: str = Depends(get_api_key)):
+    return await _call("deposit", client_id, request.asset, request.amount)
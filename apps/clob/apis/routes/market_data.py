@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends
+from apis.timing import TimedRoute
 from exchange import (
     exchange,
+    async_exchange,
     DepthQuery,
+    BookTickerQuery,
     CurrentOpenOrdersQuery,
     TradesQuery,
     CancelAllRequest,
@@ -10,12 +13,17 @@ from exchange import (
 )
 from typing import Optional
 from pydantic import BaseModel
+import json
 import time
 from fastapi import Query
 from starlette.responses import JSONResponse
 from apis.api_key import get_api_key
+from apis.rate_limit import rate_limiter
+from apis.responses import RawJSONResponse
+from apis.response_cache import response_cache
 
 router = APIRouter(
+    route_class=TimedRoute,
     prefix="",
     tags=["market-data"],
     responses={404: {"description": "Not found"}},
@@ -29,7 +37,8 @@ class NewBookRequest(BaseModel):
 @router.post("/new_book")
 async def create_new_spot(request: NewBookRequest):
     try:
-        exchange.new_book(request.symbol)
+        await async_exchange.new_book(request.symbol)
+        await exchange.wait_durable()
         return True
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
@@ -56,83 +65,111 @@ class ExchangeInfoQuery(BaseModel):
     symbols: Optional[str] = Query(None, description="List of symbols to query")
 
 
-@router.get("/exchangeInfo")
-async def get_exchange_info(query_params: ExchangeInfoQuery = Depends()):
-    try:
-        if query_params.symbols:
-            # parse this: ["BTCUSDT"] to list
-            symbols = (
-                query_params.symbols.replace("[", "")
-                .replace("]", "")
-                .replace('"', "")
-                .split(",")
-            )
-        elif query_params.symbol:
-            symbols = [query_params.symbol]
-        else:
-            symbols = list(exchange._books.keys())
-
-        server_time = int(time.time() * 1000)
-        return {
-            "timezone": "UTC",
-            "serverTime": server_time,
-            "rateLimits": [],
-            "exchangeFilters": [],
-            "symbols": [
+def _exchange_info_symbols(symbols: list[str]) -> str:
+    """Encoded "symbols" and "sors" members of the exchangeInfo response."""
+    symbols_info = [
+        {
+            "symbol": symbol,
+            "status": "TRADING",
+            "baseAsset": symbol.replace("USDT", ""),
+            "baseAssetPrecision": 8,
+            "quoteAsset": "USDT",
+            "quotePrecision": 8,
+            "quoteAssetPrecision": 8,
+            "baseCommissionPrecision": 8,
+            "quoteCommissionPrecision": 8,
+            "orderTypes": [
+                "LIMIT",
+                "LIMIT_MAKER",
+                "MARKET",
+                "STOP_LOSS",
+                "STOP_LOSS_LIMIT",
+                "TAKE_PROFIT",
+                "TAKE_PROFIT_LIMIT",
+            ],
+            "filters": [
+                {
+                    "filterType": "PRICE_FILTER",
+                    "minPrice": "0.00000100",
+                    "maxPrice": "100000.00000000",
+                    "tickSize": "0.00000100",
+                },
                 {
-                    "symbol": symbol,
-                    "status": "TRADING",
-                    "baseAsset": symbol.replace("USDT", ""),
-                    "baseAssetPrecision": 8,
-                    "quoteAsset": "USDT",
-                    "quotePrecision": 8,
-                    "quoteAssetPrecision": 8,
-                    "baseCommissionPrecision": 8,
-                    "quoteCommissionPrecision": 8,
-                    "orderTypes": [
-                        "LIMIT",
-                        "LIMIT_MAKER",
-                        "MARKET",
-                        "STOP_LOSS",
-                        "STOP_LOSS_LIMIT",
-                        "TAKE_PROFIT",
-                        "TAKE_PROFIT_LIMIT",
-                    ],
-                    "filters": [
-                        {
-                            "filterType": "PRICE_FILTER",
-                            "minPrice": "0.00000100",
-                            "maxPrice": "100000.00000000",
-                            "tickSize": "0.00000100",
-                        },
-                        {
-                            "filterType": "LOT_SIZE",
-                            "minQty": "0.00100000",
-                            "maxQty": "100000.00000000",
-                            "stepSize": "0.00100000",
-                        },
-                        {"filterType": "MIN_NOTIONAL", "minNotional": "0.00100000"},
-                    ],
-                    "icebergAllowed": True,
-                    "ocoAllowed": True,
-                    "otoAllowed": True,
-                    "opoAllowed": True,
-                    "quoteOrderQtyMarketAllowed": True,
-                    "allowTrailingStop": False,
-                    "cancelReplaceAllowed": False,
-                    "amendAllowed": False,
-                    "pegInstructionsAllowed": True,
-                    "isSpotTradingAllowed": True,
-                    "isMarginTradingAllowed": True,
-                    "permissions": [],
-                    "permissionSets": [["SPOT", "MARGIN"]],
-                    "defaultSelfTradePreventionMode": "NONE",
-                    "allowedSelfTradePreventionModes": ["NONE"],
-                }
-                for symbol in symbols
+                    "filterType": "LOT_SIZE",
+                    "minQty": "0.00100000",
+                    "maxQty": "100000.00000000",
+                    "stepSize": "0.00100000",
+                },
+                {"filterType": "MIN_NOTIONAL", "minNotional": "0.00100000"},
             ],
-            "sors": [{"baseAsset": symbol, "symbols": [symbol]} for symbol in symbols],
+            "icebergAllowed": True,
+            "ocoAllowed": True,
+            "otoAllowed": True,
+            "opoAllowed": True,
+            "quoteOrderQtyMarketAllowed": True,
+            "allowTrailingStop": False,
+            "cancelReplaceAllowed": False,
+            "amendAllowed": True,
+            "pegInstructionsAllowed": True,
+            "isSpotTradingAllowed": True,
+            "isMarginTradingAllowed": True,
+            "permissions": [],
+            "permissionSets": [["SPOT", "MARGIN"]],
+            "defaultSelfTradePreventionMode": "NONE",
+            "allowedSelfTradePreventionModes": ["NONE"],
         }
+        for symbol in symbols
+    ]
+    sors = [{"baseAsset": symbol, "symbols": [symbol]} for symbol in symbols]
+    return '"symbols":%s,"sors":%s' % (
+        json.dumps(symbols_info, separators=(",", ":")),
+        json.dumps(sors, separators=(",", ":")),
+    )
+
+
+def _requested_symbols(query_params: ExchangeInfoQuery) -> Optional[list[str]]:
+    """The symbols asked for, None for all."""
+    if query_params.symbols:
+        # parse this: ["BTCUSDT"] to list
+        return (
+            query_params.symbols.replace("[", "")
+            .replace("]", "")
+            .replace('"', "")
+            .split(",")
+        )
+    if query_params.symbol:
+        return [query_params.symbol]
+    return None
+
+
+def exchange_info_response(symbols_info: str) -> RawJSONResponse:
+    """The exchangeInfo response around its encoded per-symbol part, see `_exchange_info_symbols`."""
+    server_time = int(time.time() * 1000)
+    return RawJSONResponse(
+        '{"timezone":"UTC","serverTime":%d,"rateLimits":%s,"exchangeFilters":[],%s}'
+        % (server_time, rate_limiter.rate_limits_json(), symbols_info)
+    )
+
+
+@router.get("/exchangeInfo")
+async def get_exchange_info(query_params: ExchangeInfoQuery = Depends()):
+    try:
+        symbols = _requested_symbols(query_params)
+
+        # the per-symbol part only changes with the listed books, cache it and
+        # only stamp the server time per request
+        symbols_info = await response_cache.get(
+            "exchangeInfo",
+            tuple(symbols) if symbols is not None else None,
+            exchange.books_version(),
+            lambda: (
+                _exchange_info_symbols(
+                    symbols if symbols is not None else exchange.symbols()
+                ),
+                None,
+            ),
+        )
+        return exchange_info_response(symbols_info)
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
@@ -140,7 +177,30 @@ async def get_exchange_info(query_params: ExchangeInfoQuery = Depends()):
 @router.get("/depth")
 async def get_depth(query_params: DepthQuery = Depends()):
     try:
-        return exchange.get_depth(query_params)
+        return RawJSONResponse(
+            await response_cache.get(
+                "depth",
+                (query_params.symbol, query_params.limit),
+                exchange.market_version(query_params.symbol),
+                lambda: (exchange.get_depth(query_params), None),
+            )
+        )
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+def _compute_klines(query_params: KlineQuery):
+    klines = exchange.klines(query_params)
+    # without endTime the series runs up to now: the response stays valid until
+    # the next (empty) window opens at the close time of the last one
+    valid_until = klines[-1][6] if klines and query_params.endTime is None else None
+    return json.dumps(klines, separators=(",", ":")), valid_until
+
+
+@router.get("/ticker/bookTicker")
+async def get_book_ticker(query_params: BookTickerQuery = Depends()):
+    try:
+        return RawJSONResponse(exchange.book_ticker(query_params))
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
@@ -148,7 +208,20 @@ async def get_depth(query_params: DepthQuery = Depends()):
 @router.get("/klines")
 async def get_klines(query_params: KlineQuery = Depends()):
     try:
-        return exchange.klines(query_params)
+        return RawJSONResponse(
+            await response_cache.get(
+                "klines",
+                (
+                    query_params.symbol,
+                    query_params.interval,
+                    query_params.startTime,
+                    query_params.endTime,
+                    query_params.limit,
+                ),
+                exchange.market_version(query_params.symbol),
+                lambda: async_exchange.run(_compute_klines, query_params),
+            )
+        )
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
@@ -159,7 +232,9 @@ async def get_open_orders(
     client_id: str = Depends(get_api_key),
 ):
     try:
-        return exchange.all_open_orders(client_id, query_params)
+        return RawJSONResponse(
+            await async_exchange.all_open_orders(client_id, query_params)
+        )
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
@@ -170,7 +245,9 @@ async def get_trades(
     client_id: str = Depends(get_api_key),
 ):
     try:
-        return exchange.get_trades(client_id, query_params)
+        return RawJSONResponse(
+            await async_exchange.get_trades(client_id, query_params)
+        )
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
@@ -178,7 +255,9 @@ async def get_trades(
 @router.delete("/openOrders")
 async def cancel_all(request: CancelAllRequest, client_id: str = Depends(get_api_key)):
     try:
-        return exchange.cancel_all(client_id, request)
+        result = await async_exchange.cancel_all(client_id, request)
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
@@ -188,7 +267,9 @@ async def get_all_orders(
     query_params: AllOrdersQuery = Depends(), client_id: str = Depends(get_api_key)
 ):
     try:
-        return exchange.all_orders(client_id, query_params)
+        return RawJSONResponse(
+            await async_exchange.all_orders(client_id, query_params)
+        )
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
@@ -196,7 +277,8 @@ async def get_all_orders(
 @router.delete("/reset")
 async def reset():
     try:
-        exchange.reset()
+        await async_exchange.reset()
+        await exchange.wait_durable()
         return True
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from starlette.responses import JSONResponse, Response
+
+from metrics import loop_monitor, registry
+
+router = APIRouter(prefix="", tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics")
+async def metrics():
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/health")
+async def health():
+    """503 when the event loop is lagging, for load balancers to shed load; 200 when it is not monitored."""
+
+    healthy, details = loop_monitor.health()
+    return JSONResponse(status_code=200 if healthy else 503, content=details)
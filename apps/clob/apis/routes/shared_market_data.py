@@ -0,0 +1,126 @@
+"""
+Public market data served from the top-of-book the engine process shares in
+memory (see `exchange.shared_top`), by the read-only workers of
+`market_data_app`. `/depth` returns at most the levels shared per side
+(`FASTLOB_TOP_LEVELS`).
+"""
+
+from fastapi import APIRouter, Depends
+from apis.timing import TimedRoute
+from apis.responses import RawJSONResponse
+from apis.response_cache import response_cache
+from apis.routes.market_data import (
+    ExchangeInfoQuery,
+    _exchange_info_symbols,
+    _requested_symbols,
+    exchange_info_response,
+)
+from exchange import DepthQuery, BookTickerQuery
+from exchange.encoding import book_ticker_json, depth_json, json_list
+from exchange.shared_top import SHM_NAME, SharedTopReader
+from starlette.responses import JSONResponse
+from typing import Optional
+import time
+
+router = APIRouter(
+    route_class=TimedRoute,
+    prefix="",
+    tags=["market-data"],
+    responses={404: {"description": "Not found"}},
+)
+
+_reader: Optional[SharedTopReader] = None
+
+
+def reader() -> SharedTopReader:
+    """The reader of the region, attached on first use: the engine may start after the workers."""
+    global _reader
+    if _reader is None:
+        if not SHM_NAME:
+            raise ValueError("CLOB_SHM_NAME is not set")
+        _reader = SharedTopReader(SHM_NAME)
+    return _reader
+
+
+def close_reader():
+    global _reader
+    if _reader is not None:
+        _reader.close()
+        _reader = None
+
+
+def _read(symbol: str):
+    shared = reader().read(symbol)
+    if shared is None:
+        raise KeyError(symbol)
+    return shared
+
+
+@router.get("/ping")
+async def ping():
+    try:
+        return {}
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@router.get("/time")
+async def get_time():
+    try:
+        return {"serverTime": int(time.time() * 1000)}
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@router.get("/exchangeInfo")
+async def get_exchange_info(query_params: ExchangeInfoQuery = Depends()):
+    try:
+        symbols = _requested_symbols(query_params)
+        shared = reader()
+        symbols_info = await response_cache.get(
+            "exchangeInfo",
+            tuple(symbols) if symbols is not None else None,
+            shared.version(),
+            lambda: (
+                _exchange_info_symbols(
+                    symbols if symbols is not None else shared.symbols()
+                ),
+                None,
+            ),
+        )
+        return exchange_info_response(symbols_info)
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@router.get("/depth")
+async def get_depth(query_params: DepthQuery = Depends()):
+    try:
+        top, update_id = _read(query_params.symbol)
+        top = top.head(query_params.limit)
+        return RawJSONResponse(
+            depth_json(
+                last_update_id=update_id,
+                bids=[(price, qty) for price, qty, _ in top.bids],
+                asks=[(price, qty) for price, qty, _ in top.asks],
+            )
+        )
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@router.get("/ticker/bookTicker")
+async def get_book_ticker(query_params: BookTickerQuery = Depends()):
+    try:
+        if query_params.symbol is not None:
+            top, _ = _read(query_params.symbol)
+            return RawJSONResponse(book_ticker_json(query_params.symbol, top))
+        shared = reader()
+        tickers = []
+        for symbol in shared.symbols():
+            read = shared.read(symbol)
+            if read is not None:
+                tickers.append(book_ticker_json(symbol, read[0]))
+        return RawJSONResponse(json_list(tickers))
+    except Exception as e:
+        return JSONResponse(status_code=400, content=str(e))
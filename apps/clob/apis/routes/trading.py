@@ -1,51 +1,91 @@
 from fastapi import APIRouter, Depends
+from apis.timing import TimedRoute
 from exchange import (
     exchange,
+    async_exchange,
     NewOrderRequest,
+    BatchOrdersRequest,
+    MassQuoteRequest,
     CancelOrderRequest,
     CancelReplaceRequest,
+    MassCancelRequest,
+    AmendOrderRequest,
     OrderQuery,
 )
 from starlette.responses import JSONResponse
 from apis.api_key import get_api_key
+from apis.rate_limit import RateLimited, charge_orders
+from apis.responses import RawJSONResponse, rate_limited_response
+import logging
+
+logger = logging.getLogger("app.trading")
 
 router = APIRouter(
+    route_class=TimedRoute,
     prefix="/order",
     tags=["trading"],
     responses={404: {"description": "Not found"}},
 )
 
+# routes outside of /order
+batch_router = APIRouter(
+    route_class=TimedRoute,
+    prefix="",
+    tags=["trading"],
+)
+
 
 @router.post("")
 async def new_order(request: NewOrderRequest, client_id: str = Depends(get_api_key)):
     try:
         print("Post payload: ")
         print(request.model_dump_json(indent=2))
-        return exchange.new_order(client_id, request)
+        result = await async_exchange.new_order(client_id, request)
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
     except Exception as e:
         print(f"POST Error {str(e)}")
         return JSONResponse(status_code=400, content=str(e))
 
 
 @router.get("")
-async def get_order(query_params: OrderQuery = Depends()):
+async def get_order(
+    query_params: OrderQuery = Depends(), client_id: str = Depends(get_api_key)
+):
     try:
-        return exchange.get_order(query_params)
+        return RawJSONResponse(await async_exchange.get_order(client_id, query_params))
     except Exception as e:
         return JSONResponse(status_code=400, content=str(e))
 
 
 @router.delete("")
-async def cancel(query_params: CancelOrderRequest = Depends()):
+async def cancel(
+    query_params: CancelOrderRequest = Depends(), client_id: str = Depends(get_api_key)
+):
     try:
         print("Cancel payload: ")
         print(query_params.model_dump_json(indent=2))
-        return exchange.cancel_order(query_params)
+        result = await async_exchange.cancel_order(client_id, query_params)
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
     except Exception as e:
         print(f"Del Error {str(e)}")
         return JSONResponse(status_code=400, content=str(e))
 
 
+@router.delete("/massCancel")
+async def mass_cancel(
+    query_params: MassCancelRequest = Depends(), client_id: str = Depends(get_api_key)
+):
+    try:
+        result = await async_exchange.mass_cancel(client_id, query_params)
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
+    except Exception as e:
+        logger.debug("Mass cancel error: %s", e)
+        return JSONResponse(status_code=400, content=str(e))
+
+
 @router.post("/cancelReplace")
 async def cancel_replace(
     request: CancelReplaceRequest, client_id: str = Depends(get_api_key)
@@ -53,7 +93,54 @@ async def cancel_replace(
     try:
         print("Cancel request payload:")
         print(request.model_dump_json(indent=2))
-        return exchange.cancel_replace(client_id, request)
+        result = await async_exchange.cancel_replace(client_id, request)
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
     except Exception as e:
         print(f"CR Error {str(e)}")
         return JSONResponse(status_code=400, content=str(e))
+
+
+@router.put("/amend")
+async def amend(request: AmendOrderRequest, client_id: str = Depends(get_api_key)):
+    try:
+        result = await async_exchange.amend_order(client_id, request)
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
+    except Exception as e:
+        logger.debug("Amend error: %s", e)
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@router.post("/massQuote")
+async def mass_quote(request: MassQuoteRequest, client_id: str = Depends(get_api_key)):
+    try:
+        charge_orders(client_id, len(request.bids) + len(request.asks))
+    except RateLimited as e:
+        return rate_limited_response(e)
+    try:
+        result = await async_exchange.mass_quote(
+            client_id, request.symbol, request.bids, request.asks
+        )
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
+    except Exception as e:
+        logger.debug("Mass quote error: %s", e)
+        return JSONResponse(status_code=400, content=str(e))
+
+
+@batch_router.post("/batchOrders")
+async def new_orders(
+    request: BatchOrdersRequest, client_id: str = Depends(get_api_key)
+):
+    try:
+        charge_orders(client_id, len(request.batchOrders))
+    except RateLimited as e:
+        return rate_limited_response(e)
+    try:
+        result = await async_exchange.new_orders(client_id, request.batchOrders)
+        await exchange.wait_durable()
+        return RawJSONResponse(result)
+    except Exception as e:
+        logger.debug("Batch orders error: %s", e)
+        return JSONResponse(status_code=400, content=str(e))
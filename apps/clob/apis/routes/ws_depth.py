@@ -7,6 +7,8 @@ import re
 import time
 import logging
 from exchange import (exchange, DepthQuery)
+from exchange.fanout import STREAM_DEPTH, SubscriberQueue
+from apis.response_cache import response_cache
 
 
 logger = logging.getLogger("app.ws_depth")
@@ -16,6 +18,9 @@ router = APIRouter(prefix="", tags=["market-data-ws"])
 # parse "SYMBOL@depth" or "SYMBOL@depthN"
 DEPTH_RE = re.compile(r"^([A-Za-z0-9]{1,20})@depth(?:([0-9]+))?$")
 
+# diffs waiting to be sent to one subscriber; past that they are dropped for it (and counted)
+DEPTH_QUEUE_SIZE = 1024
+
 
 class Subscription:
     def __init__(self, symbol: str, levels: Optional[int]):
@@ -55,35 +60,44 @@ async def depth_ws_pubsub(ws: WebSocket):
     # Helper event to cancel all forwarders on disconnect
     connection_closed = asyncio.Event()
 
-    async def forward_from_queue_loop(sub: Subscription, q: asyncio.Queue):
+    async def forward_from_queue_loop(sub: Subscription, q: SubscriberQueue):
         """Forward incoming diffs from queue to websocket until unsubscribed or connection_closed."""
         try:
             while not connection_closed.is_set():
                 try:
-                    diff = await asyncio.wait_for(q.get(), timeout=1.0)
-                    print(diff)
+                    diff = await asyncio.wait_for(q.get_event(), timeout=1.0)
                 except asyncio.TimeoutError:
                     continue
                 try:
-                    await _send_json_safe(ws, diff)
+                    # diffs are encoded once by the exchange for all listeners
+                    await ws.send_text(diff)
+                    q.delivered()
                 except Exception:
                     break
         except asyncio.CancelledError:
             pass
 
+    async def get_snapshot(sub: Subscription) -> str:
+        """Depth snapshot for `sub`, shared through the cache with /depth and other pollers."""
+        query = DepthQuery(symbol=sub.symbol, limit=sub.levels)
+        return await response_cache.get(
+            "depth",
+            (query.symbol, query.limit),
+            exchange.market_version(query.symbol),
+            lambda: (exchange.get_depth(query), None),
+        )
+
     async def snapshot_poller_loop(sub: Subscription, poll_interval: float = 1.0, req_id: Optional[int] = None):
         """
-        Poll exchange.get_depth every poll_interval seconds and forward snapshots.
+        Poll the depth snapshot every poll_interval seconds and forward it.
         Sends an initial snapshot immediately (if available) before polling.
         """
-        symbol = sub.symbol
-        levels = sub.levels
         try:
             # send initial snapshot
             try:
-                snapshot = exchange.get_depth(DepthQuery(symbol=symbol, limit=levels))
+                snapshot = await get_snapshot(sub)
                 if snapshot is not None:
-                    await _send_json_safe(ws, snapshot.model_dump())
+                    await ws.send_text(snapshot)
             except Exception as e:
                 # don't abort: notify and continue polling
                 await _send_json_safe(ws, {"error": f"snapshot_error_initial: {str(e)}", "id": req_id})
@@ -92,9 +106,9 @@ async def depth_ws_pubsub(ws: WebSocket):
             while not connection_closed.is_set():
                 await asyncio.sleep(poll_interval)
                 try:
-                    snapshot = exchange.get_depth(DepthQuery(symbol=symbol, limit=levels))
+                    snapshot = await get_snapshot(sub)
                     if snapshot is not None:
-                        await _send_json_safe(ws, snapshot.model_dump())
+                        await ws.send_text(snapshot)
                 except Exception as e:
                     # send error but keep polling — transient internal errors should not kill the loop
                     try:
@@ -118,7 +132,7 @@ async def depth_ws_pubsub(ws: WebSocket):
             return
 
         # Otherwise -> diff mode: create queue and register with exchange
-        q: asyncio.Queue = asyncio.Queue()
+        q = SubscriberQueue(STREAM_DEPTH, sub.symbol, maxsize=DEPTH_QUEUE_SIZE)
         try:
             exchange.register_diff_listener(sub.symbol, q)
         except Exception as e:
@@ -0,0 +1,408 @@
+# ws_trading.py
+"""
+Websocket order entry, in the style of Binance's WebSocket API.
+
+One connection carries many pipelined requests: a client sends requests
+without waiting for their responses, each tagged with an `id` echoed in its
+response. Requests run in the order they are received and their responses
+are sent in the same order, once the commands are durable (journal group
+commit, see `exchange.wait_durable`).
+
+Methods: `session.logon` (params `apiKey`, unless the handshake carried an
+X-API-Key header), `session.status`, `session.logout`, `ping`, and the
+authenticated `order.place`, `order.cancel`, `order.cancelReplace`, whose
+params are those of POST /order, DELETE /order and POST /order/cancelReplace.
+These count against the client's rate limits, shared with the REST API (see
+`apis.rate_limit`), and are answered with status 429 past them.
+
+Encodings, chosen with the `encoding` query parameter:
+
+- `json` (default): text frames,
+  `{"id": 1, "method": "order.place", "params": {...}}` answered by
+  `{"id": 1, "status": 200, "result": {...}}` or
+  `{"id": 1, "status": 400, "error": {"code": -2010, "msg": "..."}}`.
+- `msgpack`: the same maps as binary msgpack frames (needs the msgpack package).
+- `struct`: fixed little-endian binary frames, see `_StructCodec`.
+"""
+
+import asyncio
+import json
+import logging
+import struct
+import time
+from decimal import Decimal
+from typing import Any, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from apis.api_key import API_KEY_NAME
+from apis.rate_limit import WS_COSTS, RateLimited, rate_limiter
+from exchange import (
+    exchange,
+    async_exchange,
+    NewOrderRequest,
+    CancelOrderRequest,
+    CancelReplaceRequest,
+)
+from metrics import request_latency
+
+try:
+    import msgpack
+except ImportError:  # optional, only for encoding=msgpack
+    msgpack = None
+
+logger = logging.getLogger("app.ws_trading")
+
+router = APIRouter(prefix="", tags=["trading-ws"])
+
+# responses waiting to be sent; a client pipelining faster than that stops being read
+OUTBOX_SIZE = 1024
+
+# Binance error codes
+UNKNOWN = -1000
+UNAUTHORIZED = -1002
+UNSUPPORTED_OPERATION = -1020
+ILLEGAL_PARAMS = -1100
+BAD_SYMBOL = -1121
+NEW_ORDER_REJECTED = -2010
+UNKNOWN_ORDER = -2011
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, code: int, msg: str, id: Any = None):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.msg = msg
+        # correlation id, when the error is raised before the request is decoded
+        self.id = id
+
+
+class _JsonCodec:
+    binary = False
+
+    def decode(self, frame) -> tuple[Any, str, dict]:
+        """(id, method, params) of a request frame."""
+        if not isinstance(frame, str):
+            raise RequestError(400, ILLEGAL_PARAMS, "expected a text frame")
+        try:
+            msg = json.loads(frame)
+        except json.JSONDecodeError:
+            raise RequestError(400, ILLEGAL_PARAMS, "invalid JSON")
+        if not isinstance(msg, dict):
+            raise RequestError(400, ILLEGAL_PARAMS, "expected an object")
+        return msg.get("id"), str(msg.get("method", "")), msg.get("params") or {}
+
+    def result(self, id: Any, result: str):
+        """Response carrying `result`, already encoded as JSON by the exchange."""
+        return '{"id":%s,"status":200,"result":%s}' % (json.dumps(id), result)
+
+    def error(self, id: Any, status: int, code: int, msg: str):
+        return json.dumps(
+            {"id": id, "status": status, "error": {"code": code, "msg": msg}}
+        )
+
+
+class _MsgpackCodec:
+    binary = True
+
+    def decode(self, frame) -> tuple[Any, str, dict]:
+        if not isinstance(frame, bytes):
+            raise RequestError(400, ILLEGAL_PARAMS, "expected a binary frame")
+        try:
+            msg = msgpack.unpackb(frame)
+        except Exception:
+            raise RequestError(400, ILLEGAL_PARAMS, "invalid msgpack")
+        if not isinstance(msg, dict):
+            raise RequestError(400, ILLEGAL_PARAMS, "expected a map")
+        return msg.get("id"), str(msg.get("method", "")), msg.get("params") or {}
+
+    def result(self, id: Any, result: str):
+        return msgpack.packb({"id": id, "status": 200, "result": json.loads(result)})
+
+    def error(self, id: Any, status: int, code: int, msg: str):
+        return msgpack.packb(
+            {"id": id, "status": status, "error": {"code": code, "msg": msg}}
+        )
+
+
+def _text(raw: bytes) -> Optional[str]:
+    text = raw.rstrip(b"\0").decode("ascii")
+    return text or None
+
+
+def _fixed(raw: int) -> Optional[Decimal]:
+    # amounts are sent as integers of 1e-8, the precision of the ledger
+    return Decimal(raw).scaleb(-8) if raw else None
+
+
+class _StructCodec:
+    """
+    Requests: a `<BI` header (method code, correlation id) followed by the
+    fixed layout of the method; symbols and client order ids are NUL-padded
+    ASCII, sides 0 BUY / 1 SELL, types 0 LIMIT_MAKER / 1 MARKET, prices and
+    quantities integers of 1e-8, 0 for none:
+
+    - 1 order.place: symbol 16s, side B, type B, price q, quantity q,
+      newClientOrderId 36s
+    - 2 order.cancel: symbol 16s, orderId q, origClientOrderId 36s
+    - 3 order.cancelReplace: symbol 16s, side B, type B, price q, quantity q,
+      cancelOrderId q, newClientOrderId 36s, cancelOrigClientOrderId 36s
+    - 4 session.logon: the API key, UTF-8, up to the end of the frame
+    - 5 ping: nothing
+
+    Responses: a `<IH` header (correlation id, status) followed by the UTF-8
+    JSON of the result, or of the error. Results are encoded once as JSON by
+    the exchange, the binary framing saves the request parsing and validation.
+    """
+
+    binary = True
+
+    HEADER = struct.Struct("<BI")
+    RESPONSE = struct.Struct("<IH")
+    PLACE = struct.Struct("<16sBBqq36s")
+    CANCEL = struct.Struct("<16sq36s")
+    CANCEL_REPLACE = struct.Struct("<16sBBqqq36s36s")
+
+    METHODS = {
+        1: "order.place",
+        2: "order.cancel",
+        3: "order.cancelReplace",
+        4: "session.logon",
+        5: "ping",
+    }
+    SIDES = ("BUY", "SELL")
+    TYPES = ("LIMIT_MAKER", "MARKET")
+
+    def decode(self, frame) -> tuple[Any, str, dict]:
+        if not isinstance(frame, bytes) or len(frame) < self.HEADER.size:
+            raise RequestError(400, ILLEGAL_PARAMS, "expected a binary request")
+        code, id = self.HEADER.unpack_from(frame)
+        method = self.METHODS.get(code, f"code {code}")
+        body = frame[self.HEADER.size:]
+        try:
+            if method == "order.place":
+                symbol, side, type, price, quantity, client_order_id = self.PLACE.unpack(body)
+                params = {
+                    "symbol": _text(symbol),
+                    "side": self.SIDES[side],
+                    "type": self.TYPES[type],
+                    "price": _fixed(price),
+                    "quantity": _fixed(quantity),
+                    "newClientOrderId": _text(client_order_id),
+                }
+            elif method == "order.cancel":
+                symbol, order_id, client_order_id = self.CANCEL.unpack(body)
+                params = {
+                    "symbol": _text(symbol),
+                    "orderId": order_id or None,
+                    "origClientOrderId": _text(client_order_id),
+                }
+            elif method == "order.cancelReplace":
+                (
+                    symbol,
+                    side,
+                    type,
+                    price,
+                    quantity,
+                    cancel_order_id,
+                    client_order_id,
+                    cancel_client_order_id,
+                ) = self.CANCEL_REPLACE.unpack(body)
+                params = {
+                    "symbol": _text(symbol),
+                    "side": self.SIDES[side],
+                    "type": self.TYPES[type],
+                    "price": _fixed(price),
+                    "quantity": _fixed(quantity),
+                    "cancelOrderId": cancel_order_id or None,
+                    "newClientOrderId": _text(client_order_id),
+                    "cancelOrigClientOrderId": _text(cancel_client_order_id),
+                }
+            elif method == "session.logon":
+                params = {"apiKey": body.decode("utf-8")}
+            else:
+                params = {}
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise RequestError(400, ILLEGAL_PARAMS, f"malformed {method}: {e}", id)
+        return id, method, params
+
+    def result(self, id: Any, result: str):
+        return self.RESPONSE.pack(id, 200) + result.encode("utf-8")
+
+    def error(self, id: Any, status: int, code: int, msg: str):
+        body = json.dumps({"code": code, "msg": msg}).encode("utf-8")
+        return self.RESPONSE.pack(id or 0, status) + body
+
+
+CODECS = {"json": _JsonCodec, "msgpack": _MsgpackCodec, "struct": _StructCodec}
+
+
+class _Session:
+    """Authentication state of one connection."""
+
+    def __init__(self, client_id: Optional[str]):
+        self.client_id = client_id
+        self.connected_at = int(time.time() * 1000)
+
+    def require(self, params: dict) -> str:
+        """Client of an authenticated request: the session's, or the request's apiKey."""
+        client_id = params.pop("apiKey", None) or self.client_id
+        if not client_id:
+            raise RequestError(401, UNAUTHORIZED, "not logged on, send session.logon")
+        return client_id
+
+    def status(self) -> str:
+        return json.dumps(
+            {
+                "apiKey": self.client_id,
+                "authorizedSince": self.connected_at if self.client_id else None,
+                "serverTime": int(time.time() * 1000),
+            }
+        )
+
+
+def _validated(model, params: dict):
+    try:
+        return model.model_validate(params)
+    except ValidationError as e:
+        raise RequestError(400, ILLEGAL_PARAMS, str(e))
+
+
+def _check_symbol(symbol: str):
+    try:
+        exchange.market_version(symbol)
+    except KeyError:
+        raise RequestError(400, BAD_SYMBOL, "Invalid symbol.")
+
+
+def _cancel(cancel, request) -> str:
+    _check_symbol(request.symbol)
+    try:
+        result = cancel(request)
+    except KeyError:  # unknown order id
+        result = None
+    if result is None:
+        raise RequestError(400, UNKNOWN_ORDER, "Unknown order sent.")
+    return result
+
+
+def _admit(client_id: str, method: str):
+    """Take the cost of an order request from the rate limits of `client_id`, before its params are validated."""
+    try:
+        rate_limiter.acquire(client_id, *WS_COSTS[method])
+    except RateLimited as e:
+        raise RequestError(429, e.code, str(e))
+
+
+async def _execute(session: _Session, method: str, params: dict) -> str:
+    """JSON result of one request, raises RequestError."""
+    if not isinstance(params, dict):
+        raise RequestError(400, ILLEGAL_PARAMS, "params must be an object")
+
+    if method == "order.place":
+        client_id = session.require(params)
+        _admit(client_id, method)
+        request = _validated(NewOrderRequest, params)
+        _check_symbol(request.symbol)
+        return await async_exchange.new_order(client_id, request)
+    if method == "order.cancel":
+        client_id = session.require(params)
+        _admit(client_id, method)
+        request = _validated(CancelOrderRequest, params)
+        return await async_exchange.run(
+            _cancel, lambda request: exchange.cancel_order(client_id, request), request
+        )
+    if method == "order.cancelReplace":
+        client_id = session.require(params)
+        _admit(client_id, method)
+        request = _validated(CancelReplaceRequest, params)
+        return await async_exchange.run(
+            _cancel, lambda request: exchange.cancel_replace(client_id, request), request
+        )
+    if method == "session.logon":
+        api_key = params.get("apiKey")
+        if not api_key:
+            raise RequestError(400, ILLEGAL_PARAMS, "apiKey is required in params")
+        session.client_id = api_key
+        session.connected_at = int(time.time() * 1000)
+        return session.status()
+    if method == "session.status":
+        return session.status()
+    if method == "session.logout":
+        session.client_id = None
+        return session.status()
+    if method == "ping":
+        return "{}"
+    raise RequestError(400, UNSUPPORTED_OPERATION, f"unknown method {method!r}")
+
+
+@router.websocket("/ws-api")
+async def trading_ws(ws: WebSocket, encoding: str = "json"):
+    codec_class = CODECS.get(encoding)
+    if codec_class is None or (codec_class is _MsgpackCodec and msgpack is None):
+        # 1003: unsupported data
+        await ws.close(code=1003, reason=f"unsupported encoding {encoding}")
+        return
+    codec = codec_class()
+    await ws.accept()
+
+    session = _Session(ws.headers.get(API_KEY_NAME))
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=OUTBOX_SIZE)
+
+    async def sender():
+        """Send responses in order, once the commands they answer are durable."""
+        send = ws.send_bytes if codec.binary else ws.send_text
+        while True:
+            batch = [await outbox.get()]
+            while not outbox.empty():
+                batch.append(outbox.get_nowait())
+            await exchange.wait_durable()
+            for response in batch:
+                await send(response)
+                outbox.task_done()
+
+    sending = asyncio.create_task(sender())
+    try:
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            frame = message.get("text")
+            if frame is None:
+                frame = message.get("bytes")
+            t0 = time.perf_counter_ns()
+            id = None
+            method = ""
+            try:
+                id, method, params = codec.decode(frame)
+                response = codec.result(id, await _execute(session, method, params))
+            except RequestError as e:
+                if e.id is not None:
+                    id = e.id
+                response = codec.error(id, e.status, e.code, e.msg)
+            except Exception as e:
+                if type(e) is Exception or isinstance(e, ValueError):
+                    # the exchange rejects orders with a plain Exception, the book and ledger with ValueError
+                    response = codec.error(id, 400, NEW_ORDER_REJECTED, str(e))
+                else:
+                    logger.exception("WS API error in %s", method)
+                    response = codec.error(
+                        id, 500, UNKNOWN, "An unknown error occurred while processing the request."
+                    )
+            # the method is client input, only known ones get their own series
+            request_latency.observe(
+                time.perf_counter_ns() - t0, "WS", method if method in WS_COSTS else "other"
+            )
+            await outbox.put(response)
+            if sending.done():
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # responses already queued are sent before closing, if the client is still there
+        drained = asyncio.create_task(outbox.join())
+        await asyncio.wait((drained, sending), return_when=asyncio.FIRST_COMPLETED)
+        drained.cancel()
+        sending.cancel()
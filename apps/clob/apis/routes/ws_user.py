@@ -1,7 +1,6 @@
 # ws_user.py
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from typing import Dict, Optional, Any, Tuple
-from decimal import Decimal
 import asyncio
 import json
 import time
@@ -9,6 +8,7 @@ import logging
 
 # import exchange (must implement register_user_listener / unregister_user_listener)
 from exchange import exchange
+from exchange.fanout import STREAM_USER, SubscriberQueue
 
 router = APIRouter(prefix="", tags=["user-data-ws"])
 
@@ -16,18 +16,9 @@ logger = logging.getLogger("app.ws_user")
 logger.addHandler(logging.NullHandler())
 
 
-class DecimalEncoder(json.JSONEncoder):
-    """Custom JSON encoder that converts Decimal to string."""
-
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return str(obj)
-        return super().default(obj)
-
-
 async def _send_json_safe(ws: WebSocket, obj: Any) -> None:
     """Send JSON to websocket; raise to trigger cleanup if connection gone."""
-    await ws.send_text(json.dumps(obj, cls=DecimalEncoder))
+    await ws.send_text(json.dumps(obj))
 
 
 @router.websocket("/ws-user")
@@ -66,22 +57,24 @@ async def user_ws(ws: WebSocket):
     # event to notify forwarders to exit
     connection_closed = asyncio.Event()
 
-    async def forwarder_loop(client_sub_key: str, sub_id: int, q: asyncio.Queue):
+    async def forwarder_loop(client_sub_key: str, sub_id: int, q: SubscriberQueue):
         """Forward events from exchange queue to the websocket."""
         try:
             while not connection_closed.is_set():
                 try:
-                    event = await asyncio.wait_for(q.get(), timeout=1)
+                    event = await asyncio.wait_for(q.get_event(), timeout=1)
                 except asyncio.TimeoutError:
                     continue
-                payload = {"subscriptionId": sub_id, "event": event}
                 try:
-                    await _send_json_safe(ws, payload)
+                    # events are encoded by the exchange, only wrap them here
+                    await ws.send_text(
+                        '{"subscriptionId":%d,"event":%s}' % (sub_id, event)
+                    )
+                    q.delivered()
                     logger.debug(
-                        "Sent user event to client_sub_key=%s sub_id=%s type=%s",
+                        "Sent user event to client_sub_key=%s sub_id=%s",
                         client_sub_key,
                         sub_id,
-                        (event.get("e") if isinstance(event, dict) else None),
                     )
                 except Exception:
                     logger.exception(
@@ -146,7 +139,7 @@ async def user_ws(ws: WebSocket):
                     continue
 
                 # create queue and register with exchange (you must implement register_user_listener)
-                q: asyncio.Queue = asyncio.Queue(maxsize=512)
+                q = SubscriberQueue(STREAM_USER, maxsize=512)
                 try:
                     exchange.register_user_listener(api_key, q)
                     print("Registered user listener for api_key=", api_key)
@@ -0,0 +1,81 @@
+"""
+Per-route request timing.
+
+`middleware.RequestTimingMiddleware` starts a `RequestTiming` for every HTTP
+request; routes built with `TimedRoute` mark when their function starts and
+returns. That splits a request in three stages: parse (body read and
+validation, up to the route function), handler (the route function) and
+response (encoding and sending).
+"""
+
+import asyncio
+import functools
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+
+from metrics import loop_monitor, request_latency, request_stage_latency
+
+
+class RequestTiming:
+    __slots__ = ("start", "handler_start", "handler_end", "route")
+
+    def __init__(self):
+        self.start = time.perf_counter_ns()
+        self.handler_start = 0
+        self.handler_end = 0
+        self.route: Optional[str] = None
+
+    def finish(self, method: str):
+        """Record the request, once its response is sent."""
+
+        end = time.perf_counter_ns()
+        # unmatched paths share one label, to keep the number of series bounded
+        route = self.route or "unmatched"
+        request_latency.observe(end - self.start, method, route)
+        if self.handler_start:
+            request_stage_latency.observe(
+                self.handler_start - self.start, method, route, "parse"
+            )
+            request_stage_latency.observe(
+                self.handler_end - self.handler_start, method, route, "handler"
+            )
+            request_stage_latency.observe(
+                end - self.handler_end, method, route, "response"
+            )
+
+
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar(
+    "current_timing", default=None
+)
+
+
+def _timed(call, route: str):
+    @functools.wraps(call)
+    async def timed(*args, **kwargs):
+        timing = current_timing.get()
+        if timing is None:
+            return await call(*args, **kwargs)
+        timing.route = route
+        timing.handler_start = time.perf_counter_ns()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            timing.handler_end = time.perf_counter_ns()
+
+    # event loop stalls in a handler are reported with its route
+    loop_monitor.label_frames(timed.__code__, "route")
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """APIRoute marking the start and end of its (async) route function, see module docstring."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        # the request handler calls `dependant.call` once the request is parsed;
+        # routers included with a prefix build new routes from the bare endpoint
+        if asyncio.iscoroutinefunction(self.dependant.call):
+            self.dependant.call = _timed(self.dependant.call, self.path)
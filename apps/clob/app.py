@@ -1,10 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.routing import APIRouter
-from apis.routes import trading, account, market_data, ws_depth, ws_user
-from middleware import BodyAutoDetectMiddleware
+from apis.routes import (
+    trading,
+    account,
+    market_data,
+    metrics,
+    admin,
+    ws_depth,
+    ws_user,
+    ws_trading,
+)
+from exchange.service import start_exchange, stop_exchange
+from metrics import loop_monitor
+from middleware import (
+    BodyNormalizeMiddleware,
+    RateLimitMiddleware,
+    RequestTimingMiddleware,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    start_exchange()
+    yield
+    stop_exchange()
+    loop_monitor.stop()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Test Environment",
     description="API for testing orderbook",
     version="1.0.0",
@@ -22,14 +49,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.add_middleware(BodyAutoDetectMiddleware)
+app.add_middleware(BodyNormalizeMiddleware)
+# before the body is read, see `apis.rate_limit`
+app.add_middleware(RateLimitMiddleware)
+# outermost, so the timings include the other middlewares
+app.add_middleware(RequestTimingMiddleware)
 
 router = APIRouter()
 router.include_router(trading.router)
+router.include_router(trading.batch_router)
 router.include_router(account.router)
 router.include_router(market_data.router)
 router.include_router(ws_depth.router)
 router.include_router(ws_user.router)
+router.include_router(ws_trading.router)
+router.include_router(metrics.router)
+router.include_router(admin.router)
 app.include_router(router)
 
 
@@ -0,0 +1,237 @@
+"""
+Microbenchmarks of the engine hot paths.
+
+A benchmark is a function registered with `@benchmark`, called once per
+combination of its parameters with a `Context` and those parameters. It sets
+up its state and returns the operation to measure, either as a callable or as
+a `(setup, operation)` pair when the operation changes the state it relies on:
+`setup` then runs, untimed, before every timed call of `operation`.
+
+Each operation call is timed on its own into a `metrics.Histogram`. Results
+are written as JSON and can be compared with a stored baseline, see
+`compare`. Run them with `python -m benchmarks` from `apps/clob`.
+"""
+
+import asyncio
+import contextlib
+import gc
+import itertools
+import logging
+import os
+import platform
+import time
+from typing import Callable, Iterable, Optional
+
+from account import reset_accounts
+from exchange import exchange as default_exchange, _Exchange
+from fastlob import Orderbook
+from metrics import Histogram
+
+DEFAULT_RUNS = 2000
+
+# regression threshold of `compare`, relative to the baseline median
+DEFAULT_THRESHOLD = 0.25
+
+class Benchmark:
+    name: str
+    function: Callable
+    params: dict[str, tuple]
+    runs: int
+
+    def __init__(self, name: str, function: Callable, params: dict, runs: int):
+        self.name = name
+        self.function = function
+        self.params = params
+        self.runs = runs
+
+    def cases(self) -> Iterable[tuple[str, dict]]:
+        """(case name, parameters) of every parameter combination."""
+
+        keys = list(self.params)
+        for values in itertools.product(*(self.params[k] for k in keys)):
+            kwargs = dict(zip(keys, values))
+            suffix = ",".join(f"{k}={v}" for k, v in kwargs.items())
+            yield (f"{self.name}[{suffix}]" if suffix else self.name), kwargs
+
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(runs: int = DEFAULT_RUNS, **params: Iterable):
+    """Register a benchmark, run for each combination of the values in `params`."""
+
+    def decorator(function):
+        name = function.__name__
+        BENCHMARKS[name] = Benchmark(
+            name, function, {k: tuple(v) for k, v in params.items()}, runs
+        )
+        return function
+
+    return decorator
+
+
+class Context:
+    """Resources of one benchmark case, released after it ran."""
+
+    _books: list[Orderbook]
+    _exchange: Optional[_Exchange]
+    _queues: list[asyncio.Queue]
+    _on_close: list[Callable[[], None]]
+
+    def __init__(self):
+        self._books = []
+        self._exchange = None
+        self._queues = []
+        self._on_close = []
+
+    def book(self, symbol: str = "BTCUSDT", expiry_thread: bool = True) -> Orderbook:
+        """
+        A fresh running book, with empty balances. Without `expiry_thread`,
+        expired GTD orders are only cancelled when the benchmark asks to.
+        """
+
+        reset_accounts()
+        book = Orderbook(symbol, start=expiry_thread)
+        if not expiry_thread:
+            book._alive = True
+        self._books.append(book)
+        return book
+
+    def exchange(self) -> _Exchange:
+        """The exchange, reset, without journal."""
+
+        default_exchange.reset()
+        self._exchange = default_exchange
+        return default_exchange
+
+    def queue(self) -> asyncio.Queue:
+        """A listener queue, emptied by `drain_queues`."""
+
+        queue = asyncio.Queue()
+        self._queues.append(queue)
+        return queue
+
+    def drain_queues(self):
+        for queue in self._queues:
+            while not queue.empty():
+                queue.get_nowait()
+
+    def on_close(self, callback: Callable[[], None]):
+        self._on_close.append(callback)
+
+    def close(self):
+        for callback in self._on_close:
+            callback()
+        books = list(self._books)
+        if self._exchange is not None:
+            books.extend(self._exchange._books.values())
+            self._exchange.reset()
+        for book in books:
+            if book.is_running():
+                book.stop()
+
+
+class Result:
+    name: str
+    histogram: Histogram
+
+    def __init__(self, name: str):
+        self.name = name
+        self.histogram = Histogram()
+
+    def to_json(self) -> dict:
+        """Latencies in microseconds and throughput in operations per second."""
+
+        summary = self.histogram.summary(scale=1e3)
+        mean = self.histogram.mean()
+        summary["ops_per_s"] = 1e9 / mean if mean else 0.0
+        return summary
+
+
+def run_case(benchmark: Benchmark, name: str, kwargs: dict, runs: int) -> Result:
+    context = Context()
+    try:
+        prepared = benchmark.function(context, **kwargs)
+        setup, operation = prepared if isinstance(prepared, tuple) else (None, prepared)
+        result = Result(name)
+        record = result.histogram.record
+        clock = time.perf_counter_ns
+        warmup = max(1, runs // 10)
+        gc.collect()
+        for i in range(warmup + runs):
+            if setup is not None:
+                setup()
+            t0 = clock()
+            operation()
+            elapsed = clock() - t0
+            if i >= warmup:
+                record(elapsed)
+        return result
+    finally:
+        context.close()
+
+
+def run(
+    names: Optional[Iterable[str]] = None,
+    runs: Optional[int] = None,
+    progress: Optional[Callable[[Result], None]] = None,
+) -> list[Result]:
+    """
+    Run the benchmarks whose name (or case name) contains one of `names`
+    (all by default), `runs` timed calls per case (default: the benchmark's
+    own). The engine logging and printing is silenced meanwhile.
+    """
+
+    # registers the benchmarks
+    from . import cases  # noqa: F401
+
+    results = []
+    logging.disable(logging.CRITICAL)
+    try:
+        for bench in BENCHMARKS.values():
+            for name, kwargs in bench.cases():
+                if names and not any(n in name for n in names):
+                    continue
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+                    devnull
+                ):
+                    result = run_case(bench, name, kwargs, runs or bench.runs)
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    finally:
+        logging.disable(logging.NOTSET)
+    return results
+
+
+def results_json(results: list[Result]) -> dict:
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "time": int(time.time()),
+        },
+        "results": {result.name: result.to_json() for result in results},
+    }
+
+
+def compare(
+    current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD
+) -> list[tuple[str, float, float, float, bool]]:
+    """
+    (case, baseline p50, current p50, ratio, regressed) for every case of
+    `current` also in `baseline` (both as written by `results_json`). A case
+    regressed when its median latency grew by more than `threshold`.
+    Medians are compared because they are stable from run to run, tails are not.
+    """
+
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base["p50"]:
+            continue
+        ratio = result["p50"] / base["p50"]
+        rows.append((name, base["p50"], result["p50"], ratio, ratio > 1 + threshold))
+    return rows
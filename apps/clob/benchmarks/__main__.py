@@ -0,0 +1,97 @@
+"""
+Run the benchmarks and compare them with the stored baseline.
+
+    python -m benchmarks [NAME ...] [--runs N] [--output PATH]
+                         [--baseline PATH] [--save-baseline] [--threshold X]
+
+Exits with status 1 when a case got slower than the baseline by more than the
+threshold. Baselines are machine specific: save one on the machine that runs
+the comparison.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from . import DEFAULT_THRESHOLD, compare, results_json, run
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _print_result(result):
+    s = result.to_json()
+    print(
+        f"{result.name:<36}{s['count']:>8}{s['mean']:>10.2f}{s['p50']:>10.2f}"
+        f"{s['p99']:>10.2f}{s['max']:>11.2f}{s['ops_per_s']:>12.0f}",
+        flush=True,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Engine microbenchmarks."
+    )
+    parser.add_argument(
+        "names", nargs="*", help="only run the cases whose name contains one of these"
+    )
+    parser.add_argument("--runs", type=int, default=None, help="timed calls per case")
+    parser.add_argument("--output", default=None, help="write the results as JSON here")
+    parser.add_argument(
+        "--baseline", default=BASELINE_PATH, help="baseline to compare with"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative median slowdown reported as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'case (us)':<36}{'count':>8}{'mean':>10}{'p50':>10}"
+        f"{'p99':>10}{'max':>11}{'ops/s':>12}"
+    )
+    results = results_json(run(args.names, args.runs, progress=_print_result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {"meta": results["meta"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline["results"] = json.load(f)["results"]
+        # a partial run only replaces the cases it ran
+        baseline["results"].update(results["results"])
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}, save one with --save-baseline")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline, args.threshold)
+    print(f"\n{'case (p50 us)':<36}{'baseline':>10}{'current':>10}{'ratio':>8}")
+    for name, base, current, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<36}{base:>10.2f}{current:>10.2f}{ratio:>8.2f}{flag}")
+    regressions = sum(1 for row in rows if row[4])
+    if regressions:
+        print(f"\n{regressions} case(s) slower than the baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
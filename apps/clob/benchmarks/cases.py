@@ -0,0 +1,194 @@
+"""The benchmarks, see the package docstring."""
+
+from decimal import Decimal
+
+from account import ledger
+from exchange import NewOrderRequest, OrderSide as ApiOrderSide, OrderType as ApiOrderType
+from fastlob import OrderParams, OrderSide, OrderType
+from fastlob.utils import pin_time
+
+from . import Context, benchmark
+
+SYMBOL = "BTCUSDT"
+FUNDS = Decimal(10**9)
+
+MAKER = "maker"
+TAKER = "taker"
+
+
+def _fund(*client_ids: str):
+    for client_id in client_ids:
+        account_id = ledger.account_id(client_id)
+        ledger.deposit(account_id, ledger.asset_id("BTC"), FUNDS)
+        ledger.deposit(account_id, ledger.asset_id("USDT"), FUNDS)
+
+
+def _ask(price: Decimal, quantity: Decimal = Decimal(1), **kwargs) -> OrderParams:
+    return OrderParams(MAKER, None, OrderSide.ASK, price, quantity, False, **kwargs)
+
+
+def _market_bid(quantity: Decimal, otype: OrderType = OrderType.GTC) -> OrderParams:
+    return OrderParams(
+        TAKER, None, OrderSide.BID, Decimal(1000), quantity, True, otype=otype
+    )
+
+
+def _fill_levels(book, levels: int, orders_per_level: int = 1):
+    for level in range(levels):
+        for _ in range(orders_per_level):
+            book.process(_ask(Decimal(101 + level)))
+
+
+@benchmark(depth=(1, 100, 10_000))
+def place_limit(context: Context, depth: int):
+    """Place a limit order behind `depth` orders of the same price."""
+
+    book = context.book(SYMBOL)
+    _fund(MAKER)
+    _fill_levels(book, 1, depth)
+    params = _ask(Decimal(101))
+    placed = []
+
+    def setup():
+        if placed:
+            book.cancel(placed.pop())
+
+    def place():
+        placed.append(book.process(params).orderid())
+
+    return setup, place
+
+
+@benchmark(depth=(1, 100, 10_000))
+def cancel_limit(context: Context, depth: int):
+    """Cancel the last order of a queue of `depth` orders."""
+
+    book = context.book(SYMBOL)
+    _fund(MAKER)
+    _fill_levels(book, 1, depth - 1)
+    params = _ask(Decimal(101))
+    placed = []
+
+    def setup():
+        placed.append(book.process(params).orderid())
+
+    def cancel():
+        book.cancel(placed.pop())
+
+    return setup, cancel
+
+
+@benchmark(runs=300, levels=(1, 10, 100))
+def market_sweep(context: Context, levels: int):
+    """Market order taking one order on each of `levels` price levels."""
+
+    book = context.book(SYMBOL)
+    _fund(MAKER, TAKER)
+    params = _market_bid(Decimal(levels))
+
+    def setup():
+        _fill_levels(book, levels)
+
+    return setup, lambda: book.process(params)
+
+
+@benchmark(levels=(10, 100))
+def fok_reject(context: Context, levels: int):
+    """FOK order for one more than the volume of `levels` levels, checked and rejected."""
+
+    book = context.book(SYMBOL)
+    _fund(MAKER, TAKER)
+    _fill_levels(book, levels)
+    params = _market_bid(Decimal(levels + 1), OrderType.FOK)
+    return lambda: book.process(params)
+
+
+@benchmark(runs=10_000, n=(5, 100))
+def best_limits(context: Context, n: int):
+    """Best `n` levels of a side holding 1000."""
+
+    book = context.book(SYMBOL)
+    _fund(MAKER)
+    _fill_levels(book, 1000)
+    return lambda: book.best_asks(n)
+
+
+@benchmark(runs=300, batch=(10, 100))
+def process_many(context: Context, batch: int):
+    """A batch of `batch` limit orders on distinct levels."""
+
+    book = context.book(SYMBOL)
+    _fund(MAKER)
+    params = [_ask(Decimal(101 + i)) for i in range(batch)]
+    placed = []
+
+    def setup():
+        while placed:
+            book.cancel(placed.pop())
+
+    def process():
+        placed.extend(result.orderid() for result in book.process_many(params))
+
+    return setup, process
+
+
+@benchmark(runs=50, burst=(10, 100, 1000))
+def gtd_expiry(context: Context, burst: int):
+    """Expiry pass cancelling `burst` GTD orders expiring together."""
+
+    # the pass is run directly, not by the book thread
+    book = context.book(SYMBOL, expiry_thread=False)
+    _fund(MAKER)
+    start_s = 2_000_000_000
+
+    def setup():
+        pin_time(start_s * 1000)
+        for i in range(burst):
+            book.process(
+                _ask(Decimal(101 + i % 10), otype=OrderType.GTD, expiry=start_s + 1)
+            )
+        pin_time((start_s + 2) * 1000)
+
+    def expire():
+        book._cancel_expired_orders()
+
+    context.on_close(lambda: pin_time(None))
+    return setup, expire
+
+
+@benchmark(runs=1000, subscribers=(0, 1, 100))
+def exchange_new_order(context: Context, subscribers: int):
+    """
+    `_Exchange.new_order` of a market order taking a resting one, with its
+    depth and user events pushed to `subscribers` depth listeners and, when
+    there are any, to both clients' user listeners.
+    """
+
+    exchange = context.exchange()
+    exchange.new_book(SYMBOL)
+    _fund(MAKER, TAKER)
+    queues = [context.queue() for _ in range(subscribers)]
+    for queue in queues:
+        exchange.register_diff_listener(SYMBOL, queue)
+    if subscribers:
+        exchange._user_listeners[MAKER] = context.queue()
+        exchange._user_listeners[TAKER] = context.queue()
+    maker = NewOrderRequest(
+        symbol=SYMBOL,
+        side=ApiOrderSide.SELL,
+        type=ApiOrderType.LIMIT_MAKER,
+        quantity=Decimal(1),
+        price=Decimal(101),
+    )
+    taker = NewOrderRequest(
+        symbol=SYMBOL,
+        side=ApiOrderSide.BUY,
+        type=ApiOrderType.MARKET,
+        quantity=Decimal(1),
+    )
+
+    def setup():
+        context.drain_queues()
+        exchange.new_order(MAKER, maker)
+
+    return setup, lambda: exchange.new_order(TAKER, taker)
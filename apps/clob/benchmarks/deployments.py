@@ -0,0 +1,173 @@
+"""
+Load test of the two deployments of the API, with the same load (see
+`benchmarks.load`) over HTTP:
+
+- single process: `uvicorn app:app`, matching and HTTP in one process;
+- gateway: the standalone engine (`engine.py`) behind `--workers` uvicorn
+  processes of `gateway_app`, talking over a Unix domain socket.
+
+The gateway processes listen on consecutive ports and the agents are spread
+over them, as behind a load balancer: `uvicorn --workers` hands the listening
+socket to its workers in a way that leaves TCP_NODELAY off, which adds a
+delayed ACK stall (about 40 ms) to every response and would hide the rest.
+The gateway does not serve the websocket streams, so both run without
+subscribers. Reported: the report of each deployment, then per endpoint the
+throughput and p50 / p99 latency of both side by side.
+
+Usage, from `apps/clob`:
+
+    python -m benchmarks.deployments [--agents N] [--duration S] [--workers N] [--json PATH]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from .load import (
+    UNLIMITED_ENV,
+    HttpTransport,
+    LoadResult,
+    _launch_uvicorn,
+    _wait_until_up,
+    run_load,
+)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SpreadTransport:
+    """HTTP to several servers of the same API, each new client connecting to the next one."""
+
+    def __init__(self, urls: list[str]):
+        self.transports = [HttpTransport(url) for url in urls]
+        self._next = itertools.cycle(self.transports)
+
+    def describe(self) -> str:
+        return f"{len(self.transports)} gateway processes + engine process (`python -m uvicorn`)"
+
+    def client(self):
+        return next(self._next).client()
+
+    async def request(self, method, path, body=None, api_key=""):
+        return await self.transports[0].request(method, path, body, api_key)
+
+    async def websocket(self, path: str):
+        raise NotImplementedError("the gateway does not serve websockets")
+
+    async def close(self):
+        for transport in self.transports:
+            await transport.close()
+
+
+def _launch_gateway(port: int, workers: int, socket_path: str) -> list[subprocess.Popen]:
+    env = {**os.environ, **UNLIMITED_ENV, "CLOB_ENGINE_SOCKET": socket_path}
+    quiet = dict(cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    engine = subprocess.Popen([sys.executable, "engine.py"], **quiet)
+    deadline = time.monotonic() + 20
+    while not os.path.exists(socket_path):
+        if engine.poll() is not None or time.monotonic() > deadline:
+            engine.kill()
+            raise RuntimeError("the engine did not come up")
+        time.sleep(0.1)
+    gateways = [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "gateway_app:app",
+                "--port", str(port + i), "--log-level", "warning",
+            ],
+            **quiet,
+        )
+        for i in range(workers)
+    ]
+    # gateways first, they hold connections to the engine
+    return gateways + [engine]
+
+
+async def _run(processes: list[subprocess.Popen], transport, agents: int, duration: float) -> LoadResult:
+    try:
+        for server in getattr(transport, "transports", [transport]):
+            await _wait_until_up(server)
+        return await run_load(transport, agents, 0, 0, duration)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def compare_report(single: LoadResult, gateway: LoadResult, workers: int) -> str:
+    """Markdown table of the throughput and latency of both deployments, per endpoint."""
+
+    a, b = single.to_json()["requests"], gateway.to_json()["requests"]
+    lines = [
+        "## Deployments",
+        "",
+        f"| Endpoint | RPS single | RPS gateway ({workers} processes) | p50 single | p50 gateway | p99 single | p99 gateway |",
+        "|----------|------------|---------------------|------------|-------------|------------|-------------|",
+    ]
+    for name in a:
+        if not a[name]["requests"] and not b[name]["requests"]:
+            continue
+        la, lb = a[name]["latency_ms"], b[name]["latency_ms"]
+        lines.append(
+            f"| `{name}` | {a[name]['rps']:,.0f} | {b[name]['rps']:,.0f} | "
+            f"{la['p50']:.2f}ms | {lb['p50']:.2f}ms | {la['p99']:.2f}ms | {lb['p99']:.2f}ms |"
+        )
+    total_a = sum(r["rps"] for r in a.values())
+    total_b = sum(r["rps"] for r in b.values())
+    lines.append(f"| **all** | {total_a:,.0f} | {total_b:,.0f} | | | | |")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.deployments",
+        description="Load test of the single process and gateway deployments.",
+    )
+    parser.add_argument("--agents", type=int, default=16, help="concurrent trading agents")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per deployment")
+    parser.add_argument("--workers", type=int, default=4, help="gateway processes")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="port of the launched servers, the gateways take the next ones too",
+    )
+    parser.add_argument("--json", default=None, help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    single = asyncio.run(
+        _run(
+            [_launch_uvicorn(args.port)],
+            HttpTransport(f"http://127.0.0.1:{args.port}"),
+            args.agents,
+            args.duration,
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        processes = _launch_gateway(args.port, args.workers, os.path.join(tmp, "engine.sock"))
+        transport = SpreadTransport(
+            [f"http://127.0.0.1:{args.port + i}" for i in range(args.workers)]
+        )
+        gateway = asyncio.run(_run(processes, transport, args.agents, args.duration))
+
+    print(single.report())
+    print()
+    print(gateway.report())
+    print()
+    print(compare_report(single, gateway, args.workers))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"single": single.to_json(), "gateway": gateway.to_json()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,665 @@
+"""
+End-to-end load test of the API and of the websocket fan-out.
+
+Agents trade concurrently through the HTTP API while websocket clients
+subscribe to the depth stream (`/ws`, diff mode) and to their user stream
+(`/ws-user`). The app runs either in-process, driven directly over ASGI (no
+sockets: the numbers are those of the app and the engine), or as a uvicorn
+server, launched by the harness or already running. The harness lifts the
+per-client rate limits of the app it runs; start an already running server
+with `CLOB_RATE_LIMIT_WEIGHT=0 CLOB_RATE_LIMIT_ORDERS=0`.
+
+Every agent loops over a mix of requests: non-crossing limit quotes around
+100, market orders of 1 taking them, `DELETE /openOrders` and `GET /depth`.
+The book is seeded with deep liquidity first, so market orders find some.
+
+Reported per endpoint: throughput and latency percentiles. Per stream: event
+rate and delivery lag, the time from the event timestamp (`E`) to its receipt.
+Depth diffs are stamped when emitted; on user streams only balance events
+(`outboundAccountPosition`) are, execution reports carry the order time, so
+the user stream lag is measured on balance events. Timestamps have millisecond
+resolution.
+
+The report uses the tables of `BENCHMARK_REPORT.md`, to compare with the TS API.
+
+Usage, from `apps/clob`:
+
+    python -m benchmarks.load [--agents N] [--depth-subscribers N]
+        [--user-subscribers N] [--duration S] [--launch | --url URL] [--json PATH]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+from metrics import Histogram
+
+SYMBOL = "BTCUSDT"
+SEED_CLIENT = "load-seed"
+DEPTH_LIMIT = 20
+
+# share of each request in the agents' mix
+MIX = (
+    ("POST /order (limit)", 0.45),
+    ("POST /order (market)", 0.15),
+    ("DELETE /openOrders", 0.10),
+    ("GET /depth", 0.30),
+)
+
+PERCENTILES = (50, 90, 95, 99, 99.9, 100)
+
+# the agents are far over the per-client rate limits (see `apis.rate_limit`), lift them
+UNLIMITED_ENV = {"CLOB_RATE_LIMIT_WEIGHT": "0", "CLOB_RATE_LIMIT_ORDERS": "0"}
+
+
+# TRANSPORTS ###################################################################
+
+
+class AsgiTransport:
+    """Calls an ASGI app directly, in the current event loop."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def describe(self) -> str:
+        return "FastAPI app in-process (ASGI, no network)"
+
+    def client(self) -> "AsgiTransport":
+        return self
+
+    async def request(
+        self, method: str, path: str, body: Optional[bytes] = None, api_key: str = ""
+    ) -> tuple[int, bytes]:
+        path, _, query = path.partition("?")
+        headers = [(b"host", b"load")]
+        if api_key:
+            headers.append((b"x-api-key", api_key.encode()))
+        if body is not None:
+            headers.append((b"content-type", b"application/json"))
+            headers.append((b"content-length", str(len(body)).encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("load", 80),
+        }
+        sent = False
+        disconnected = asyncio.Event()
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body or b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        status = 0
+        chunks = []
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            disconnected.set()
+        # a request that never suspends would starve the websocket forwarders,
+        # yield like reading the response from a socket would
+        await asyncio.sleep(0)
+        return status, b"".join(chunks)
+
+    async def websocket(self, path: str) -> "_AsgiWebSocket":
+        ws = _AsgiWebSocket(self.app, path)
+        await ws.connect()
+        return ws
+
+    async def close(self):
+        pass
+
+
+class _AsgiWebSocket:
+    def __init__(self, app, path: str):
+        self._app = app
+        self._path = path
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._to_client: asyncio.Queue = asyncio.Queue()
+        self._accepted = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "scheme": "ws",
+            "path": self._path,
+            "raw_path": self._path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"load")],
+            "client": ("127.0.0.1", 0),
+            "server": ("load", 80),
+            "subprotocols": [],
+        }
+        await self._to_app.put({"type": "websocket.connect"})
+
+        async def send(message):
+            if message["type"] == "websocket.accept":
+                self._accepted.set()
+            elif message["type"] == "websocket.send":
+                await self._to_client.put(message.get("text") or message.get("bytes"))
+            elif message["type"] == "websocket.close":
+                await self._to_client.put(None)
+
+        self._task = asyncio.create_task(self._app(scope, self._to_app.get, send))
+        await self._accepted.wait()
+
+    async def send(self, text: str):
+        await self._to_app.put({"type": "websocket.receive", "text": text})
+
+    async def recv(self) -> Optional[str]:
+        """Next message, None once closed."""
+        return await self._to_client.get()
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        await self._to_client.put(None)
+        if self._task is not None:
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(self._task, 5)
+
+
+class HttpTransport:
+    """Talks to a running server, one keep-alive connection per client."""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.url = url.rstrip("/")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self._clients: list[_HttpClient] = []
+
+    def describe(self) -> str:
+        return f"uvicorn at {self.url}"
+
+    def client(self) -> "_HttpClient":
+        client = _HttpClient(self.host, self.port)
+        self._clients.append(client)
+        return client
+
+    async def request(self, method, path, body=None, api_key=""):
+        client = self.client()
+        try:
+            return await client.request(method, path, body, api_key)
+        finally:
+            await client.close()
+            self._clients.remove(client)
+
+    async def websocket(self, path: str) -> "_NetWebSocket":
+        import websockets
+
+        ws_url = "ws" + self.url[len("http") :] + path
+        return _NetWebSocket(await websockets.connect(ws_url, max_queue=None))
+
+    async def close(self):
+        for client in self._clients:
+            await client.close()
+
+
+class _HttpClient:
+    """Minimal HTTP/1.1 client, enough for the API responses."""
+
+    def __init__(self, host: str, port: int):
+        self._host = host
+        self._port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method, path, body=None, api_key=""):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self._host, self._port
+            )
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self._host}"]
+        if api_key:
+            head.append(f"X-API-Key: {api_key}")
+        if body is not None:
+            head.append("Content-Type: application/json")
+        head.append(f"Content-Length: {len(body or b'')}")
+        self._writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + (body or b""))
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by the server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).strip(), 16)
+                chunk = await self._reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            data = b"".join(chunks)
+        else:
+            data = await self._reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, data
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            with contextlib.suppress(Exception):
+                await self._writer.wait_closed()
+            self._writer = None
+
+
+class _NetWebSocket:
+    def __init__(self, connection):
+        self._connection = connection
+
+    async def send(self, text: str):
+        await self._connection.send(text)
+
+    async def recv(self) -> Optional[str]:
+        try:
+            return await self._connection.recv()
+        except Exception:
+            return None
+
+    async def close(self):
+        with contextlib.suppress(Exception):
+            await self._connection.close()
+
+
+# LOAD #########################################################################
+
+
+class Stats:
+    """Latencies (ns) and outcomes of one kind of request."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.ok = 0
+        self.failed = 0
+
+
+class StreamStats:
+    """Delivery lags (us) of the events of one kind of stream."""
+
+    def __init__(self, subscribers: int):
+        self.subscribers = subscribers
+        self.events = 0
+        self.lag = Histogram()
+
+
+class LoadResult:
+    def __init__(self, transport: str, agents: int, duration_s: float):
+        self.transport = transport
+        self.agents = agents
+        self.duration_s = duration_s
+        self.requests: dict[str, Stats] = {name: Stats() for name, _ in MIX}
+        self.streams: dict[str, StreamStats] = {}
+
+    def to_json(self) -> dict:
+        return {
+            "transport": self.transport,
+            "agents": self.agents,
+            "duration_s": self.duration_s,
+            "requests": {
+                name: {
+                    "requests": stats.ok + stats.failed,
+                    "rps": (stats.ok + stats.failed) / self.duration_s,
+                    "success": stats.ok / max(1, stats.ok + stats.failed),
+                    "latency_ms": stats.latency.summary(PERCENTILES[:-1], scale=1e6),
+                }
+                for name, stats in self.requests.items()
+            },
+            "streams": {
+                name: {
+                    "subscribers": stream.subscribers,
+                    "events": stream.events,
+                    "events_per_s": stream.events / self.duration_s,
+                    "lag_ms": stream.lag.summary(PERCENTILES[:-1], scale=1e3),
+                }
+                for name, stream in self.streams.items()
+            },
+        }
+
+    def report(self) -> str:
+        """Markdown tables, in the layout of BENCHMARK_REPORT.md."""
+
+        def ms(value: float) -> str:
+            return f"{value:.2f}ms"
+
+        lines = [
+            "## CLOB Load Test Results",
+            "",
+            "| Parameter | Value |",
+            "|-----------|-------|",
+            f"| **Server** | {self.transport} |",
+            f"| **Host** | {platform.system()} {platform.machine()}, Python {platform.python_version()} |",
+            "| **Test Tool** | `python -m benchmarks.load` |",
+            f"| **Agents** | {self.agents} |",
+            f"| **Duration** | {self.duration_s:.1f}s |",
+            "",
+            "### Request Path Benchmarks",
+            "",
+            "| Endpoint | Concurrency | Total Requests | RPS | p50 | p90 | p95 | p99 | p99.9 | p100 | Success |",
+            "|----------|-------------|----------------|-----|-----|-----|-----|-----|-------|------|---------|",
+        ]
+        for name, stats in self.requests.items():
+            total = stats.ok + stats.failed
+            if not total:
+                continue
+            p = stats.latency.percentiles(PERCENTILES)
+            lines.append(
+                f"| `{name}` | {self.agents} | {total:,} | {total / self.duration_s:,.0f} | "
+                + " | ".join(ms(p[q] / 1e6) for q in PERCENTILES)
+                + f" | {stats.ok / total:.1%} |"
+            )
+        if self.streams:
+            lines += [
+                "",
+                "### Websocket Fan-out (delivery lag)",
+                "",
+                "| Stream | Subscribers | Events | Events/s | p50 | p90 | p95 | p99 | p99.9 | p100 |",
+                "|--------|-------------|--------|----------|-----|-----|-----|-----|-------|------|",
+            ]
+            for name, stream in self.streams.items():
+                p = stream.lag.percentiles(PERCENTILES)
+                lines.append(
+                    f"| `{name}` | {stream.subscribers} | {stream.events:,} | "
+                    f"{stream.events / self.duration_s:,.0f} | "
+                    + " | ".join(ms(p[q] / 1e3) for q in PERCENTILES)
+                    + " |"
+                )
+        return "\n".join(lines)
+
+
+def _order(side: str, otype: str, quantity: str, price: Optional[str] = None) -> bytes:
+    body = {"symbol": SYMBOL, "side": side, "type": otype, "quantity": quantity}
+    if price is not None:
+        body["price"] = price
+    return json.dumps(body).encode()
+
+
+async def _setup(transport, agents: list[str]):
+    client = transport.client()
+    await client.request("POST", "/new_book", json.dumps({"symbol": SYMBOL}).encode())
+    for client_id in [SEED_CLIENT] + agents:
+        for asset in ("BTC", "USDT"):
+            status, data = await client.request(
+                "POST",
+                "/account/deposit",
+                json.dumps({"asset": asset, "amount": "100000000"}).encode(),
+                client_id,
+            )
+            if status != 200:
+                raise RuntimeError(f"deposit failed: {status} {data[:200]!r}")
+    # deep liquidity on both sides, for the market orders
+    for level in range(1, 51):
+        for side, price in (("BUY", 100 - level * 0.1), ("SELL", 100 + level * 0.1)):
+            await client.request(
+                "POST", "/order", _order(side, "LIMIT_MAKER", "1000", f"{price:.2f}"), SEED_CLIENT
+            )
+
+
+async def _agent(transport, client_id: str, result: LoadResult, deadline: float, seed: int):
+    rnd = random.Random(seed)
+    client = transport.client()
+    names = [name for name, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    clock = time.perf_counter_ns
+    while time.monotonic() < deadline:
+        name = rnd.choices(names, weights)[0]
+        side = rnd.choice(("BUY", "SELL"))
+        if name == "POST /order (limit)":
+            # 0.05 to 4.95 away from 100, never crossing the seeded spread
+            offset = rnd.randint(1, 99) * 0.05
+            price = 100 - offset if side == "BUY" else 100 + offset
+            args = ("POST", "/order", _order(side, "LIMIT_MAKER", "1", f"{price:.2f}"))
+        elif name == "POST /order (market)":
+            args = ("POST", "/order", _order(side, "MARKET", "1"))
+        elif name == "DELETE /openOrders":
+            args = ("DELETE", "/openOrders", json.dumps({"symbol": SYMBOL}).encode())
+        else:
+            args = ("GET", f"/depth?symbol={SYMBOL}&limit={DEPTH_LIMIT}", None)
+        stats = result.requests[name]
+        t0 = clock()
+        try:
+            status, _ = await client.request(*args, api_key=client_id)
+        except Exception:
+            status = 0
+        stats.latency.record(clock() - t0)
+        if 200 <= status < 300:
+            stats.ok += 1
+        else:
+            stats.failed += 1
+
+
+def _lag_us(message: str, event_type: bytes) -> Optional[int]:
+    """Delivery lag of an event of `event_type`, from its E timestamp."""
+
+    if f'"e":"{event_type}"' not in message:
+        return None
+    start = message.find('"E":')
+    if start < 0:
+        return None
+    end = start + 4
+    while end < len(message) and message[end].isdigit():
+        end += 1
+    return int((time.time() * 1000 - int(message[start + 4 : end])) * 1000)
+
+
+async def _consume(ws, stream: StreamStats, event_type: str, stop: asyncio.Event):
+    while not stop.is_set():
+        message = await ws.recv()
+        if message is None:
+            return
+        if isinstance(message, bytes):
+            message = message.decode()
+        lag = _lag_us(message, event_type)
+        if lag is not None:
+            stream.events += 1
+            stream.lag.record(lag)
+
+
+async def run_load(
+    transport,
+    agents: int = 16,
+    depth_subscribers: int = 10,
+    user_subscribers: int = 4,
+    duration_s: float = 10.0,
+    seed: int = 1,
+) -> LoadResult:
+    """Run the load described in the module docstring, see `LoadResult`."""
+
+    agent_ids = [f"load-agent-{i}" for i in range(agents)]
+    await _setup(transport, agent_ids)
+
+    result = LoadResult(transport.describe(), agents, duration_s)
+    stop = asyncio.Event()
+    sockets = []
+    consumers = []
+    if depth_subscribers:
+        stream = result.streams["depthUpdate"] = StreamStats(depth_subscribers)
+        for i in range(depth_subscribers):
+            ws = await transport.websocket("/ws")
+            await ws.send(json.dumps({"method": "SUBSCRIBE", "params": [f"{SYMBOL}@depth"], "id": i}))
+            sockets.append(ws)
+            consumers.append(asyncio.create_task(_consume(ws, stream, "depthUpdate", stop)))
+    if user_subscribers:
+        stream = result.streams["outboundAccountPosition"] = StreamStats(
+            min(user_subscribers, agents)
+        )
+        for client_id in agent_ids[:user_subscribers]:
+            ws = await transport.websocket("/ws-user")
+            await ws.send(
+                json.dumps(
+                    {
+                        "id": client_id,
+                        "method": "userDataStream.subscribe.signature",
+                        "params": {"apiKey": client_id},
+                    }
+                )
+            )
+            sockets.append(ws)
+            consumers.append(
+                asyncio.create_task(_consume(ws, stream, "outboundAccountPosition", stop))
+            )
+    # let the subscriptions register
+    await asyncio.sleep(0.2)
+
+    started = time.monotonic()
+    deadline = started + duration_s
+    await asyncio.gather(
+        *(
+            _agent(transport, client_id, result, deadline, seed * 1000 + i)
+            for i, client_id in enumerate(agent_ids)
+        )
+    )
+    result.duration_s = time.monotonic() - started
+
+    # events still in flight
+    await asyncio.sleep(0.2)
+    stop.set()
+    for ws in sockets:
+        await ws.close()
+    for task in consumers:
+        task.cancel()
+    await transport.close()
+    return result
+
+
+# CLI ##########################################################################
+
+
+def _launch_uvicorn(port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={**os.environ, **UNLIMITED_ENV},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def _wait_until_up(transport: HttpTransport, timeout_s: float = 20.0):
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            status, _ = await transport.request("GET", "/ping")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"server at {transport.url} did not come up")
+        await asyncio.sleep(0.2)
+
+
+async def _main(args) -> LoadResult:
+    server = None
+    if args.launch or args.url:
+        transport = HttpTransport(args.url or f"http://127.0.0.1:{args.port}")
+        if args.launch:
+            server = _launch_uvicorn(args.port)
+        try:
+            await _wait_until_up(transport)
+            return await run_load(
+                transport, args.agents, args.depth_subscribers, args.user_subscribers, args.duration
+            )
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    # in-process: the app prints on every request, keep it out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        from app import app
+        from apis.rate_limit import rate_limiter
+        from exchange import exchange
+
+        rate_limiter.set_limits(())
+        exchange.reset()
+        try:
+            return await run_load(
+                AsgiTransport(app),
+                args.agents,
+                args.depth_subscribers,
+                args.user_subscribers,
+                args.duration,
+            )
+        finally:
+            # the GTD expiry threads of the books would keep the process alive
+            for book in exchange._books.values():
+                book.stop()
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load", description="End-to-end load test of the API."
+    )
+    parser.add_argument("--agents", type=int, default=16, help="concurrent trading agents")
+    parser.add_argument(
+        "--depth-subscribers", type=int, default=10, help="depth stream websocket clients"
+    )
+    parser.add_argument(
+        "--user-subscribers",
+        type=int,
+        default=4,
+        help="agents also subscribed to their user stream",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument(
+        "--launch", action="store_true", help="launch a uvicorn server and load it"
+    )
+    target.add_argument("--url", default=None, help="load an already running server")
+    parser.add_argument("--port", type=int, default=8765, help="port of the launched server")
+    parser.add_argument("--json", default=None, help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    result = asyncio.run(_main(args))
+    print(result.report())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result.to_json(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
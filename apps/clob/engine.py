@@ -0,0 +1,38 @@
+"""
+Standalone matching engine: the books and the exchange state live in this
+process only, which serves them on a Unix domain socket (see `exchange.ipc`)
+to the stateless HTTP workers of `gateway_app`. Journal, snapshots and the
+shared top-of-book are configured as for `app`.
+
+    CLOB_ENGINE_SOCKET=/tmp/clob-engine.sock python engine.py
+"""
+
+import asyncio
+import signal
+
+from exchange import exchange, async_exchange
+from exchange.ipc import ENGINE_SOCKET, EngineServer
+from exchange.service import start_exchange, stop_exchange
+
+
+async def main():
+    start_exchange()
+    server = EngineServer(async_exchange, ENGINE_SOCKET)
+    await server.start()
+    print(f"Engine listening on {ENGINE_SOCKET}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await server.close()
+    stop_exchange()
+    # the GTD expiry threads of the books would keep the process alive
+    for book in exchange._books.values():
+        book.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
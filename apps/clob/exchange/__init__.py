@@ -3,36 +3,151 @@ from decimal import Decimal
 from .types import (
     OrderSide,
     NewOrderRequest,
+    BatchOrdersRequest,
+    QuoteLevel,
+    MassQuoteRequest,
     CancelOrderRequest,
     CancelReplaceRequest,
+    AmendOrderRequest,
     OrderType,
-    CancelReplaceResponse,
     CurrentOpenOrdersQuery,
     OrderQuery,
     AllOrdersQuery,
     DepthQuery,
-    DepthResponse,
+    BookTickerQuery,
     CancelAllRequest,
-    OrderResponseResult,
-    get_fastlob_order_response,
-    to_execution_report_ws,
-    to_outbound_account_position_ws,
-    to_trade_response,
+    MassCancelRequest,
     TradesQuery,
-    TradeResponse,
     KlineQuery,
     interval_to_milliseconds,
 )
-from account import get_account, reset_accounts
-from typing import Dict, Set
+from .encoding import (
+    order_json,
+    cancel_replace_json,
+    open_orders_overview_json,
+    amend_json,
+    mass_quote_json,
+    execution_report_json,
+    trade_json,
+    depth_json,
+    book_ticker_json,
+    depth_update_json,
+    account_position_json,
+    json_list,
+)
+from .fanout import STREAM_DEPTH, STREAM_USER, SubscriberQueue, count_dropped, put_event
+from .journal import Journal, Value
+from .shared_top import SharedTopWriter
+from .snapshot import write_snapshot, load_snapshot
+from .async_exchange import AsyncExchange
+from account import ledger, reset_accounts
+from fastlob.order import Order
+from fastlob.utils import pin_time, time_asms
+from metrics import engine_stage_latency, registry
+from pydantic import BaseModel
+from typing import Callable, Dict, Optional, Set, get_args, get_origin
 import asyncio
+import functools
+import json
+import logging
+import os
 import time
 
+# Balance changes are sent as one outboundAccountPosition event per account
+# and flush. By default the flush runs on the next event loop iteration, so
+# every posting of a command (makers included) ends up in one event; a
+# positive interval coalesces over a longer window instead.
+BALANCE_FLUSH_INTERVAL_MS = int(os.environ.get("CLOB_BALANCE_FLUSH_INTERVAL_MS", "0"))
+
+logger = logging.getLogger("exchange")
+
 
 def get_market_price(side: LobOrderSide):
     return Decimal("100000000") if side == LobOrderSide.BID else Decimal("0.001")
 
 
+# journal op of the record starting a journal restarted after a snapshot,
+# its value is the id of that snapshot
+_CHECKPOINT_OP = 0
+
+# journal op -> (command method, kind of each argument: a plain value or a request model)
+_COMMANDS: Dict[int, tuple[Callable, tuple[type, ...]]] = {}
+
+
+def _command(op: int, *arg_kinds: type):
+    """
+    Mark an `_Exchange` method as a command changing the exchange state. It is
+    journaled (when a journal is open) before it runs, and runs with the clock
+    pinned to its journal time so that replaying it gives the same result.
+    Journal ops are persisted, never reuse one.
+    """
+
+    def decorator(method):
+        _COMMANDS[op] = (method, arg_kinds)
+
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            time_ms = int(time.time() * 1000)
+            if self._journal is not None:
+                self._journal_seq = self._journal.append(
+                    op, time_ms, _flatten_args(args)
+                )
+            pin_time(time_ms)
+            try:
+                return method(self, *args)
+            finally:
+                pin_time(None)
+
+        return wrapper
+
+    return decorator
+
+
+def command_name(op: int) -> str:
+    """Name of the command journaled as `op`."""
+    return "checkpoint" if op == _CHECKPOINT_OP else _COMMANDS[op][0].__name__
+
+
+def _flatten_args(args: tuple) -> list[Value]:
+    values: list[Value] = []
+    for arg in args:
+        if isinstance(arg, BaseModel):
+            values.extend(getattr(arg, field) for field in type(arg).model_fields)
+        elif isinstance(arg, list):
+            # list of request models: its length, then each model
+            values.append(len(arg))
+            values.extend(_flatten_args(tuple(arg)))
+        else:
+            values.append(arg)
+    return values
+
+
+def _unflatten_args(arg_kinds: tuple[type, ...], values: list[Value]) -> list:
+    args = []
+    i = 0
+    for kind in arg_kinds:
+        if get_origin(kind) is list:
+            (item_kind,) = get_args(kind)
+            count = values[i]
+            fields = list(item_kind.model_fields)
+            i += 1
+            items = []
+            for _ in range(count):
+                chunk = values[i : i + len(fields)]
+                items.append(item_kind.model_validate(dict(zip(fields, chunk))))
+                i += len(fields)
+            args.append(items)
+        elif issubclass(kind, BaseModel):
+            fields = list(kind.model_fields)
+            chunk = values[i : i + len(fields)]
+            args.append(kind.model_validate(dict(zip(fields, chunk))))
+            i += len(fields)
+        else:
+            args.append(values[i])
+            i += 1
+    return args
+
+
 class _Exchange:
     _books: dict[str, Orderbook]
 
@@ -44,19 +159,192 @@ class _Exchange:
         self._user_listeners: Dict[str, asyncio.Queue] = {}
         # per-symbol monotonically increasing update id for depth updates
         self._update_id: Dict[str, int] = {}
+        # bumped whenever the set of books changes
+        self._books_version = 0
+        # loop of the user stream listeners, balance events are flushed on it
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        ledger.set_listener(self._schedule_balance_flush)
+        self._journal: Optional[Journal] = None
+        self._journal_seq = 0
+        # (checkpoint id, journal records covered) of the last snapshot loaded or written
+        self._checkpoint: Optional[tuple[int, int]] = None
+        # client id -> symbols of the books where it has resting orders
+        self._client_symbols: Dict[str, Set[str]] = {}
+        # top-of-book of every book for the other processes, see `share_top`
+        self._shared_top: Optional[SharedTopWriter] = None
+        # events for the listener queues produced by the running engine thread call, see `_deliver`
+        self._outbox: Optional[list[Callable[[], None]]] = None
 
+    # -------------------------
+    # Journal and snapshots
+    # -------------------------
+    def load_snapshot(self, path: str) -> bool:
+        """
+        Replace the state with the snapshot at `path`, if there is one. To be
+        called on a fresh exchange, before `open_journal`.
+        """
+        checkpoint = load_snapshot(path, self)
+        if checkpoint is None:
+            return False
+        self._checkpoint = checkpoint
+        for symbol, book in self._books.items():
+            self._watch_book(symbol, book)
+        return True
+
+    def open_journal(self, path: str, fsync: bool = True) -> int:
+        """
+        Replay the commands journaled at `path` (those not covered by the
+        loaded snapshot), then journal every new command there. Must be called
+        on a fresh exchange. Returns the number of replayed commands.
+        """
+        journal = Journal(path, fsync)
+        replayed = 0
+        for op, time_ms, values in self.uncovered_records(journal.take_recovered()):
+            if op != _CHECKPOINT_OP:
+                self.replay_command(op, time_ms, values)
+                replayed += 1
+        self._journal = journal
+        return replayed
+
+    def uncovered_records(
+        self, records: list[tuple[int, int, list[Value]]]
+    ) -> list[tuple[int, int, list[Value]]]:
+        """The journal `records` that come after the loaded snapshot, if any."""
+        if self._checkpoint is None:
+            return records
+        checkpoint_id, covered = self._checkpoint
+        first = records[0] if records else None
+        if first and first[0] == _CHECKPOINT_OP and first[2] == [checkpoint_id]:
+            return records[1:]
+        # crashed between writing the snapshot and restarting the journal
+        return records[covered:]
+
+    def replay_command(self, op: int, time_ms: int, values: list[Value]) -> bool:
+        """
+        Run a journaled command again, with the clock pinned to its journal
+        time. It is not journaled again. Returns False if it failed, which it
+        also did when first run.
+        """
+        if op == _CHECKPOINT_OP:
+            return True
+        method, arg_kinds = _COMMANDS[op]
+        pin_time(time_ms)
+        try:
+            method(self, *_unflatten_args(arg_kinds, values))
+            return True
+        except Exception:
+            return False
+        finally:
+            pin_time(None)
+
+    def checkpoint(self, path: str):
+        """
+        Save the whole state to a snapshot at `path`, then restart the journal,
+        whose records the snapshot now covers. Must run between commands.
+        """
+        checkpoint_id = time.time_ns()
+        covered = 0
+        if self._journal is not None:
+            self._journal.sync()
+            covered = self._journal.record_count()
+        write_snapshot(path, self, checkpoint_id, covered)
+        self._checkpoint = (checkpoint_id, covered)
+        if self._journal is not None:
+            self._journal.restart(
+                _CHECKPOINT_OP, int(time.time() * 1000), [checkpoint_id]
+            )
+
+    def close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    async def wait_durable(self):
+        """Wait until every command run so far is journaled on disk."""
+        if self._journal is not None:
+            await self._journal.wait_durable(self._journal_seq)
+
+    @_command(1, str)
     def new_book(self, symbol: str):
         if not self._books.get(symbol):
             self._books[symbol] = Orderbook(symbol, True)
-            self._update_id[symbol] = int(time.time() * 1000)
+            self._update_id[symbol] = time_asms()
+            self._watch_book(symbol, self._books[symbol])
+            self._books_version += 1
+
+    def _watch_book(self, symbol: str, book: Orderbook):
+        """Keep `_client_symbols` up to date with the clients of `book`, and share its top if `share_top` was called."""
+        book.set_client_listener(functools.partial(self._on_book_client, symbol))
+        for client_id in book.clients():
+            self._on_book_client(symbol, client_id, True)
+        if self._shared_top is not None:
+            if not self._shared_top.add(symbol):
+                print(f"No shared memory slot left for {symbol}, its top is not shared")
+                return
+            book.set_top_listener(functools.partial(self._shared_top.write, symbol))
+            self._shared_top.write(symbol, book.top(), self._update_id.get(symbol, 0))
+
+    def share_top(self, name: str):
+        """
+        Write the top-of-book and depth update id of every book, present and
+        future, to the shared memory region `name` (created, or replaced),
+        where the read-only market data workers read them.
+        """
+        self._shared_top = SharedTopWriter(name)
+        for symbol, book in self._books.items():
+            self._watch_book(symbol, book)
+
+    def close_shared_top(self):
+        if self._shared_top is not None:
+            for book in self._books.values():
+                book.set_top_listener(None)
+            self._shared_top.close()
+            self._shared_top = None
+
+    def _on_book_client(self, symbol: str, client_id: str, present: bool):
+        # called from the expiry threads too
+        if present:
+            self._client_symbols.setdefault(client_id, set()).add(symbol)
+            return
+        symbols = self._client_symbols.get(client_id)
+        if symbols is not None:
+            symbols.discard(symbol)
+            if not symbols:
+                self._client_symbols.pop(client_id, None)
+
+    def _client_open_orders(self, client_id: str) -> list[tuple[str, list[Order]]]:
+        """(symbol, open orders) of the client in every book where it has some, by symbol."""
+        result = []
+        for symbol in sorted(self._client_symbols.get(client_id, ())):
+            book = self._books.get(symbol)
+            orders = book.get_open_orders_by_client_id(client_id) if book else []
+            if orders:
+                result.append((symbol, orders))
+        return result
+
+    def books_version(self) -> int:
+        """Version of the set of listed books."""
+        return self._books_version
+
+    def symbols(self) -> list[str]:
+        """Symbols of the listed books."""
+        return list(self._books.keys())
+
+    def market_version(self, symbol: str) -> tuple[int, int]:
+        """
+        Version of everything the public market data of `symbol` is computed
+        from: the book content and the depth update id. Raises KeyError for
+        unknown symbols.
+        """
+        return self._books[symbol].version(), self._update_id[symbol]
 
+    @_command(2, str, str, Decimal)
     def deposit(self, client_id: str, asset: str, amount: Decimal):
-        get_account(client_id).get_balance(asset).on_deposit(amount)
-        self._emit_balance_update(client_id=client_id, symbol=asset + "USDT")
+        ledger.deposit(ledger.account_id(client_id), ledger.asset_id(asset), amount)
 
+    @_command(3, str, str, Decimal)
     def withdraw(self, client_id: str, asset: str, amount: Decimal):
-        get_account(client_id).get_balance(asset).on_withdraw(amount)
-        self._emit_balance_update(client_id=client_id, symbol=asset + "USDT")
+        ledger.withdraw(ledger.account_id(client_id), ledger.asset_id(asset), amount)
 
     # -------------------------
     # Pub/Sub listener methods
@@ -65,11 +353,15 @@ class _Exchange:
         key = client_id
         if key not in self._user_listeners:
             self._user_listeners[key] = queue
+        self._loop = asyncio.get_running_loop()
 
-    def unregister_user_listener(self, client_id: str) -> None:
+    def unregister_user_listener(
+        self, client_id: str, queue: Optional[asyncio.Queue] = None
+    ) -> None:
+        """Unregister the listener of `client_id`, only if it is `queue` when given."""
         key = client_id
         q = self._user_listeners.get(key)
-        if not q:
+        if not q or (queue is not None and q is not queue):
             return
         self._user_listeners.pop(key, None)
 
@@ -96,8 +388,30 @@ class _Exchange:
             # remove empty set
             self._depth_listeners.pop(key, None)
 
+    def _subscriber_queues(self):
+        """(stream, symbol, queue) of every listener."""
+        for symbol, queues in list(self._depth_listeners.items()):
+            for queue in list(queues):
+                yield STREAM_DEPTH, symbol, queue
+        for queue in list(self._user_listeners.values()):
+            yield STREAM_USER, "", queue
+
+    def _subscriber_counts(self):
+        """Series of the clob_ws_subscribers gauge."""
+        for symbol, queues in list(self._depth_listeners.items()):
+            yield (STREAM_DEPTH, symbol), len(queues)
+        yield (STREAM_USER, ""), len(self._user_listeners)
+
+    def _subscriber_series(self, measure: Callable[[SubscriberQueue], int]):
+        for stream, symbol, queue in self._subscriber_queues():
+            if isinstance(queue, SubscriberQueue):
+                yield (stream, symbol, queue.subscriber), measure(queue)
+
     def _emit_depth_update_for_symbol(
-        self, symbol: str, bids: list[tuple[str, str]], asks: list[tuple[str, str]]
+        self,
+        symbol: str,
+        bids: list[tuple[Decimal, Decimal]],
+        asks: list[tuple[Decimal, Decimal]],
     ):
         try:
 
@@ -105,113 +419,171 @@ class _Exchange:
             prev_id = self._update_id.get(symbol, int(time.time() * 1000))
             new_id = prev_id + 1
             self._update_id[symbol] = new_id
+            if self._shared_top is not None:
+                self._shared_top.write_update_id(symbol, new_id)
 
             # For each listener, prepare its tailored payload and push to its queues
             queues = self._depth_listeners.get(symbol, set())
             if not queues:
                 return
 
-                # Build depthUpdate event matching Binance-like shape
-            diff_event = {
-                "e": "depthUpdate",
-                "E": int(time.time() * 1000),  # event time in ms
-                "s": symbol,
-                "U": prev_id + 1,  # first update id in this event
-                "u": new_id,  # final update id in this event
-                "b": bids,
-                "a": asks,
-            }
+            # Build depthUpdate event matching Binance-like shape, encoded once
+            # for all listeners
+            event_ns = time.perf_counter_ns()
+            diff_event = depth_update_json(
+                symbol=symbol,
+                event_time=int(time.time() * 1000),
+                first_update_id=prev_id + 1,
+                final_update_id=new_id,
+                bids=bids,
+                asks=asks,
+            )
 
-            # put on each queue (non-blocking)
-            for q in list(queues):
-                try:
-                    q.put_nowait(diff_event)
-                except asyncio.QueueFull:
-                    # drop the update for this consumer to avoid blocking engine
-                    # optionally: log or count dropped updates
-                    pass
-                except Exception:
-                    # if the queue is invalid or closed, remove it
-                    queues.discard(q)
-
-            # clean empty sets
-            if not queues:
-                self._depth_listeners.pop(symbol, None)
+            def publish():
+                # put on each queue (non-blocking)
+                for q in list(queues):
+                    try:
+                        put_event(q, diff_event, event_ns)
+                    except asyncio.QueueFull:
+                        # drop the update for this consumer to avoid blocking engine
+                        count_dropped(q, STREAM_DEPTH, symbol)
+                    except Exception:
+                        # if the queue is invalid or closed, remove it
+                        queues.discard(q)
+
+                # clean empty sets
+                if not queues:
+                    self._depth_listeners.pop(symbol, None)
+
+            self._deliver(publish)
         except Exception as e:
             print(f"Failed to push book diff event: {str(e)}")
 
-    def _emit_balance_update(self, client_id: str, symbol: str):
-        base = symbol.split("USDT")[0]
-        quote = "USDT"
-        event = to_outbound_account_position_ws(get_account(client_id), [base, quote])
-        queue = self._user_listeners.get(client_id)
-        if not queue:
+    def _schedule_balance_flush(self):
+        """Ledger listener, called from any thread on the first balance change after a flush."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # nobody ever subscribed, nothing to send
+            ledger.drain_dirty()
             return
-        print(f"Emitting balance update {event} to client_id={client_id}")
         try:
-            queue.put_nowait(event)
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._arm_balance_flush()
+        else:
+            # e.g. GTD expiry thread
+            loop.call_soon_threadsafe(self._arm_balance_flush)
+
+    def _arm_balance_flush(self):
+        if BALANCE_FLUSH_INTERVAL_MS > 0:
+            self._loop.call_later(
+                BALANCE_FLUSH_INTERVAL_MS / 1000, self._flush_balance_updates
+            )
+        else:
+            self._loop.call_soon(self._flush_balance_updates)
+
+    def _flush_balance_updates(self):
+        """Send one outboundAccountPosition event per account whose balances changed."""
+        t0 = time.perf_counter_ns()
+        dirty = ledger.drain_dirty()
+        if not self._user_listeners:
+            return
+        now = int(time.time() * 1000)
+        for account_id, asset_ids in dirty.items():
+            client_id = ledger.client_id(account_id)
+            queue = self._user_listeners.get(client_id)
+            if not queue:
+                continue
+            assets = sorted(ledger.asset_name(asset_id) for asset_id in asset_ids)
+            event = account_position_json(account_id, assets, now)
+            logger.debug("Emitting balance update %s to client_id=%s", event, client_id)
+            self._put_user_event_now(client_id, queue, event)
+        # balances are not per symbol
+        engine_stage_latency.observe(time.perf_counter_ns() - t0, "balance_events", "")
+
+    def _deliver(self, put: Callable[[], None]):
+        """
+        Run `put`, which hands events to listener queues. Queues belong to the
+        event loop: in a call running on the engine thread (see
+        `AsyncExchange`) it is kept and run on the loop once the call returns.
+        """
+        if self._outbox is not None:
+            self._outbox.append(put)
+        else:
+            put()
+
+    def _put_user_event(self, client_id: str, queue: asyncio.Queue, event: str):
+        self._deliver(
+            functools.partial(
+                self._put_user_event_now, client_id, queue, event, time.perf_counter_ns()
+            )
+        )
+
+    def _put_user_event_now(
+        self, client_id: str, queue: asyncio.Queue, event: str, event_ns: Optional[int] = None
+    ):
+        try:
+            put_event(queue, event, event_ns)
         except asyncio.QueueFull:
             print(f"Queue full for client_id={client_id}, clearing queue")
+            dropped = 0
             while not queue.empty():
                 try:
                     queue.get_nowait()
                 except asyncio.QueueEmpty:
                     break
-            queue.put_nowait(event)
+                dropped += 1
+            count_dropped(queue, STREAM_USER, n=dropped)
+            put_event(queue, event, event_ns)
 
-    def _emit_order_update(self, orders: list[OrderResponseResult]):
+    def _emit_order_update(
+        self, symbol: str, orders: list[tuple[Order, Optional[OrderType]]]
+    ):
         try:
-            # --- Deduplicate by order.orderid ---
-            unique_orders: dict[int, OrderResponseResult] = {}
+            # --- Deduplicate by order id ---
+            unique_orders: dict[int, tuple[Order, Optional[OrderType]]] = {}
             for o in orders:
-                unique_orders[o.orderId] = o  # Keeps last occurrence
+                unique_orders[o[0].id()] = o  # Keeps last occurrence
 
-            for order in unique_orders.values():
-                queue = self._user_listeners.get(order.clientId)
+            for order, type in unique_orders.values():
+                queue = self._user_listeners.get(order.client_id())
                 if not queue:
                     continue
 
                 # Build executionReport message
-                event = to_execution_report_ws(order)
-                print(f"Emitting order update {event} to client_id={order.clientId}")
-                try:
-                    queue.put_nowait(event)
-                except asyncio.QueueFull:
-                    print(f"Queue full for client_id={order.clientId}, clearing queue")
-                    while not queue.empty():
-                        try:
-                            queue.get_nowait()
-                        except asyncio.QueueEmpty:
-                            break
-                    queue.put_nowait(event)
+                event = execution_report_json(symbol, order, type)
+                logger.debug("Emitting order update %s to client_id=%s", event, order.client_id())
+                self._put_user_event(order.client_id(), queue, event)
 
         except Exception as e:
             print(f"Failed to push order event: {str(e)}")
 
     def _collect_bids_asks(self, prices: set[Decimal], book: Orderbook):
-        bids: list[tuple[str, str]] = []
-        asks: list[tuple[str, str]] = []
+        bids: list[tuple[Decimal, Decimal]] = []
+        asks: list[tuple[Decimal, Decimal]] = []
         for price in prices:
             bid = book.get_bid(price)
             if bid:
-                bids.append([str(bid.price()), str(bid.volume())])
+                bids.append((bid.price(), bid.volume()))
             ask = book.get_ask(price)
             if ask:
-                asks.append([str(ask.price()), str(ask.volume())])
+                asks.append((ask.price(), ask.volume()))
 
         return bids, asks
 
     def _collect_orders(
-        self, symbol: str, prices: set[Decimal], book: Orderbook
-    ) -> list[OrderResponseResult]:
+        self, prices: set[Decimal], book: Orderbook
+    ) -> list[tuple[Order, Optional[OrderType]]]:
         return [
-            get_fastlob_order_response(symbol, order)
-            for order in book._orders.values()
-            if order.price() in prices
+            (order, None) for order in book._orders.values() if order.price() in prices
         ]
 
-    def new_order(self, client_id: str, request: NewOrderRequest):
+    def _place_order(self, client_id: str, request: NewOrderRequest):
+        """Process `request` on its book, returns (book, order, result); raises if rejected."""
         side = LobOrderSide.BID if request.side == OrderSide.BUY else LobOrderSide.ASK
+        t0 = time.perf_counter_ns()
         order_params = OrderParams(
             client_id=client_id,
             client_order_id=request.newClientOrderId,
@@ -224,6 +596,8 @@ class _Exchange:
             quantity=request.quantity,
             is_market=request.type == OrderType.MARKET,
         )
+        t1 = time.perf_counter_ns()
+        engine_stage_latency.observe(t1 - t0, "params", request.symbol)
 
         book = self._books[request.symbol]
         res = book.process(orderparams=order_params)
@@ -232,16 +606,27 @@ class _Exchange:
 
         order_id = res.orderid()
         order = book.get_order_by_id(orderid=order_id)
+        return book, order, res
 
+    def _changed_prices(self, request: NewOrderRequest, order: Order, res) -> set[Decimal]:
+        """Prices whose level a placed order changed."""
         prices: set[Decimal] = set([])
         if request.price:
-            prices.add(request.price)
+            prices.add(order.price())
 
         exec_prices = res._execprices
 
         if exec_prices:
             for price in exec_prices.keys():
                 prices.add(price)
+        return prices
+
+    @_command(4, str, NewOrderRequest)
+    def new_order(self, client_id: str, request: NewOrderRequest):
+        book, order, res = self._place_order(client_id, request)
+
+        t0 = time.perf_counter_ns()
+        prices = self._changed_prices(request, order, res)
 
         bids, asks = self._collect_bids_asks(prices, book)
 
@@ -250,19 +635,100 @@ class _Exchange:
             bids=bids,
             asks=asks,
         )
+        t1 = time.perf_counter_ns()
+        engine_stage_latency.observe(t1 - t0, "depth_diff", request.symbol)
+
+        orders = self._collect_orders(prices, book)
+        orders.append((order, request.type))
+        self._emit_order_update(symbol=request.symbol, orders=orders)
+        t2 = time.perf_counter_ns()
+        engine_stage_latency.observe(t2 - t1, "order_events", request.symbol)
+
+        response = order_json(request.symbol, order, res, type=request.type)
+        engine_stage_latency.observe(
+            time.perf_counter_ns() - t2, "serialize", request.symbol
+        )
+        return response
 
-        orders = self._collect_orders(request.symbol, prices, book)
-        orders.append(
-            get_fastlob_order_response(
-                symbol=request.symbol, order=order, type=request.type
+    @_command(9, str, list[NewOrderRequest])
+    def new_orders(self, client_id: str, requests: list[NewOrderRequest]):
+        """
+        Place `requests` in order, each like `new_order`, but with a single
+        depth diff and a single set of order events per symbol for the whole
+        batch (balance events are coalesced anyway). A rejected order does not
+        stop the batch: the result is a JSON list holding, per request, the
+        order or a {"code", "msg"} error.
+        """
+        results: list[str] = []
+        changed: dict[str, set[Decimal]] = {}
+        placed: dict[str, list[tuple[Order, Optional[OrderType]]]] = {}
+        for request in requests:
+            try:
+                book, order, res = self._place_order(client_id, request)
+            except KeyError:
+                results.append('{"code":-1121,"msg":"Invalid symbol."}')
+                continue
+            except Exception as e:
+                results.append(json.dumps({"code": -2010, "msg": str(e)}))
+                continue
+            changed.setdefault(request.symbol, set()).update(
+                self._changed_prices(request, order, res)
+            )
+            placed.setdefault(request.symbol, []).append((order, request.type))
+            # the order as it was once placed, later orders of the batch may fill it
+            results.append(order_json(request.symbol, order, res, type=request.type))
+
+        for symbol, prices in changed.items():
+            book = self._books[symbol]
+            t0 = time.perf_counter_ns()
+            bids, asks = self._collect_bids_asks(prices, book)
+            self._emit_depth_update_for_symbol(symbol=symbol, bids=bids, asks=asks)
+            t1 = time.perf_counter_ns()
+            engine_stage_latency.observe(t1 - t0, "depth_diff", symbol)
+
+            orders = self._collect_orders(prices, book)
+            orders.extend(placed[symbol])
+            self._emit_order_update(symbol=symbol, orders=orders)
+            engine_stage_latency.observe(
+                time.perf_counter_ns() - t1, "order_events", symbol
             )
+        return json_list(results)
+
+    @_command(10, str, str, list[QuoteLevel], list[QuoteLevel])
+    def mass_quote(
+        self, client_id: str, symbol: str, bids: list[QuoteLevel], asks: list[QuoteLevel]
+    ):
+        """
+        Replace all the resting orders of the client on `symbol` by `bids` and
+        `asks`, atomically (see `Orderbook.replace_quotes`), with a single
+        depth diff and order events only for the orders changed. Raises if the
+        quotes are rejected, the book is then unchanged.
+        """
+        book = self._books[symbol]
+        res = book.replace_quotes(
+            client_id,
+            [(level.price, level.quantity) for level in bids],
+            [(level.price, level.quantity) for level in asks],
         )
-        self._emit_order_update(orders=orders)
-        self._emit_balance_update(client_id=client_id, symbol=request.symbol)
+        if not res.success():
+            raise Exception(res.messages()[0])
 
-        return get_fastlob_order_response(request.symbol, order, res, type=request.type)
+        t0 = time.perf_counter_ns()
+        bids_diff, asks_diff = self._collect_bids_asks(res.prices(), book)
+        self._emit_depth_update_for_symbol(symbol=symbol, bids=bids_diff, asks=asks_diff)
+        t1 = time.perf_counter_ns()
+        engine_stage_latency.observe(t1 - t0, "depth_diff", symbol)
 
-    def cancel_order(self, request: CancelOrderRequest):
+        orders = [(order, None) for order in res.canceled() + res.amended()]
+        orders.extend((order, OrderType.LIMIT_MAKER) for order in res.placed())
+        self._emit_order_update(symbol=symbol, orders=orders)
+        engine_stage_latency.observe(time.perf_counter_ns() - t1, "order_events", symbol)
+
+        return mass_quote_json(symbol, res.placed(), res.amended(), res.canceled())
+
+    @_command(5, str, CancelOrderRequest)
+    def cancel_order(self, client_id: str, request: CancelOrderRequest):
+        """Cancel an open order of the client, None if it has no such order."""
         book = self._books[request.symbol]
         orderid = request.orderId
         if orderid:
@@ -270,11 +736,11 @@ class _Exchange:
         else:
             order = book.get_order_by_client_order_id(request.origClientOrderId)
 
-        if not order:
+        # order ids are sequential, only the owner may cancel
+        if not order or order.client_id() != client_id:
             return
 
         orderid = order.id()
-        client_id = order.client_id()
         book.cancel(orderid=orderid)
 
         bids, asks = self._collect_bids_asks(set([order.price()]), book)
@@ -285,31 +751,34 @@ class _Exchange:
             asks=asks,
         )
         order._status = OrderStatus.CANCELED
-        self._emit_order_update(
-            orders=[get_fastlob_order_response(request.symbol, order)]
-        )
-        self._emit_balance_update(client_id=client_id, symbol=request.symbol)
+        self._emit_order_update(symbol=request.symbol, orders=[(order, None)])
 
-        return get_fastlob_order_response(request.symbol, order)
+        return order_json(request.symbol, order)
 
+    @_command(6, str, CancelReplaceRequest)
     def cancel_replace(self, client_id: str, request: CancelReplaceRequest):
+        responses = self._cancel_replace(client_id, request)
+        if not responses:
+            return
+        return cancel_replace_json(*responses)
+
+    def _cancel_replace(self, client_id: str, request: CancelReplaceRequest):
+        """
+        Cancel and place again, returns the encoded (canceled, new) orders;
+        None if the client has no such open order. The new order is checked
+        first: if it could not be placed, this raises and the order stays.
+        """
         book = self._books[request.symbol]
         orderid = request.cancelOrderId
 
         if orderid:
-            print(book._orders.get(orderid))
             order = book.get_order_by_id(orderid)
         else:
             order = book.get_order_by_client_order_id(request.cancelOrigClientOrderId)
 
-        if not order:
+        if not order or order.client_id() != client_id or not order.valid():
             return
 
-        orderid = order.id()
-        book.cancel(orderid=orderid)
-
-        cancel_res = get_fastlob_order_response(symbol=request.symbol, order=order)
-
         order_params = OrderParams(
             client_id=client_id,
             client_order_id=request.newClientOrderId,
@@ -324,16 +793,28 @@ class _Exchange:
             quantity=request.quantity,
             is_market=request.type == OrderType.MARKET,
         )
+        if not order_params.is_market:
+            self._check_replacement(book, order, order_params)
+
+        book.cancel(orderid=order.id())
+
+        cancel_res = order_json(symbol=request.symbol, order=order)
 
         res = book.process(orderparams=order_params)
-        new_order_id = res.orderid()
-        new_order = book.get_order_by_id(orderid=new_order_id)
+        prices: set[Decimal] = set([order.price()])
+        if not res.success():
+            # only a market order can still fail here, the cancel stands
+            bids, asks = self._collect_bids_asks(prices, book)
+            self._emit_depth_update_for_symbol(symbol=request.symbol, bids=bids, asks=asks)
+            self._emit_order_update(symbol=request.symbol, orders=[(order, None)])
+            raise Exception(f"Order cancel-replace partially failed: {res.messages()[0]}")
 
-        new_res = get_fastlob_order_response(
-            request.symbol, new_order, res, request.type
-        )
+        new_order = book.get_order_by_id(orderid=res.orderid())
+
+        new_res = order_json(request.symbol, new_order, res, request.type)
 
-        prices: set[Decimal] = set([request.price, order.price()])
+        if request.price:
+            prices.add(new_order.price())
         exec_prices = res._execprices
 
         if exec_prices:
@@ -349,78 +830,158 @@ class _Exchange:
         )
 
         order._status = OrderStatus.CANCELED
-        orders = self._collect_orders(request.symbol, prices, book)
-        orders.append(
-            get_fastlob_order_response(
-                symbol=request.symbol, order=new_order, type=request.type
+        orders = self._collect_orders(prices, book)
+        orders.append((new_order, request.type))
+        self._emit_order_update(symbol=request.symbol, orders=orders)
+
+        return cancel_res, new_res
+
+    def _check_replacement(self, book: Orderbook, order: Order, params: OrderParams):
+        """Raise if the limit order of `params` could not be placed once `order` is canceled."""
+        if book.would_cross(params.side, params.price, without=order):
+            raise Exception("The new order would immediately match and take.")
+        if params.side == LobOrderSide.BID:
+            asset_id, needed = order._quote_id, params.quantity * params.price
+        else:
+            asset_id, needed = order._base_id, params.quantity
+        available, _ = ledger.balance(order._account_id, asset_id)
+        released_asset_id, released = order.reservation()
+        if released_asset_id == asset_id:
+            available += released
+        if needed > available:
+            raise Exception("Not enough available balance to place limit order")
+
+    @_command(11, str, AmendOrderRequest)
+    def amend_order(self, client_id: str, request: AmendOrderRequest):
+        """
+        Change the quantity (and price) of an open order of the client. A lower
+        quantity at the same price is applied in place, keeping the order's
+        queue priority; anything else is a cancel/replace, which is rejected
+        (leaving the order as it is) if the new order could not be placed.
+        Unlike Binance, `newQty` is the new open quantity of the order, not
+        its new total quantity: the part already filled does not count.
+        """
+        book = self._books[request.symbol]
+        if request.orderId:
+            order = book._orders.get(request.orderId)
+        else:
+            order = book.get_order_by_client_order_id(request.origClientOrderId)
+        if not order or order.client_id() != client_id or not order.valid():
+            raise Exception("Order does not exist.")
+
+        price = request.price if request.price is not None else order.price()
+        if price != order.price() or request.newQty > order.quantity():
+            canceled, amended = self._cancel_replace(
+                client_id,
+                CancelReplaceRequest(
+                    symbol=request.symbol,
+                    side=OrderSide.BUY if order.side() == LobOrderSide.BID else OrderSide.SELL,
+                    type=OrderType.LIMIT_MAKER,
+                    quantity=request.newQty,
+                    price=price,
+                    cancelOrderId=order.id(),
+                    newClientOrderId=request.newClientOrderId,
+                ),
             )
-        )
-        self._emit_order_update(orders=orders)
-        self._emit_balance_update(client_id=client_id, symbol=request.symbol)
-
-        return CancelReplaceResponse(
-            cancelResult="SUCCESS",
-            newOrderResult="SUCCESS",
-            cancelResponse=cancel_res,
-            newOrderResponse=new_res,
-        )
+            return amend_json(amended, canceled)
 
+        res = book.update(order.id(), request.newQty)
+        if not res.success():
+            raise Exception(res.messages()[0])
+
+        bids, asks = self._collect_bids_asks({order.price()}, book)
+        self._emit_depth_update_for_symbol(symbol=request.symbol, bids=bids, asks=asks)
+        self._emit_order_update(symbol=request.symbol, orders=[(order, None)])
+        return amend_json(order_json(request.symbol, order))
+
+    @_command(7, str, CancelAllRequest)
     def cancel_all(self, client_id: str, request: CancelAllRequest):
         book = self._books[request.symbol]
-        orders = book.get_open_orders_by_client_id(client_id)
-        for order in orders:
-            book.cancel(order.id())
+        orders = book.cancel_orders(client_id)
+        return self._emit_canceled(request.symbol, book, orders)
 
+    @_command(12, str, MassCancelRequest)
+    def mass_cancel(self, client_id: str, request: MassCancelRequest):
+        """
+        Cancel the open orders of the client on one side (both if not given),
+        in a price band and with a client order id starting with a tag, each
+        bound being optional. See `Orderbook.cancel_orders`.
+        """
+        book = self._books[request.symbol]
+        side = None
+        if request.side is not None:
+            side = LobOrderSide.BID if request.side == OrderSide.BUY else LobOrderSide.ASK
+        orders = book.cancel_orders(
+            client_id, side, request.minPrice, request.maxPrice, request.tag
+        )
+        return self._emit_canceled(request.symbol, book, orders)
+
+    def _emit_canceled(self, symbol: str, book: Orderbook, orders: list[Order]):
+        """Send the events of `orders` canceled together, returns the response."""
         prices: set[Decimal] = set([order.price() for order in orders])
 
         bids, asks = self._collect_bids_asks(prices, book)
 
         self._emit_depth_update_for_symbol(
-            symbol=request.symbol,
+            symbol=symbol,
             bids=bids,
             asks=asks,
         )
-        self._emit_order_update(
-            orders=[
-                get_fastlob_order_response(request.symbol, order) for order in orders
-            ]
-        )
-        self._emit_balance_update(client_id=client_id, symbol=request.symbol)
+        self._emit_order_update(symbol=symbol, orders=[(order, None) for order in orders])
 
-        return [get_fastlob_order_response(request.symbol, order) for order in orders]
+        return json_list(order_json(symbol, order) for order in orders)
 
-    def get_order(self, request: OrderQuery):
+    def get_order(self, client_id: str, request: OrderQuery):
 
         book = self._books[request.symbol]
         orderid = request.orderId
         if orderid:
-            order = book.get_order_by_id(orderid)
+            order = book._orders.get(orderid)
         else:
             order = book.get_order_by_client_order_id(request.origClientOrderId)
 
-        if not order:
-            return
+        # order ids are sequential, only the owner may read an order
+        if not order or order.client_id() != client_id:
+            raise Exception("Order does not exist.")
 
-        return get_fastlob_order_response(request.symbol, order)
+        return order_json(request.symbol, order)
 
     def all_orders(self, client_id: str, query: AllOrdersQuery):
         orders = self._books[query.symbol].get_orders_by_client_id(client_id)
-        return [get_fastlob_order_response(query.symbol, order) for order in orders]
+        return json_list(order_json(query.symbol, order) for order in orders)
 
     def all_open_orders(self, client_id: str, query: CurrentOpenOrdersQuery):
+        if query.symbol is None:
+            return json_list(
+                order_json(symbol, order)
+                for symbol, orders in self._client_open_orders(client_id)
+                for order in orders
+            )
         orders = self._books[query.symbol].get_open_orders_by_client_id(client_id)
-        return [get_fastlob_order_response(query.symbol, order) for order in orders]
+        return json_list(order_json(query.symbol, order) for order in orders)
+
+    def open_orders_overview(self, client_id: str) -> str:
+        """
+        All the open orders of the client, the amount it has reserved per
+        asset and its number of open orders per market, in one response. Only
+        the books where the client has resting orders are read.
+        """
+        markets = self._client_open_orders(client_id)
+        reserved = [
+            (asset, amount)
+            for asset, _, amount in ledger.balances(ledger.account_id(client_id))
+            if amount
+        ]
+        return open_orders_overview_json(markets, reserved)
 
-    def get_trades(self, client_id: str, query: TradesQuery) -> list[TradeResponse]:
+    def get_trades(self, client_id: str, query: TradesQuery) -> str:
         book = self._books[query.symbol]
         all_trades = []
-        if query.orderId and not book.has_order_id(query.orderId):
-            return []
-
         if query.orderId:
-            order = book.get_order_by_id(query.orderId)
-            if order:
-                all_trades = order.trades()
+            order = book._orders.get(query.orderId)
+            if not order or order.client_id() != client_id:
+                raise Exception("Order does not exist.")
+            all_trades = order.trades()
         else:
             orders = book.get_orders_by_client_id(client_id)
             for order in orders:
@@ -428,45 +989,46 @@ class _Exchange:
 
         # Optionally filter by time range
         if query.startTime or query.endTime:
-            filtered_trades = []
-            for trade in all_trades:
-                if query.startTime and trade._time < query.startTime:
-                    continue
-                if query.endTime and trade._time > query.endTime:
-                    continue
-                filtered_trades.append(trade)
-            return filtered_trades
+            all_trades = [
+                trade
+                for trade in all_trades
+                if not (query.startTime and trade._time < query.startTime)
+                and not (query.endTime and trade._time > query.endTime)
+            ]
 
-        return [to_trade_response(query.symbol, trade) for trade in all_trades]
+        return json_list(trade_json(query.symbol, trade) for trade in all_trades)
 
     def get_depth(self, query: DepthQuery):
         book = self._books[query.symbol]
-        best_bids = book._bidside.best_limits(query.limit)
-        best_asks = book._askside.best_limits(query.limit)
-
-        bids: list[tuple[str, str]] = [
-            [str(price), str(qty)] for price, qty, _ in best_bids
-        ]
+        top = book.depth(query.limit)
 
-        asks: list[tuple[str, str]] = [
-            [str(price), str(qty)] for price, qty, _ in best_asks
-        ]
+        return depth_json(
+            last_update_id=self._update_id.get(
+                query.symbol, int(time.time() * 1000)
+            ),
+            bids=[(price, qty) for price, qty, _ in top.bids],
+            asks=[(price, qty) for price, qty, _ in top.asks],
+        )
 
-        return DepthResponse(
-            lastUpdateId=self._update_id.get(query.symbol, int(time.time() * 1000)),
-            bids=bids,
-            asks=asks,
+    def book_ticker(self, query: BookTickerQuery) -> str:
+        """Best bid and ask of one symbol, or of every symbol, from the books' published snapshots."""
+        if query.symbol is not None:
+            return book_ticker_json(query.symbol, self._books[query.symbol].top())
+        return json_list(
+            book_ticker_json(symbol, book.top())
+            for symbol, book in list(self._books.items())
         )
 
     def account(self, client_id: str):
-        account = get_account(client_id)
         balances = [
             {
-                "asset": balance.asset,
-                "free": str(balance.available),
-                "locked": str(balance.reserved),
+                "asset": asset,
+                "free": str(available),
+                "locked": str(reserved),
             }
-            for balance in account.balances.values()
+            for asset, available, reserved in ledger.balances(
+                ledger.account_id(client_id)
+            )
         ]
 
         return {
@@ -493,11 +1055,18 @@ class _Exchange:
             "uid": int(time.time()),
         }
 
+    @_command(8)
     def reset(self):
+        if self._shared_top is not None:
+            for book in self._books.values():
+                book.set_top_listener(None)
+            self._shared_top.clear()
         self._books = {}
         self._depth_listeners = {}
         self._user_listeners = {}
         self._update_id = {}
+        self._client_symbols = {}
+        self._books_version += 1
         reset_accounts()
 
     def klines(self, query: KlineQuery):
@@ -593,3 +1162,24 @@ class _Exchange:
 
 
 exchange = _Exchange()
+# the exchange for async callers, running its methods on the engine thread once started
+async_exchange = AsyncExchange(exchange)
+
+registry.gauge(
+    "clob_ws_subscribers",
+    "Websocket subscribers per stream and symbol.",
+    ("stream", "symbol"),
+    collect=exchange._subscriber_counts,
+)
+registry.gauge(
+    "clob_ws_queue_length",
+    "Events waiting to be sent, per subscriber.",
+    ("stream", "symbol", "subscriber"),
+    collect=lambda: exchange._subscriber_series(SubscriberQueue.qsize),
+)
+registry.gauge(
+    "clob_ws_subscriber_dropped",
+    "Events dropped for a subscriber since it subscribed.",
+    ("stream", "symbol", "subscriber"),
+    collect=lambda: exchange._subscriber_series(lambda queue: queue.dropped),
+)
@@ -0,0 +1,79 @@
+"""
+Async facade of the exchange, keeping the matching off the event loop.
+
+`await async_exchange.<method>(*args)` runs `exchange.<method>(*args)` on a
+dedicated engine thread and returns its result (or raises its error), so a
+long sweep or a klines rescan does not hold up websocket delivery or the other
+requests. All calls run on that one thread, in the order they were made: the
+exchange state, the ledger and the journal see the same sequence of commands
+as when they ran on the loop, and replay stays deterministic.
+
+The events a call produces for the listener queues (depth diffs, execution
+reports) are collected while it runs and handed to the event loop together
+with `call_soon_threadsafe` once it returns, before its result, see
+`_Exchange._deliver`.
+
+Until `start` is called (and after `stop`), calls run inline on the caller's
+thread, as the exchange methods themselves would.
+"""
+
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+def _deliver_all(puts: list[Callable[[], None]]):
+    for put in puts:
+        put()
+
+
+class AsyncExchange:
+    _executor: Optional[ThreadPoolExecutor]
+    _loop: Optional[asyncio.AbstractEventLoop]
+
+    def __init__(self, exchange):
+        self._exchange = exchange
+        self._executor = None
+        self._loop = None
+
+    def start(self):
+        """Start the engine thread, events go to the running loop."""
+        if self._executor is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine")
+
+    def stop(self):
+        """Wait for the calls made so far, then stop the engine thread."""
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        executor.shutdown(wait=True)
+
+    def is_running(self) -> bool:
+        return self._executor is not None
+
+    async def run(self, fn: Callable, *args):
+        """`fn(*args)` on the engine thread, for work on the exchange state that is not a method of it."""
+        if self._executor is None:
+            return fn(*args)
+        return await self._loop.run_in_executor(self._executor, self._call, fn, args)
+
+    def _call(self, fn: Callable, args: tuple):
+        exchange = self._exchange
+        exchange._outbox = []
+        try:
+            return fn(*args)
+        finally:
+            outbox, exchange._outbox = exchange._outbox, None
+            if outbox:
+                self._loop.call_soon_threadsafe(_deliver_all, outbox)
+
+    def __getattr__(self, name: str):
+        method = getattr(self._exchange, name)
+        if inspect.iscoroutinefunction(method):
+            # already async (wait_durable), runs on the loop
+            return method
+        return functools.partial(self.run, method)
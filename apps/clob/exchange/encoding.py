@@ -0,0 +1,265 @@
+"""
+JSON encoders for the order, fill, trade, depth and account payloads.
+
+Every REST response and websocket event about orders goes through here: the
+payload is written as JSON text in one pass from the engine objects, without
+building pydantic models or intermediate dicts. The pydantic models in
+`types.py` still describe the shapes.
+"""
+
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii as _quote
+from typing import Iterable, Optional
+
+from fastlob.enums import OrderSide as LobOrderSide
+from fastlob.order import Order
+from fastlob.result import ExecutionResult
+from fastlob.lob import TopOfBook
+from fastlob.trade import Trade
+from account import ledger
+from .types import OrderType
+
+_PRICE_CACHE_SIZE = 65536
+_price_strs: dict[Decimal, str] = {}
+
+
+def price_str(price: Decimal) -> str:
+    """
+    `str(price)`, cached. Books hold a bounded set of quantized price levels,
+    so the same few strings are produced over and over for depth and orders.
+    """
+    s = _price_strs.get(price)
+    if s is None:
+        if len(_price_strs) >= _PRICE_CACHE_SIZE:
+            _price_strs.clear()
+        s = _price_strs[price] = str(price)
+    return s
+
+
+def json_list(items: Iterable[str]) -> str:
+    """Join already encoded JSON values into a JSON array."""
+    return "[" + ",".join(items) + "]"
+
+
+def _side(order: Order) -> str:
+    return "BUY" if order.side() == LobOrderSide.BID else "SELL"
+
+
+def _fills(result: ExecutionResult) -> str:
+    exec_prices = result._execprices
+    if not exec_prices:
+        return "[]"
+    return json_list(
+        '{"price":"%s","qty":"%s","commission":"0","commissionAsset":"USDT","tradeId":0}'
+        % (price_str(price), qty)
+        for price, qty in exec_prices.items()
+    )
+
+
+def order_json(
+    symbol: str,
+    order: Order,
+    result: Optional[ExecutionResult] = None,
+    type: Optional[OrderType] = None,
+) -> str:
+    """Encode an order as `OrderResponseResult`, or `OrderResponseFull` when `result` is given."""
+    client_order_id = _quote(order.client_order_id())
+    fills = ',"fills":' + _fills(result) if result else ""
+    return (
+        '{"symbol":%s,"orderId":%d,"orderListId":-1,"clientOrderId":%s,"transactTime":%d,'
+        '"clientId":%s,"origClientOrderId":%s,"price":"%s","origQty":"%s","executedQty":"%s",'
+        '"origQuoteOrderQty":"%s","cummulativeQuoteQty":"%s","status":"%s","timeInForce":"GTC",'
+        '"type":"%s","side":"%s","selfTradePreventionMode":"NONE"%s}'
+        % (
+            _quote(symbol),
+            order.id(),
+            client_order_id,
+            order._time,
+            _quote(order.client_id()),
+            client_order_id,
+            price_str(order.price()),
+            order._org_quantity,
+            order._org_quantity - order._quantity,
+            order._orig_quote_qty,
+            order._cummulative_quote_qty,
+            order.status().value,
+            type.value if type else OrderType.LIMIT_MAKER.value,
+            _side(order),
+            fills,
+        )
+    )
+
+
+def cancel_replace_json(cancel_response: str, new_order_response: str) -> str:
+    """Encode a `CancelReplaceResponse` from the two encoded order responses."""
+    return (
+        '{"cancelResult":"SUCCESS","newOrderResult":"SUCCESS",'
+        '"cancelResponse":%s,"newOrderResponse":%s}'
+        % (cancel_response, new_order_response)
+    )
+
+
+def amend_json(amended_order: str, canceled_order: Optional[str] = None) -> str:
+    """
+    Encode the response of an order amend from the encoded amended order, and
+    the canceled one when the amend was a cancel/replace (losing the priority).
+    """
+    if canceled_order is None:
+        return '{"keepPriority":true,"amendedOrder":%s}' % amended_order
+    return '{"keepPriority":false,"amendedOrder":%s,"canceledOrder":%s}' % (
+        amended_order,
+        canceled_order,
+    )
+
+
+def open_orders_overview_json(
+    markets: list[tuple[str, list[Order]]], reserved: list[tuple[str, Decimal]]
+) -> str:
+    """Encode the open orders of a client across markets, its reserved amounts and order counts."""
+    return '{"openOrders":%s,"reserved":%s,"markets":%s}' % (
+        json_list(
+            order_json(symbol, order) for symbol, orders in markets for order in orders
+        ),
+        json_list(
+            '{"asset":%s,"amount":"%s"}' % (_quote(asset), amount)
+            for asset, amount in reserved
+        ),
+        json_list(
+            '{"symbol":%s,"openOrders":%d}' % (_quote(symbol), len(orders))
+            for symbol, orders in markets
+        ),
+    )
+
+
+def mass_quote_json(
+    symbol: str, placed: list[Order], amended: list[Order], canceled: list[Order]
+) -> str:
+    """Encode the response of a mass quote: the orders it placed, reduced and canceled."""
+    return '{"symbol":%s,"placed":%s,"amended":%s,"canceled":%s}' % (
+        _quote(symbol),
+        json_list(order_json(symbol, order) for order in placed),
+        json_list(order_json(symbol, order) for order in amended),
+        json_list(order_json(symbol, order) for order in canceled),
+    )
+
+
+def execution_report_json(
+    symbol: str, order: Order, type: Optional[OrderType] = None
+) -> str:
+    """Encode a Binance-style `executionReport` user stream event for `order`."""
+    status = order.status().value
+    client_order_id = _quote(order.client_order_id())
+    t = order._time
+    return (
+        '{"e":"executionReport","E":%d,"s":%s,"c":%s,"S":"%s","o":"%s","f":"GTC",'
+        '"q":"%s","p":"%s","P":"0.00000000","F":"0.00000000","g":-1,"C":%s,"x":"%s",'
+        '"X":"%s","r":"NONE","i":%d,"l":"0.00000000","z":"%s","L":"0.00000000","n":"0",'
+        '"N":null,"T":%d,"t":-1,"v":0,"I":%d,"w":true,"m":false,"M":false,"O":%d,"Z":"%s",'
+        '"Y":"0.00000000","Q":"%s","W":%d,"V":"NONE"}'
+        % (
+            t,
+            _quote(symbol),
+            client_order_id,
+            _side(order),
+            type.value if type else OrderType.LIMIT_MAKER.value,
+            order._org_quantity,
+            price_str(order.price()),
+            client_order_id,
+            "TRADE" if status in ("FILLED", "PARTIAL_FILLED") else status,
+            status,
+            order.id(),
+            order._org_quantity - order._quantity,
+            t,
+            order.id(),
+            t,
+            order._cummulative_quote_qty,
+            order._orig_quote_qty,
+            t,
+        )
+    )
+
+
+def trade_json(symbol: str, trade: Trade) -> str:
+    """Encode a trade as `TradeResponse`."""
+    return (
+        '{"symbol":%s,"id":%d,"orderId":%d,"orderListId":-1,"price":"%s","qty":"%s",'
+        '"quoteQty":"%s","comission":"0","comissionAsset":%s,"time":%d,"isBuyer":%s,'
+        '"isMaker":%s,"isBestMatch":true}'
+        % (
+            _quote(symbol),
+            trade.id(),
+            trade.order_id(),
+            price_str(trade.price()),
+            trade.quantity(),
+            trade.quote_qty(),
+            _quote(symbol.split("USDT")[0]),
+            trade._time,
+            "true" if trade.is_buyer() else "false",
+            "true" if trade.is_maker() else "false",
+        )
+    )
+
+
+def levels_json(levels: Iterable[tuple[Decimal, Decimal]]) -> str:
+    """Encode (price, quantity) pairs as a list of `[price, qty]` string pairs."""
+    return json_list('["%s","%s"]' % (price_str(price), qty) for price, qty in levels)
+
+
+def book_ticker_json(symbol: str, top: TopOfBook) -> str:
+    """Encode a Binance-style `bookTicker` from a top-of-book snapshot."""
+    bid = top.best_bid() or (None, Decimal("0"), 0)
+    ask = top.best_ask() or (None, Decimal("0"), 0)
+    return '{"symbol":%s,"bidPrice":"%s","bidQty":"%s","askPrice":"%s","askQty":"%s"}' % (
+        _quote(symbol),
+        price_str(bid[0]) if bid[0] is not None else "0",
+        bid[1],
+        price_str(ask[0]) if ask[0] is not None else "0",
+        ask[1],
+    )
+
+
+def depth_json(
+    last_update_id: int,
+    bids: Iterable[tuple[Decimal, Decimal]],
+    asks: Iterable[tuple[Decimal, Decimal]],
+) -> str:
+    """Encode a `DepthResponse` snapshot."""
+    return '{"lastUpdateId":%d,"bids":%s,"asks":%s}' % (
+        last_update_id,
+        levels_json(bids),
+        levels_json(asks),
+    )
+
+
+def depth_update_json(
+    symbol: str,
+    event_time: int,
+    first_update_id: int,
+    final_update_id: int,
+    bids: Iterable[tuple[Decimal, Decimal]],
+    asks: Iterable[tuple[Decimal, Decimal]],
+) -> str:
+    """Encode a Binance-style `depthUpdate` stream event."""
+    return '{"e":"depthUpdate","E":%d,"s":%s,"U":%d,"u":%d,"b":%s,"a":%s}' % (
+        event_time,
+        _quote(symbol),
+        first_update_id,
+        final_update_id,
+        levels_json(bids),
+        levels_json(asks),
+    )
+
+
+def account_position_json(account_id: int, assets: list[str], now: int) -> str:
+    """Encode an `outboundAccountPosition` user stream event for `assets`."""
+    balances = []
+    for asset in assets:
+        available, reserved = ledger.balance(account_id, ledger.asset_id(asset))
+        balances.append(
+            '{"a":%s,"f":"%s","l":"%s"}' % (_quote(asset), available, reserved)
+        )
+    return '{"e":"outboundAccountPosition","E":%d,"u":%d,"B":%s}' % (
+        now,
+        now,
+        json_list(balances),
+    )
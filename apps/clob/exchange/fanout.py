@@ -0,0 +1,83 @@
+"""
+Health of the websocket fan-out.
+
+Events are pushed by the exchange into one queue per subscriber and sent by
+that subscriber's forwarder task. A `SubscriberQueue` keeps each event with
+the time the engine made it (`put_event`), before it is handed from the
+engine thread to the event loop, so the forwarder measures the whole delivery
+lag (engine event to websocket send) of every event it sends, and counts the
+events dropped for its subscriber. Slow consumers show up as long queues,
+drops and a high lag on some subscribers only; a slow engine or a busy loop as
+a high lag on all.
+"""
+
+import asyncio
+import itertools
+import time
+from typing import Optional
+
+from metrics import registry
+
+STREAM_DEPTH = "depth"
+STREAM_USER = "user"
+
+delivery_lag = registry.latency(
+    "clob_ws_delivery_lag_seconds",
+    "Time from an engine event to its websocket send, per stream.",
+    ("stream",),
+)
+events_dropped = registry.counter(
+    "clob_ws_events_dropped_total",
+    "Events dropped for subscribers whose queue was full.",
+    ("stream", "symbol"),
+)
+
+_subscriber_ids = itertools.count(1)
+
+
+class SubscriberQueue(asyncio.Queue):
+    """
+    Listener queue of one websocket subscriber, see the module docstring.
+    Items are (event time, event) pairs, put with `put_event` and got with
+    `get_event`; `enqueued_ns` is the event time of the last event got.
+    """
+
+    stream: str
+    symbol: str
+    subscriber: str
+    enqueued_ns: int
+    dropped: int
+
+    def __init__(self, stream: str, symbol: str = "", subscriber: str = "", maxsize: int = 0):
+        super().__init__(maxsize)
+        self.stream = stream
+        self.symbol = symbol
+        self.subscriber = subscriber or f"{stream}-{next(_subscriber_ids)}"
+        self.enqueued_ns = 0
+        self.dropped = 0
+
+    async def get_event(self):
+        self.enqueued_ns, event = await self.get()
+        return event
+
+    def delivered(self):
+        """Record the delivery lag of the last item got, once sent."""
+
+        delivery_lag.observe(time.perf_counter_ns() - self.enqueued_ns, self.stream)
+
+
+def put_event(queue: asyncio.Queue, event, event_ns: Optional[int] = None):
+    """
+    Put `event`, made at `event_ns` (`time.perf_counter_ns()`, now if not
+    given), on a listener queue. Raises `asyncio.QueueFull` as `put_nowait`.
+    """
+    if isinstance(queue, SubscriberQueue):
+        queue.put_nowait((event_ns if event_ns is not None else time.perf_counter_ns(), event))
+    else:
+        queue.put_nowait(event)
+
+
+def count_dropped(queue: asyncio.Queue, stream: str, symbol: str = "", n: int = 1):
+    events_dropped.inc(stream, symbol, amount=n)
+    if isinstance(queue, SubscriberQueue):
+        queue.dropped += n
@@ -0,0 +1,229 @@
+"""
+Standalone engine protocol: the exchange runs in its own process (`engine`)
+behind a Unix domain socket and the HTTP workers (`gateway_app`) call it
+through an `EngineClient`, so that HTTP parsing and JSON work run next to the
+matching instead of competing with it for the GIL.
+
+A call names an `_Exchange` method and carries its arguments flattened as in
+the journal, requests models included (see `journal.encode_values`). The
+reply is the method's result, encoded as the JSON body of the API response,
+or the error it raised. Commands use their journal op as method id and are
+answered once durable; any number of calls can be in flight on a connection,
+replies come back in completion order.
+
+Frames (little endian):
+
+    <u32 length> <payload>
+    request:  <u32 call id> <u8 method id> <u16 value count> <values...>
+    reply:    <u32 call id> <u8 status: 0 ok, 1 error> <utf-8 body>
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import struct
+from typing import Optional
+
+from . import (
+    _COMMANDS,
+    _flatten_args,
+    _unflatten_args,
+    OrderQuery,
+    AllOrdersQuery,
+    CurrentOpenOrdersQuery,
+    TradesQuery,
+    DepthQuery,
+    BookTickerQuery,
+    KlineQuery,
+)
+from .async_exchange import AsyncExchange
+from .journal import MAX_RECORD_SIZE, decode_values, encode_values
+
+# path of the socket the engine listens on
+ENGINE_SOCKET = os.environ.get("CLOB_ENGINE_SOCKET", "/tmp/clob-engine.sock")
+
+_LENGTH = struct.Struct("<I")
+_REQUEST = struct.Struct("<IBH")
+_REPLY = struct.Struct("<IB")
+
+_OK = 0
+_ERROR = 1
+
+# queries: method id -> (name, argument kinds), ids clear of the journal ops
+_QUERIES: dict[int, tuple[str, tuple[type, ...]]] = {
+    64: ("get_order", (str, OrderQuery)),
+    65: ("all_orders", (str, AllOrdersQuery)),
+    66: ("all_open_orders", (str, CurrentOpenOrdersQuery)),
+    67: ("open_orders_overview", (str,)),
+    68: ("get_trades", (str, TradesQuery)),
+    69: ("get_depth", (DepthQuery,)),
+    70: ("book_ticker", (BookTickerQuery,)),
+    71: ("klines", (KlineQuery,)),
+    72: ("account", (str,)),
+    73: ("symbols", ()),
+}
+# method id -> (name, argument kinds, answered once durable); commands keep their journal op
+METHODS: dict[int, tuple[str, tuple[type, ...], bool]] = {
+    **{op: (method.__name__, kinds, True) for op, (method, kinds) in _COMMANDS.items()},
+    **{op: (name, kinds, False) for op, (name, kinds) in _QUERIES.items()},
+}
+METHOD_IDS: dict[str, int] = {name: op for op, (name, _, _) in METHODS.items()}
+
+
+class EngineError(Exception):
+    """The engine failed the call (the message is its error), or could not be reached."""
+
+
+def encode_request(call_id: int, method_id: int, values: list) -> bytes:
+    payload = _REQUEST.pack(call_id, method_id, len(values)) + encode_values(values)
+    if len(payload) > MAX_RECORD_SIZE:
+        raise EngineError("request too large")
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def encode_reply(call_id: int, ok: bool, body: str) -> bytes:
+    data = body.encode("utf-8")
+    return _LENGTH.pack(_REPLY.size + len(data)) + _REPLY.pack(call_id, _OK if ok else _ERROR) + data
+
+
+def _result_json(result) -> str:
+    """JSON body of a method result: methods mostly return it encoded already."""
+    if isinstance(result, str):
+        return result
+    return json.dumps(result, separators=(",", ":"), default=str)
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+class EngineServer:
+    """
+    Serves the calls of the gateways to `exchange` on the socket at `path`.
+    The calls run on the engine thread once `exchange` is started, while the
+    event loop keeps reading and answering.
+    """
+
+    def __init__(self, exchange: AsyncExchange, path: str = ENGINE_SOCKET):
+        self._exchange = exchange
+        self._path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._calls: set[asyncio.Task] = set()
+
+    async def start(self):
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._server = await asyncio.start_unix_server(self._serve, self._path)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                payload = await _read_frame(reader)
+                call_id, method_id, count = _REQUEST.unpack_from(payload, 0)
+                # run in the order received: each call is handed to the engine thread when its task starts
+                call = asyncio.create_task(
+                    self._call(writer, call_id, method_id, decode_values(payload, _REQUEST.size, count))
+                )
+                self._calls.add(call)
+                call.add_done_callback(self._calls.discard)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _call(self, writer: asyncio.StreamWriter, call_id: int, method_id: int, values: list):
+        try:
+            name, kinds, durable = METHODS[method_id]
+            result = await getattr(self._exchange, name)(*_unflatten_args(kinds, values))
+            body = _result_json(result)
+            if durable:
+                await self._exchange.wait_durable()
+        except Exception as e:
+            reply = encode_reply(call_id, False, str(e))
+        else:
+            reply = encode_reply(call_id, True, body)
+        if not writer.is_closing():
+            writer.write(reply)
+
+
+class EngineClient:
+    """
+    Calls the engine listening at `path` over one connection, opened on the
+    first call and again on the next call after it is lost. For one event loop.
+    """
+
+    def __init__(self, path: str = ENGINE_SOCKET):
+        self._path = path
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._connecting = asyncio.Lock()
+
+    async def call(self, name: str, *args) -> str:
+        """JSON body of `exchange.<name>(*args)` run by the engine, raises `EngineError` with its error if it failed."""
+        method_id = METHOD_IDS[name]
+        if self._writer is None:
+            await self._connect()
+        call_id = next(self._ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        try:
+            self._writer.write(encode_request(call_id, method_id, _flatten_args(args)))
+        except Exception:
+            self._pending.pop(call_id, None)
+            raise
+        ok, body = await future
+        if not ok:
+            raise EngineError(body)
+        return body
+
+    async def _connect(self):
+        async with self._connecting:
+            if self._writer is not None:
+                return
+            try:
+                reader, writer = await asyncio.open_unix_connection(self._path)
+            except OSError as e:
+                raise EngineError(f"engine unreachable at {self._path}: {e}")
+            self._writer = writer
+            self._receiver = asyncio.create_task(self._receive(reader, writer))
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                payload = await _read_frame(reader)
+                call_id, status = _REPLY.unpack_from(payload, 0)
+                future = self._pending.pop(call_id, None)
+                if future is not None and not future.done():
+                    future.set_result((status == _OK, payload[_REPLY.size :].decode("utf-8")))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(EngineError("connection to the engine lost"))
+
+    async def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+            try:
+                await self._receiver
+            except asyncio.CancelledError:
+                pass
+            self._receiver = None
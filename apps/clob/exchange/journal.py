@@ -0,0 +1,325 @@
+"""
+Write-ahead journal of the exchange commands.
+
+Every command that changes the exchange state is appended to the journal
+before it runs, together with the time it ran at. Replaying the journal on an
+empty exchange rebuilds the same books, balances and ids, since the engine is
+deterministic once the clock is pinned to the journaled time.
+
+Records are written and fsynced by a background thread. Appends made while a
+fsync is in progress are written together by the next one (group commit), so
+one fsync covers as many commands as arrived in the meantime. Callers wait for
+their record to be durable with `wait_durable` before acknowledging.
+
+Record layout (little endian):
+
+    <u32 payload length> <u32 crc32 of payload> <payload>
+    payload: <u8 op> <i64 time ms> <u16 value count> <values...>
+    value:   <u8 tag> <data>
+
+A crash can leave a partially written record at the end of the file; it fails
+the length or crc check and is truncated away when the journal is opened.
+
+Once the state is saved in a snapshot, `restart` empties the journal down to a
+single checkpoint record naming the snapshot, so that recovery only replays
+what came after it.
+"""
+
+import asyncio
+import os
+import struct
+import threading
+import zlib
+from decimal import Decimal
+from enum import Enum
+from typing import Optional
+
+_HEADER = struct.Struct("<II")
+_PAYLOAD_HEADER = struct.Struct("<BqH")
+_INT = struct.Struct("<q")
+_STR_LEN = struct.Struct("<H")
+
+_TAG_NONE = 0
+_TAG_INT = 1
+_TAG_STR = 2
+_TAG_DECIMAL = 3
+_TAG_TRUE = 4
+_TAG_FALSE = 5
+
+MAX_RECORD_SIZE = 1 << 20
+
+Value = None | int | str | Decimal | bool
+
+
+class JournalError(Exception):
+    pass
+
+
+def encode_values(values: list[Value]) -> bytes:
+    """Encode values as in a record payload, without their count."""
+
+    parts = []
+    for value in values:
+        if isinstance(value, Enum):
+            value = value.value
+        if value is None:
+            parts.append(bytes((_TAG_NONE,)))
+        elif value is True:
+            parts.append(bytes((_TAG_TRUE,)))
+        elif value is False:
+            parts.append(bytes((_TAG_FALSE,)))
+        elif isinstance(value, int):
+            parts.append(bytes((_TAG_INT,)) + _INT.pack(value))
+        elif isinstance(value, (str, Decimal)):
+            data = str(value).encode("utf-8")
+            if len(data) > 0xFFFF:
+                raise JournalError("journal string value too long")
+            tag = _TAG_STR if isinstance(value, str) else _TAG_DECIMAL
+            parts.append(bytes((tag,)) + _STR_LEN.pack(len(data)) + data)
+        else:
+            raise JournalError(f"cannot journal value of type {type(value)}")
+    return b"".join(parts)
+
+
+def decode_values(payload: bytes, offset: int, count: int) -> list[Value]:
+    """Decode `count` values encoded by `encode_values` at `offset` of `payload`."""
+
+    values: list[Value] = []
+    for _ in range(count):
+        tag = payload[offset]
+        offset += 1
+        if tag == _TAG_NONE:
+            values.append(None)
+        elif tag == _TAG_TRUE:
+            values.append(True)
+        elif tag == _TAG_FALSE:
+            values.append(False)
+        elif tag == _TAG_INT:
+            values.append(_INT.unpack_from(payload, offset)[0])
+            offset += _INT.size
+        elif tag in (_TAG_STR, _TAG_DECIMAL):
+            (n,) = _STR_LEN.unpack_from(payload, offset)
+            offset += _STR_LEN.size
+            text = payload[offset : offset + n].decode("utf-8")
+            offset += n
+            values.append(text if tag == _TAG_STR else Decimal(text))
+        else:
+            raise JournalError(f"unknown value tag {tag}")
+    return values
+
+
+def encode_record(op: int, time_ms: int, values: list[Value]) -> bytes:
+    """Encode one command into a framed journal record."""
+
+    payload = _PAYLOAD_HEADER.pack(op, time_ms, len(values)) + encode_values(values)
+    if len(payload) > MAX_RECORD_SIZE:
+        raise JournalError("journal record too large")
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_payload(payload: bytes) -> tuple[int, int, list[Value]]:
+    """Decode a record payload into (op, time ms, values)."""
+
+    op, time_ms, count = _PAYLOAD_HEADER.unpack_from(payload, 0)
+    return op, time_ms, decode_values(payload, _PAYLOAD_HEADER.size, count)
+
+
+def read_records(path: str) -> tuple[list[tuple[int, int, list[Value]]], int]:
+    """
+    Read every complete record of the journal at `path`. Returns them with the
+    offset where the valid part of the file ends (anything after it is a torn
+    or corrupted tail).
+    """
+
+    records = []
+    if not os.path.exists(path):
+        return records, 0
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        if length > MAX_RECORD_SIZE or start + length > len(data):
+            break
+        payload = data[start : start + length]
+        if zlib.crc32(payload) != crc:
+            break
+        try:
+            records.append(decode_payload(payload))
+        except (JournalError, struct.error, UnicodeDecodeError, IndexError):
+            break
+        offset = start + length
+    return records, offset
+
+
+class Journal:
+    """Append-only command journal with a group-committing writer thread, see module docstring."""
+
+    _path: str
+    _fsync: bool
+    _file: object
+    _cond: threading.Condition
+    _pending: list[bytes]
+    _appended: int
+    _durable: int
+    _waiters: list[tuple[int, asyncio.AbstractEventLoop, asyncio.Future]]
+    _error: Optional[BaseException]
+    _closed: bool
+    _recovered: list[tuple[int, int, list[Value]]]
+    _file_records: int
+
+    def __init__(self, path: str, fsync: bool = True):
+        """
+        Open the journal at `path` for appending. The records already in it are
+        kept for `take_recovered`; a torn tail left by a crash is truncated.
+        """
+
+        self._path = path
+        self._fsync = fsync
+        self._recovered, valid_end = read_records(path)
+        self._file_records = len(self._recovered)
+        self._file = open(path, "ab")
+        if self._file.tell() != valid_end:
+            self._file.truncate(valid_end)
+            self._file.seek(valid_end)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = 0
+        self._durable = 0
+        self._waiters = []
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="journal-writer", daemon=True
+        )
+        self._thread.start()
+
+    def path(self) -> str:
+        return self._path
+
+    def take_recovered(self) -> list[tuple[int, int, list[Value]]]:
+        """The (op, time ms, values) records found when opening, to replay. Only returned once."""
+
+        records, self._recovered = self._recovered, []
+        return records
+
+    def append(self, op: int, time_ms: int, values: list[Value]) -> int:
+        """Queue a command for writing. Returns its sequence number for `wait_durable`."""
+
+        record = encode_record(op, time_ms, values)
+        with self._cond:
+            if self._error is not None:
+                raise JournalError(f"journal unavailable: {self._error}")
+            if self._closed:
+                raise JournalError("journal is closed")
+            self._pending.append(record)
+            self._appended += 1
+            self._file_records += 1
+            self._cond.notify()
+            return self._appended
+
+    def last_seq(self) -> int:
+        """Sequence number of the last appended record."""
+
+        return self._appended
+
+    async def wait_durable(self, seq: Optional[int] = None):
+        """Wait until record `seq` (by default the last appended one) is on disk."""
+
+        if seq is None:
+            seq = self._appended
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._error is not None:
+                raise JournalError(f"journal unavailable: {self._error}")
+            if self._durable >= seq:
+                return
+            future = loop.create_future()
+            self._waiters.append((seq, loop, future))
+        await future
+
+    def sync(self):
+        """Block until everything appended so far is on disk."""
+
+        with self._cond:
+            seq = self._appended
+            while self._durable < seq and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise JournalError(f"journal unavailable: {self._error}")
+
+    def record_count(self) -> int:
+        """Number of records in the journal file, including the pending ones."""
+
+        return self._file_records
+
+    def restart(self, op: int, time_ms: int, values: list[Value]):
+        """
+        Drop every record, once the state they lead to is saved elsewhere
+        (snapshot), and start over with the given checkpoint record. Must not
+        race with `append`.
+        """
+
+        record = encode_record(op, time_ms, values)
+        self.sync()
+        with self._cond:
+            if self._pending:
+                raise JournalError("journal restarted while commands are appended")
+            self._file.truncate(0)
+            self._file.seek(0)
+            self._file.write(record)
+            self._file.flush()
+            if self._fsync:
+                os.fsync(self._file.fileno())
+            self._file_records = 1
+
+    def close(self):
+        """Write what is pending and stop the writer thread."""
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                seq = self._appended
+            try:
+                self._file.write(b"".join(batch))
+                self._file.flush()
+                if self._fsync:
+                    os.fsync(self._file.fileno())
+            except BaseException as e:
+                # fail every waiter, and every later append, rather than ack lost writes
+                with self._cond:
+                    self._error = e
+                    waiters, self._waiters = self._waiters, []
+                    self._cond.notify_all()
+                for _, loop, future in waiters:
+                    loop.call_soon_threadsafe(_fail, future, e)
+                return
+            with self._cond:
+                self._durable = seq
+                ready = [w for w in self._waiters if w[0] <= seq]
+                self._waiters = [w for w in self._waiters if w[0] > seq]
+                self._cond.notify_all()
+            for _, loop, future in ready:
+                loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _fail(future: asyncio.Future, e: BaseException):
+    if not future.done():
+        future.set_exception(JournalError(f"journal write failed: {e}"))
@@ -0,0 +1,277 @@
+"""
+Replay recorded order flow through the engine, without the HTTP layer.
+
+The recorded flow is a command journal (see `journal`): every command that
+reached the exchange, with the time it ran at. Replaying it on a fresh
+exchange, optionally started from a snapshot, rebuilds exactly the same state,
+so a journal copied from production reproduces an incident locally, and the
+same journal replayed before and after an engine change benchmarks it on real
+flow.
+
+Commands run as fast as possible by default. With a speed factor they are
+spaced like when they were recorded (divided by the factor), and the lag
+behind that schedule is measured too.
+
+The report gives the throughput, latency percentiles per command and a
+checksum of the final state (books, orders, trades, balances and id
+sequences): two replays ending with the same checksum ended in the same state.
+
+Usage, from `apps/clob`:
+
+    python -m exchange.replay JOURNAL [--speed X] [--snapshot PATH] [--json]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from decimal import Decimal
+from typing import Optional
+
+from account import ledger
+from fastlob.utils import order_ids, trade_ids
+from metrics import Histogram
+
+from . import _CHECKPOINT_OP, _Exchange, command_name, exchange as default_exchange
+from .journal import read_records
+
+
+def _normalized(value) -> str:
+    if isinstance(value, Decimal):
+        # 1.50 and 1.5 are the same amount, a restored order may hold either
+        return str(value.normalize()) if value else "0"
+    if hasattr(value, "value"):  # enums
+        return str(value.value)
+    return str(value)
+
+
+def state_checksum(exchange: _Exchange) -> str:
+    """sha256 of the whole exchange state, independent of how it was built."""
+
+    digest = hashlib.sha256()
+
+    def put(*values):
+        digest.update("|".join(_normalized(v) for v in values).encode("utf-8"))
+        digest.update(b"\n")
+
+    for symbol in sorted(exchange._books):
+        book = exchange._books[symbol]
+        put("book", symbol, exchange._update_id[symbol])
+        for order in sorted(book.orders(), key=lambda o: o.id()):
+            put(
+                "order",
+                order.id(),
+                order.client_id(),
+                order.client_order_id(),
+                order.side(),
+                order.is_market(),
+                order.otype(),
+                order.status(),
+                order.price(),
+                order._org_quantity,
+                order.quantity(),
+                order._orig_quote_qty,
+                order._cummulative_quote_qty,
+                order.expiry(),
+                order._time,
+            )
+            for trade in order.trades():
+                put(
+                    "trade",
+                    trade.id(),
+                    trade.order_id(),
+                    trade.price(),
+                    trade.quantity(),
+                    trade.quote_qty(),
+                    trade.is_buyer(),
+                    trade.is_maker(),
+                    trade._time,
+                )
+        for side, price, queue in book.resting_queues():
+            put("level", side, price, *(order.id() for order in queue))
+
+    asset_names, accounts = ledger.export_accounts()
+    for client_id, assets, amounts in sorted(accounts, key=lambda a: a[0]):
+        put("account", client_id)
+        for i, asset_id in enumerate(assets):
+            put("balance", asset_names[asset_id], amounts[2 * i], amounts[2 * i + 1])
+
+    put("ids", order_ids.peek(), trade_ids.peek())
+    return digest.hexdigest()
+
+
+class ReplayResult:
+    """Measurements of a replay, see `replay`."""
+
+    commands: int
+    failed: int
+    elapsed_s: float
+    latency: Histogram
+    latency_by_command: dict[str, Histogram]
+    schedule_lag: Optional[Histogram]
+    checksum: str
+
+    def __init__(self):
+        self.commands = 0
+        self.failed = 0
+        self.elapsed_s = 0.0
+        self.latency = Histogram()
+        self.latency_by_command = {}
+        self.schedule_lag = None
+        self.checksum = ""
+
+    def throughput(self) -> float:
+        """Commands per second."""
+
+        return self.commands / self.elapsed_s if self.elapsed_s else 0.0
+
+    def to_json(self) -> dict:
+        """The measurements, latencies in microseconds."""
+
+        result = {
+            "commands": self.commands,
+            "failed": self.failed,
+            "elapsed_s": self.elapsed_s,
+            "throughput": self.throughput(),
+            "latency_us": self.latency.summary(scale=1e3),
+            "latency_us_by_command": {
+                name: histogram.summary(scale=1e3)
+                for name, histogram in sorted(self.latency_by_command.items())
+            },
+            "checksum": self.checksum,
+        }
+        if self.schedule_lag is not None:
+            result["schedule_lag_us"] = self.schedule_lag.summary(scale=1e3)
+        return result
+
+    def report(self) -> str:
+        """The measurements as a text table."""
+
+        lines = [
+            f"commands   {self.commands} ({self.failed} failed)",
+            f"elapsed    {self.elapsed_s:.3f} s",
+            f"throughput {self.throughput():.0f} commands/s",
+            f"checksum   {self.checksum}",
+            "",
+            f"{'latency (us)':<16}{'count':>9}{'mean':>10}{'p50':>10}"
+            f"{'p90':>10}{'p99':>10}{'p99.9':>10}{'max':>10}",
+        ]
+        rows = sorted(self.latency_by_command.items())
+        rows.append(("all", self.latency))
+        if self.schedule_lag is not None:
+            rows.append(("schedule lag", self.schedule_lag))
+        for name, histogram in rows:
+            s = histogram.summary(scale=1e3)
+            lines.append(
+                f"{name:<16}{s['count']:>9}{s['mean']:>10.1f}{s['p50']:>10.1f}"
+                f"{s['p90']:>10.1f}{s['p99']:>10.1f}{s['p99.9']:>10.1f}{s['max']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+def replay(
+    journal_path: str,
+    exchange: _Exchange = default_exchange,
+    snapshot_path: Optional[str] = None,
+    speed: Optional[float] = None,
+) -> ReplayResult:
+    """
+    Run the commands journaled at `journal_path` on `exchange`, which must be
+    fresh, after loading the snapshot at `snapshot_path` if given. `speed`
+    None (or 0) runs them back to back, otherwise at `speed` times the
+    recorded pace. The exchange output is silenced while replaying.
+    """
+
+    if snapshot_path is not None and not exchange.load_snapshot(snapshot_path):
+        raise FileNotFoundError(snapshot_path)
+    records, _ = read_records(journal_path)
+    records = exchange.uncovered_records(records)
+
+    result = ReplayResult()
+    if speed:
+        result.schedule_lag = Histogram()
+
+    logging.disable(logging.CRITICAL)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result.elapsed_s = _run(exchange, records, result, speed)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    result.checksum = state_checksum(exchange)
+    return result
+
+
+def _run(
+    exchange: _Exchange, records: list, result: ReplayResult, speed: Optional[float]
+) -> float:
+    """Run and measure `records`, returns the elapsed seconds."""
+
+    histograms = result.latency_by_command
+    first_time_ms = records[0][1] if records else 0
+    start = time.perf_counter_ns()
+    for op, time_ms, values in records:
+        if op == _CHECKPOINT_OP:
+            continue
+        if speed:
+            due = start + int((time_ms - first_time_ms) * 1e6 / speed)
+            now = time.perf_counter_ns()
+            if due > now:
+                time.sleep((due - now) / 1e9)
+            result.schedule_lag.record(time.perf_counter_ns() - due)
+        name = command_name(op)
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        t0 = time.perf_counter_ns()
+        ok = exchange.replay_command(op, time_ms, values)
+        elapsed = time.perf_counter_ns() - t0
+        histogram.record(elapsed)
+        result.latency.record(elapsed)
+        result.commands += 1
+        if not ok:
+            result.failed += 1
+    return (time.perf_counter_ns() - start) / 1e9
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m exchange.replay",
+        description="Replay a command journal through the engine and measure it.",
+    )
+    parser.add_argument("journal", help="path of the command journal to replay")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=None,
+        help="replay at this multiple of the recorded pace (default: as fast as possible)",
+    )
+    parser.add_argument(
+        "--snapshot", default=None, help="start from this snapshot of the state"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print the results as JSON"
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.journal):
+        parser.error(f"no journal at {args.journal}")
+    try:
+        result = replay(args.journal, snapshot_path=args.snapshot, speed=args.speed)
+    finally:
+        # the GTD expiry threads of the books would keep the process alive
+        for book in default_exchange._books.values():
+            book.stop()
+    if args.json:
+        json.dump(result.to_json(), sys.stdout, indent=2)
+        print()
+    else:
+        print(result.report())
+
+
+if __name__ == "__main__":
+    main()
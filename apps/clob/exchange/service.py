@@ -0,0 +1,68 @@
+"""
+Startup and shutdown of the exchange state, shared by the API process (`app`)
+and the standalone engine process (`engine`).
+"""
+
+import asyncio
+import os
+from typing import Optional
+
+from . import exchange, async_exchange
+from .shared_top import SHM_NAME
+
+# path of the command journal; when set, the exchange state is rebuilt from it
+# on startup and every command is made durable before being acknowledged
+JOURNAL_PATH = os.environ.get("CLOB_JOURNAL_PATH")
+# set to 0 to skip fsync (the OS still gets every write, only power loss can lose commands)
+JOURNAL_FSYNC = os.environ.get("CLOB_JOURNAL_FSYNC", "1") != "0"
+# path of the state snapshot; when set, the state is loaded from it on startup
+# (before the journal is replayed) and saved to it on shutdown and every
+# CLOB_SNAPSHOT_INTERVAL_S seconds (0: never), truncating the journal
+SNAPSHOT_PATH = os.environ.get("CLOB_SNAPSHOT_PATH")
+SNAPSHOT_INTERVAL_S = float(os.environ.get("CLOB_SNAPSHOT_INTERVAL_S", "0"))
+
+_checkpoints: Optional[asyncio.Task] = None
+
+
+async def _checkpoint_periodically():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_S)
+        try:
+            # between two commands
+            await async_exchange.run(exchange.checkpoint, SNAPSHOT_PATH)
+        except Exception as e:
+            print(f"Checkpoint failed: {e}")
+
+
+def start_exchange():
+    """
+    Share the top-of-book, restore the state and start the checkpoints, as
+    configured, then the engine thread (see `async_exchange`). In the event loop.
+    """
+    global _checkpoints
+    if SHM_NAME:
+        # before the books are loaded, so that they are all shared
+        exchange.share_top(SHM_NAME)
+    if SNAPSHOT_PATH and exchange.load_snapshot(SNAPSHOT_PATH):
+        print(f"Loaded snapshot {SNAPSHOT_PATH}")
+    if JOURNAL_PATH:
+        replayed = exchange.open_journal(JOURNAL_PATH, fsync=JOURNAL_FSYNC)
+        print(f"Replayed {replayed} commands from {JOURNAL_PATH}")
+    if SNAPSHOT_PATH:
+        exchange.checkpoint(SNAPSHOT_PATH)
+        if SNAPSHOT_INTERVAL_S > 0:
+            _checkpoints = asyncio.create_task(_checkpoint_periodically())
+    async_exchange.start()
+
+
+def stop_exchange():
+    """Stop the engine thread, save the state if configured, close the journal and the shared top-of-book."""
+    global _checkpoints
+    async_exchange.stop()
+    if _checkpoints is not None:
+        _checkpoints.cancel()
+        _checkpoints = None
+    if SNAPSHOT_PATH:
+        exchange.checkpoint(SNAPSHOT_PATH)
+    exchange.close_journal()
+    exchange.close_shared_top()
@@ -0,0 +1,289 @@
+"""
+Top-of-book of every book in shared memory, for the read-only market data
+workers (see `market_data_app`).
+
+The engine process owns the region and writes the `TopOfBook` of a book each
+time the book publishes one, with the depth update id of the book. Any number
+of processes attach to the region by name and read it without locking and
+without ever blocking the writer: each slot is guarded by a seqlock, the
+writer makes the slot sequence odd, writes, and makes it even again, and a
+reader copies the slot and retries if the sequence was odd or changed
+meanwhile. The directory of the symbols is guarded the same way by the header
+sequence.
+
+Layout, little endian:
+
+    header     64 bytes: magic, directory sequence, number of slots, levels
+               per side, price and quantity scales, number of symbols
+    directory  32 bytes per slot: the symbol of the slot, utf-8, 0 padded
+    slots      per slot: sequence, version, update id, number of bids and
+               asks, last trade (price, quantity, time; time -1 if none),
+               then the bids followed by the asks, as (price, volume,
+               #orders), 0 padded up to 2 * levels
+
+Prices and quantities are stored as integers, scaled by 10 ** scale.
+"""
+
+import os
+import struct
+import threading
+import time
+from decimal import Decimal
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+from fastlob.consts import DECIMAL_PRECISION_PRICE, DECIMAL_PRECISION_QTY, TOP_LEVELS
+from fastlob.lob import TopOfBook
+
+# name of the region, the engine writes it when set, see `app`
+SHM_NAME = os.environ.get("CLOB_SHM_NAME")
+# number of books the region can hold
+SHM_SLOTS = int(os.environ.get("CLOB_SHM_SLOTS", "1024"))
+
+MAGIC = b"CLOBTOP1"
+SYMBOL_SIZE = 32
+# a reader gives up after that many torn reads in a row, the writer is stuck
+MAX_RETRIES = 10000
+
+_HEADER = struct.Struct("<8sQIIIII28x")
+_SEQ = struct.Struct("<Q")
+_SLOT = struct.Struct("<QQqIIqqq8x")
+
+
+class SharedTopError(Exception):
+    pass
+
+
+def _levels_struct(levels: int) -> struct.Struct:
+    """The levels of a slot: room for `levels` per side, (price, volume, #orders, padding) each."""
+    return struct.Struct("<" + "qqI4x" * (2 * levels))
+
+
+class SharedTopWriter:
+    """Creates the region `name` and writes it. Owned by the engine process, thread safe."""
+
+    _shm: shared_memory.SharedMemory
+    _slots: dict[str, int]
+    _lock: threading.Lock
+
+    def __init__(self, name: str, slots: int = SHM_SLOTS, levels: int = TOP_LEVELS):
+        self._n_slots = slots
+        self._levels = levels
+        self._levels_struct = _levels_struct(levels)
+        self._slot_size = _SLOT.size + self._levels_struct.size
+        self._directory = _HEADER.size
+        self._first_slot = self._directory + SYMBOL_SIZE * slots
+        self._price_scale = DECIMAL_PRECISION_PRICE
+        self._qty_scale = DECIMAL_PRECISION_QTY
+        size = self._first_slot + self._slot_size * slots
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # left over by an engine that did not shut down, nobody writes it anymore
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self._buf = self._shm.buf
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._dir_seq = 0
+        self._write_header()
+
+    def name(self) -> str:
+        return self._shm.name
+
+    def _write_header(self):
+        _HEADER.pack_into(
+            self._buf,
+            0,
+            MAGIC,
+            self._dir_seq,
+            self._n_slots,
+            self._levels,
+            self._price_scale,
+            self._qty_scale,
+            len(self._slots),
+        )
+
+    def add(self, symbol: str) -> bool:
+        """Give `symbol` a slot, empty until its first write. False if the region is full."""
+        with self._lock:
+            if symbol in self._slots:
+                return True
+            if len(self._slots) == self._n_slots:
+                return False
+            slot = len(self._slots)
+            self._write_slot(slot, TopOfBook(0, (), ()), 0)
+            self._dir_seq += 1
+            _SEQ.pack_into(self._buf, 8, self._dir_seq)
+            name = symbol.encode()[:SYMBOL_SIZE].ljust(SYMBOL_SIZE, b"\0")
+            self._buf[self._directory + SYMBOL_SIZE * slot:][:SYMBOL_SIZE] = name
+            self._slots[symbol] = slot
+            self._dir_seq += 1
+            self._write_header()
+            return True
+
+    def clear(self):
+        """Forget every symbol."""
+        with self._lock:
+            self._dir_seq += 1
+            _SEQ.pack_into(self._buf, 8, self._dir_seq)
+            self._slots = {}
+            self._dir_seq += 1
+            self._write_header()
+
+    def write(self, symbol: str, top: TopOfBook, update_id: Optional[int] = None):
+        """Write the top of `symbol`, with `update_id` or the last one written."""
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return
+        with self._lock:
+            if update_id is None:
+                update_id = _SLOT.unpack_from(self._buf, self._offset(slot))[2]
+            self._write_slot(slot, top, update_id)
+
+    def write_update_id(self, symbol: str, update_id: int):
+        """Write the depth update id of `symbol`, keeping its top."""
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return
+        with self._lock:
+            offset = self._offset(slot)
+            head = list(_SLOT.unpack_from(self._buf, offset))
+            seq = head[0]
+            _SEQ.pack_into(self._buf, offset, seq + 1)
+            head[0] = seq + 2
+            head[2] = update_id
+            _SLOT.pack_into(self._buf, offset, *head)
+
+    def _offset(self, slot: int) -> int:
+        return self._first_slot + self._slot_size * slot
+
+    def _write_slot(self, slot: int, top: TopOfBook, update_id: int):
+        offset = self._offset(slot)
+        seq = _SEQ.unpack_from(self._buf, offset)[0]
+        _SEQ.pack_into(self._buf, offset, seq + 1)
+
+        bids, asks = top.bids[: self._levels], top.asks[: self._levels]
+        values = []
+        for price, volume, count in (*bids, *asks):
+            values += (
+                int(price.scaleb(self._price_scale)),
+                int(volume.scaleb(self._qty_scale)),
+                count,
+            )
+        values += (0,) * (3 * (2 * self._levels - len(bids) - len(asks)))
+        self._levels_struct.pack_into(self._buf, offset + _SLOT.size, *values)
+
+        last_price, last_qty, last_time = top.last_trade or (Decimal(0), Decimal(0), -1)
+        _SLOT.pack_into(
+            self._buf,
+            offset,
+            seq + 2,
+            top.version,
+            update_id,
+            len(bids),
+            len(asks),
+            int(last_price.scaleb(self._price_scale)),
+            int(last_qty.scaleb(self._qty_scale)),
+            last_time,
+        )
+
+    def close(self):
+        """Release and remove the region."""
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedTopReader:
+    """Attaches to the region `name`, written by a `SharedTopWriter` in another process. One per thread."""
+
+    _shm: shared_memory.SharedMemory
+    _slots: dict[str, int]
+
+    def __init__(self, name: str):
+        try:
+            self._shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:  # python < 3.13: the region would be removed when this process exits
+            self._shm = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._buf = self._shm.buf
+        magic, _, n_slots, levels, price_scale, qty_scale, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise SharedTopError(f"{name} is not a top-of-book region")
+        self._levels_struct = _levels_struct(levels)
+        self._slot_size = _SLOT.size + self._levels_struct.size
+        self._directory = _HEADER.size
+        self._first_slot = self._directory + SYMBOL_SIZE * n_slots
+        self._price_scale = price_scale
+        self._qty_scale = qty_scale
+        self._dir_seq = -1
+        self._slots = {}
+
+    def _refresh(self):
+        """Read the directory again if it changed."""
+        for _ in range(MAX_RETRIES):
+            seq = _SEQ.unpack_from(self._buf, 8)[0]
+            if seq == self._dir_seq:
+                return
+            if seq & 1:
+                time.sleep(0)
+                continue
+            count = _HEADER.unpack_from(self._buf, 0)[6]
+            names = bytes(self._buf[self._directory:][: SYMBOL_SIZE * count])
+            if _SEQ.unpack_from(self._buf, 8)[0] != seq:
+                continue
+            self._slots = {
+                names[i * SYMBOL_SIZE : (i + 1) * SYMBOL_SIZE].rstrip(b"\0").decode(): i
+                for i in range(count)
+            }
+            self._dir_seq = seq
+            return
+        raise SharedTopError("directory kept changing while read")
+
+    def symbols(self) -> list[str]:
+        """The symbols in the region, in listing order."""
+        self._refresh()
+        return list(self._slots)
+
+    def version(self) -> int:
+        """Changes whenever the set of symbols changes."""
+        self._refresh()
+        return self._dir_seq
+
+    def read(self, symbol: str) -> Optional[tuple[TopOfBook, int]]:
+        """(top, depth update id) of `symbol`, None if it is not in the region."""
+        self._refresh()
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return None
+        offset = self._first_slot + self._slot_size * slot
+        for _ in range(MAX_RETRIES):
+            seq = _SEQ.unpack_from(self._buf, offset)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            data = bytes(self._buf[offset:][: self._slot_size])
+            if _SEQ.unpack_from(self._buf, offset)[0] == seq:
+                return self._decode(data)
+        raise SharedTopError(f"{symbol} kept changing while read")
+
+    def _decode(self, data: bytes) -> tuple[TopOfBook, int]:
+        _, version, update_id, n_bids, n_asks, last_price, last_qty, last_time = _SLOT.unpack_from(data)
+        values = self._levels_struct.unpack_from(data, _SLOT.size)
+        ps, qs = -self._price_scale, -self._qty_scale
+        levels = [
+            (Decimal(values[i]).scaleb(ps), Decimal(values[i + 1]).scaleb(qs), values[i + 2])
+            for i in range(0, 3 * (n_bids + n_asks), 3)
+        ]
+        last_trade = None
+        if last_time >= 0:
+            last_trade = (Decimal(last_price).scaleb(ps), Decimal(last_qty).scaleb(qs), last_time)
+        top = TopOfBook(version, tuple(levels[:n_bids]), tuple(levels[n_bids:]), last_trade)
+        return top, update_id
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
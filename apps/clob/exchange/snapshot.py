@@ -0,0 +1,417 @@
+"""
+Binary snapshot of the whole exchange state, for fast restarts.
+
+A snapshot holds every book (its orders, with their trades, and the FIFO queue
+of each price level), every account balance and the id sequences. Loading it
+rebuilds the state directly: orders are not run through `process` and
+balances are not re-posted, so restart time follows the size of the state,
+not the length of the history that led to it.
+
+The file is a header followed by sections of fixed-size little endian
+records, located by a section table, so that it can be memory-mapped and each
+section decoded in bulk:
+
+    header:   magic, version, price and quantity decimals, checkpoint id,
+              number of journal records covered, next order id, next trade id
+    sections: (offset, count) of each of `_SECTIONS`
+
+Amounts are stored as fixed-point integers: prices and quantities with the
+book precision, quote amounts with the sum of both. Strings (symbols, client
+ids, client order ids, assets) are stored once in a string table.
+
+Snapshots are written to a temporary file, fsynced and renamed, so a crash
+while writing one leaves the previous snapshot in place.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from decimal import Decimal
+from typing import Optional, TYPE_CHECKING
+
+from account import ledger
+from fastlob.consts import DECIMAL_PRECISION_PRICE, DECIMAL_PRECISION_QTY
+from fastlob.enums import OrderSide, OrderStatus, OrderType
+from fastlob.lob import Orderbook
+from fastlob.order import Order
+from fastlob.trade import Trade
+from fastlob.utils import order_ids, trade_ids
+
+if TYPE_CHECKING:
+    from . import _Exchange
+
+MAGIC = b"CLOBSNAP"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sHBBqqqq")
+_SECTION = struct.Struct("<QQ")
+
+_SECTIONS = (
+    "string_offsets",  # u64, one more than the number of strings
+    "string_data",  # utf-8 bytes
+    "assets",  # u32 string index, by asset id
+    "accounts",  # _ACCOUNT
+    "account_assets",  # i32 asset ids, per account
+    "account_amounts",  # i64 (available, reserved) units, per account asset
+    "books",  # _BOOK
+    "orders",  # _ORDER, per book in insertion order
+    "trades",  # _TRADE, per order
+    "levels",  # _LEVEL, per book, bids then asks, best first
+    "queues",  # u32 index of the order in its book, per level in FIFO order
+)
+
+_ACCOUNT = struct.Struct("<II")  # client id, number of assets
+_BOOK = struct.Struct("<IqII")  # symbol, depth update id, number of orders, of levels
+_ORDER = struct.Struct("<qIIBBBBqqqqqqqI")
+# ^ id, client id, client order id, side, is market, type, status, price, original quantity,
+#   quantity, original quote quantity, cumulative quote quantity, expiry (-1: none), time,
+#   number of trades
+_TRADE = struct.Struct("<qqqqqBBq")
+# ^ id, order id, price, quantity, quote quantity, is buyer, is maker, time
+_LEVEL = struct.Struct("<BqI")  # side, price, number of orders
+
+_SIDES = (OrderSide.BID, OrderSide.ASK)
+_TYPES = (OrderType.FOK, OrderType.GTC, OrderType.GTD, OrderType.FAKE)
+_STATUSES = (
+    OrderStatus.CREATED,
+    OrderStatus.PENDING,
+    OrderStatus.FILLED,
+    OrderStatus.PARTIAL,
+    OrderStatus.CANCELED,
+    OrderStatus.ERROR,
+)
+
+_ZERO = Decimal(0)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _units(amount: Decimal, decimals: int) -> int:
+    units = amount.scaleb(decimals)
+    if units != units.to_integral_value():
+        raise SnapshotError(f"{amount} has more than {decimals} decimals")
+    return int(units)
+
+
+def _amount(units: int, decimals: int) -> Decimal:
+    return Decimal(units).scaleb(-decimals)
+
+
+class _Strings:
+    def __init__(self):
+        self.index: dict[str, int] = {}
+        self.values: list[str] = []
+
+    def __call__(self, value: str) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+def write_snapshot(
+    path: str, exchange: "_Exchange", checkpoint_id: int, journal_records: int
+):
+    """
+    Save the state of `exchange` to `path`. `checkpoint_id` and
+    `journal_records` tell recovery which journal records the snapshot covers.
+    """
+
+    pdec, qdec = DECIMAL_PRECISION_PRICE, DECIMAL_PRECISION_QTY
+    quote_dec = pdec + qdec
+    strings = _Strings()
+    sections: dict[str, bytearray] = {name: bytearray() for name in _SECTIONS}
+    counts: dict[str, int] = dict.fromkeys(_SECTIONS, 0)
+
+    def put(name: str, data: bytes, count: int = 1):
+        sections[name] += data
+        counts[name] += count
+
+    asset_names, accounts = ledger.export_accounts()
+    for asset in asset_names:
+        put("assets", struct.pack("<I", strings(asset)))
+    for client_id, assets, amounts in accounts:
+        put("accounts", _ACCOUNT.pack(strings(client_id), len(assets)))
+        put("account_assets", assets.tobytes(), len(assets))
+        put("account_amounts", amounts.tobytes(), len(amounts))
+
+    for symbol, book in exchange._books.items():
+        orders = book.orders()
+        queues = book.resting_queues()
+        put(
+            "books",
+            _BOOK.pack(
+                strings(symbol), exchange._update_id[symbol], len(orders), len(queues)
+            ),
+        )
+        position: dict[int, int] = {}
+        for i, order in enumerate(orders):
+            position[order.id()] = i
+            cummulative = order._cummulative_quote_qty
+            put(
+                "orders",
+                _ORDER.pack(
+                    order.id(),
+                    strings(order.client_id()),
+                    strings(order.client_order_id()),
+                    _SIDES.index(order.side()),
+                    order.is_market(),
+                    _TYPES.index(order.otype()),
+                    _STATUSES.index(order.status()),
+                    _units(order.price(), pdec),
+                    _units(order._org_quantity, qdec),
+                    _units(order.quantity(), qdec),
+                    _units(order._orig_quote_qty, quote_dec),
+                    # -1 stands for the never filled Decimal("0")
+                    -1 if cummulative == 0 else _units(cummulative, quote_dec),
+                    -1 if order.expiry() is None else order.expiry(),
+                    order._time,
+                    len(order.trades()),
+                ),
+            )
+            for trade in order.trades():
+                put(
+                    "trades",
+                    _TRADE.pack(
+                        trade.id(),
+                        trade.order_id(),
+                        _units(trade.price(), pdec),
+                        _units(trade.quantity(), qdec),
+                        _units(trade.quote_qty(), quote_dec),
+                        trade.is_buyer(),
+                        trade.is_maker(),
+                        trade._time,
+                    ),
+                )
+        for side, price, queue in queues:
+            put(
+                "levels",
+                _LEVEL.pack(_SIDES.index(side), _units(price, pdec), len(queue)),
+            )
+            put(
+                "queues",
+                array("I", (position[order.id()] for order in queue)).tobytes(),
+                len(queue),
+            )
+
+    offsets = array("Q", [0])
+    data = bytearray()
+    for value in strings.values:
+        data += value.encode("utf-8")
+        offsets.append(len(data))
+    put("string_offsets", offsets.tobytes(), len(offsets))
+    put("string_data", bytes(data), len(data))
+
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        pdec,
+        qdec,
+        checkpoint_id,
+        journal_records,
+        order_ids.peek(),
+        trade_ids.peek(),
+    )
+    offset = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    table = bytearray()
+    for name in _SECTIONS:
+        table += _SECTION.pack(offset, counts[name])
+        offset += len(sections[name])
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(table)
+        for name in _SECTIONS:
+            f.write(sections[name])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def load_snapshot(path: str, exchange: "_Exchange") -> Optional[tuple[int, int]]:
+    """
+    Replace the state of `exchange` with the snapshot at `path`. Returns its
+    (checkpoint id, number of journal records covered), or None if there is
+    no snapshot.
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        view = memoryview(mm)
+        try:
+            return _load(view, exchange)
+        finally:
+            view.release()
+
+
+def _load(view: memoryview, exchange: "_Exchange") -> tuple[int, int]:
+    (
+        magic,
+        version,
+        pdec,
+        qdec,
+        checkpoint_id,
+        journal_records,
+        next_order_id,
+        next_trade_id,
+    ) = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError("not a supported exchange snapshot")
+    if (pdec, qdec) != (DECIMAL_PRECISION_PRICE, DECIMAL_PRECISION_QTY):
+        raise SnapshotError(
+            f"snapshot precision ({pdec}, {qdec}) differs from the books precision"
+        )
+    quote_dec = pdec + qdec
+
+    table = {}
+    for i, name in enumerate(_SECTIONS):
+        table[name] = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+
+    def raw(name: str, item_size: int) -> memoryview:
+        offset, count = table[name]
+        return view[offset : offset + count * item_size]
+
+    def records(name: str, record: struct.Struct):
+        return record.iter_unpack(raw(name, record.size))
+
+    offsets = array("Q")
+    offsets.frombytes(raw("string_offsets", 8))
+    data = bytes(raw("string_data", 1))
+    strings = [
+        data[offsets[i] : offsets[i + 1]].decode("utf-8")
+        for i in range(len(offsets) - 1)
+    ]
+
+    asset_names = [strings[i] for (i,) in records("assets", struct.Struct("<I"))]
+    account_assets = array("i")
+    account_assets.frombytes(raw("account_assets", 4))
+    account_amounts = array("q")
+    account_amounts.frombytes(raw("account_amounts", 8))
+    accounts = []
+    n = 0
+    for client, count in records("accounts", _ACCOUNT):
+        accounts.append(
+            (
+                strings[client],
+                account_assets[n : n + count],
+                account_amounts[2 * n : 2 * (n + count)],
+            )
+        )
+        n += count
+    ledger.import_accounts(asset_names, accounts)
+
+    trades = records("trades", _TRADE)
+    orders = records("orders", _ORDER)
+    levels = records("levels", _LEVEL)
+    queue_positions = array("I")
+    queue_positions.frombytes(raw("queues", 4))
+    q = 0
+
+    books: dict[str, Orderbook] = {}
+    update_ids: dict[str, int] = {}
+    for symbol_index, update_id, n_orders, n_levels in records("books", _BOOK):
+        symbol = strings[symbol_index]
+        book = Orderbook(symbol, True)
+        book_orders: list[Order] = []
+        for _ in range(n_orders):
+            (
+                id,
+                client,
+                client_order,
+                side,
+                is_market,
+                otype,
+                status,
+                price,
+                org_quantity,
+                quantity,
+                orig_quote_qty,
+                cummulative,
+                expiry,
+                time,
+                n_trades,
+            ) = next(orders)
+            order_trades = []
+            for _ in range(n_trades):
+                t_id, t_order, t_price, t_qty, t_quote, buyer, maker, t_time = next(
+                    trades
+                )
+                order_trades.append(
+                    Trade.restore(
+                        t_id,
+                        t_order,
+                        _amount(t_price, pdec),
+                        _amount(t_qty, qdec),
+                        _amount(t_quote, quote_dec),
+                        bool(buyer),
+                        bool(maker),
+                        t_time,
+                    )
+                )
+            book_orders.append(
+                Order.restore(
+                    id=id,
+                    client_id=strings[client],
+                    client_order_id=strings[client_order],
+                    side=_SIDES[side],
+                    price=_amount(price, pdec),
+                    org_quantity=_amount(org_quantity, qdec),
+                    quantity=_amount(quantity, qdec),
+                    is_market=bool(is_market),
+                    otype=_TYPES[otype],
+                    expiry=None if expiry == -1 else expiry,
+                    status=_STATUSES[status],
+                    orig_quote_qty=_amount(orig_quote_qty, quote_dec),
+                    cummulative_quote_qty=(
+                        _ZERO if cummulative == -1 else _amount(cummulative, quote_dec)
+                    ),
+                    time=time,
+                    trades=order_trades,
+                    base=book._base,
+                    quote=book._quote,
+                )
+            )
+        queues = []
+        for _ in range(n_levels):
+            side, price, count = next(levels)
+            queues.append(
+                (
+                    _SIDES[side],
+                    _amount(price, pdec),
+                    [book_orders[i] for i in queue_positions[q : q + count]],
+                )
+            )
+            q += count
+        book.load_orders(book_orders, queues)
+        books[symbol] = book
+        update_ids[symbol] = update_id
+
+    exchange._books = books
+    exchange._update_id = update_ids
+    exchange._books_version += 1
+    order_ids.restore(next_order_id)
+    trade_ids.restore(next_trade_id)
+    return checkpoint_id, journal_records
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
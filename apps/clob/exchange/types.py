@@ -1,13 +1,14 @@
 from enum import Enum
 from typing import Optional
 from decimal import Decimal
-from fastlob.order import Order
-from fastlob import OrderSide as LobOrderSide
-from fastlob.result import ExecutionResult
-from pydantic import BaseModel
-from fastlob.trade import Trade
-from account import SpotAccount
-import time
+from pydantic import BaseModel, Field, field_validator
+import json
+import os
+
+# most orders accepted in one POST /batchOrders
+BATCH_ORDERS_LIMIT = int(os.environ.get("CLOB_BATCH_ORDERS_LIMIT", "20"))
+# most quotes per side in one POST /order/massQuote
+MASS_QUOTE_LIMIT = int(os.environ.get("CLOB_MASS_QUOTE_LIMIT", "50"))
 
 
 class OrderSide(Enum):
@@ -29,6 +30,31 @@ class NewOrderRequest(BaseModel):
     price: Optional[Decimal] = None
 
 
+class BatchOrdersRequest(BaseModel):
+    batchOrders: list[NewOrderRequest] = Field(
+        min_length=1, max_length=BATCH_ORDERS_LIMIT
+    )
+
+    @field_validator("batchOrders", mode="before")
+    @classmethod
+    def _parse_list(cls, value):
+        # url-encoded clients send the list as a JSON string, like Binance
+        return json.loads(value) if isinstance(value, str) else value
+
+
+class QuoteLevel(BaseModel):
+    price: Decimal
+    quantity: Decimal
+
+
+class MassQuoteRequest(BaseModel):
+    """The new resting orders of the client on `symbol`, replacing all the current ones."""
+
+    symbol: str
+    bids: list[QuoteLevel] = Field(default=[], max_length=MASS_QUOTE_LIMIT)
+    asks: list[QuoteLevel] = Field(default=[], max_length=MASS_QUOTE_LIMIT)
+
+
 class CancelOrderRequest(BaseModel):
     symbol: str
     orderId: Optional[int] = None
@@ -39,6 +65,15 @@ class CancelAllRequest(BaseModel):
     symbol: str
 
 
+class MassCancelRequest(BaseModel):
+    symbol: str
+    side: Optional[OrderSide] = None
+    minPrice: Optional[Decimal] = None
+    maxPrice: Optional[Decimal] = None
+    # only the orders whose client order id starts with it
+    tag: Optional[str] = None
+
+
 class CancelReplaceRequest(BaseModel):
     symbol: str
     side: OrderSide
@@ -50,6 +85,17 @@ class CancelReplaceRequest(BaseModel):
     cancelOrigClientOrderId: Optional[str] = None
 
 
+class AmendOrderRequest(BaseModel):
+    symbol: str
+    # the new open quantity of the order, not its new total quantity
+    newQty: Decimal = Field(gt=0)
+    # a new price loses the queue priority, like a larger quantity
+    price: Optional[Decimal] = Field(default=None, gt=0)
+    orderId: Optional[int] = None
+    origClientOrderId: Optional[str] = None
+    newClientOrderId: Optional[str] = None
+
+
 class OrderResponseAck(BaseModel):
     symbol: str
     orderId: int
@@ -92,48 +138,6 @@ class CancelReplaceResponse(BaseModel):
     newOrderResponse: OrderResponseAck
 
 
-def get_fastlob_order_response(
-    symbol: str,
-    order: Order,
-    result: Optional[ExecutionResult] = None,
-    type: Optional[OrderType] = None,
-):
-    fills: list[FillResponse] = []
-    if result:
-        exec_prices = result._execprices
-        if exec_prices:
-            for price, qty in exec_prices.items():
-                fills.append(
-                    FillResponse(
-                        price=str(price),
-                        qty=str(qty),
-                        commission="0",
-                        commissionAsset="USDT",
-                        tradeId=0,
-                    )
-                )
-    return OrderResponseResult(
-        clientId=order.client_id(),
-        symbol=symbol,
-        orderId=order.id(),
-        orderListId=-1,
-        clientOrderId=order.client_order_id(),
-        transactTime=order._time,
-        origClientOrderId=order.client_order_id(),
-        price=str(order.price()),
-        origQty=str(order._org_quantity),
-        executedQty=str(order._org_quantity - order._quantity),
-        origQuoteOrderQty=str(order._orig_quote_qty),
-        cummulativeQuoteQty=str(order._cummulative_quote_qty),
-        timeInForce="GTC",
-        side="BUY" if order.side() == LobOrderSide.BID else "SELL",
-        selfTradePreventionMode="NONE",
-        fills=fills,
-        status=order.status().value,
-        type=type if type else OrderType.LIMIT_MAKER,
-    )
-
-
 class OrderQuery(BaseModel):
     symbol: str
     orderId: Optional[int] = None
@@ -141,7 +145,8 @@ class OrderQuery(BaseModel):
 
 
 class CurrentOpenOrdersQuery(BaseModel):
-    symbol: str
+    # all the symbols if not given
+    symbol: Optional[str] = None
 
 
 class AllOrdersQuery(BaseModel):
@@ -153,6 +158,11 @@ class DepthQuery(BaseModel):
     limit: int = 10
 
 
+class BookTickerQuery(BaseModel):
+    # all the symbols if not given
+    symbol: Optional[str] = None
+
+
 class TradesQuery(BaseModel):
     symbol: str
     orderId: Optional[int] = None
@@ -190,82 +200,6 @@ class TradeResponse(BaseModel):
     isBestMatch: bool
 
 
-def to_trade_response(symbol: str, trade: Trade) -> TradeResponse:
-    return TradeResponse(
-        symbol=symbol,
-        id=trade.id(),
-        orderId=trade.order_id(),
-        orderListId=-1,
-        price=str(trade.price()),
-        qty=str(trade.quantity()),
-        quoteQty=str(trade.quote_qty()),
-        comission="0",
-        comissionAsset=symbol.split("USDT")[0],
-        time=trade._time,
-        isBuyer=trade.is_buyer(),
-        isMaker=trade.is_maker(),
-        isBestMatch=True,
-    )
-
-
-def to_execution_report_ws(order: OrderResponseResult):
-    """
-    Convert OrderResponseResult (REST) to Binance-style executionReport WS event.
-    """
-
-    return {
-        "e": "executionReport",
-        "E": order.transactTime,  # event time
-        "s": order.symbol,  # symbol
-        "c": order.clientOrderId,  # client order id
-        "S": order.side,  # BUY / SELL
-        "o": order.type,  # LIMIT / MARKET ...
-        "f": order.timeInForce,  # GTC / IOC ...
-        "q": order.origQty,  # order quantity
-        "p": order.price,  # order price
-        # --- fields not in REST response → default to 0 / null ---
-        "P": "0.00000000",  # stop price
-        "F": "0.00000000",  # iceberg qty
-        "g": order.orderListId,  # orderListId
-        "C": order.origClientOrderId,  # original client order ID
-        "x": (
-            "TRADE" if order.status in ["FILLED", "PARTIAL_FILLED"] else order.status
-        ),  # execution type (REST cannot tell → default NEW)
-        "X": order.status,  # status: NEW, FILLED, PARTIALLY_FILLED ...
-        "r": "NONE",  # reject reason
-        "i": order.orderId,  # order ID
-        "l": "0.00000000",  # last executed qty (REST doesn’t give → default 0)
-        "z": order.executedQty,  # cumulative filled qty
-        "L": "0.00000000",  # last executed price (REST doesn’t give → 0)
-        "n": "0",  # commission amount
-        "N": None,  # commission asset
-        "T": order.transactTime,  # transaction time
-        "t": -1,  # trade ID
-        "v": 0,  # prevented match ID
-        "I": order.orderId,  # execution id (use orderId)
-        "w": True,  # order on book?
-        "m": False,  # maker?
-        "M": False,  # ignore
-        "O": order.transactTime,  # order creation time
-        "Z": order.cummulativeQuoteQty,  # cumulative quote executed qty
-        "Y": "0.00000000",  # last quote executed qty
-        "Q": order.origQuoteOrderQty,  # quote order quantity
-        "W": order.transactTime,  # working time
-        "V": order.selfTradePreventionMode,  # STP Mode
-    }
-
-
-def to_outbound_account_position_ws(account: SpotAccount, assets: list[str]):
-    now = int(time.time() * 1000)
-    B = []
-    for a in assets:
-        balance = account.get_balance(a)
-        f = balance.available
-        l = balance.reserved
-        B.append({"a": a, "f": f, "l": l})
-    return {"e": "outboundAccountPosition", "E": now, "u": now, "B": B}
-
-
 def interval_to_milliseconds(interval: str) -> int:
     if interval == "1m":
         return 60 * 1000
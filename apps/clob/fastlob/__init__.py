@@ -1,4 +1,4 @@
-from .lob import Orderbook
+from .lob import Orderbook, TopOfBook
 from .order import OrderParams
-from .result import ExecutionResult
+from .result import ExecutionResult, QuoteResult
 from .enums import OrderSide, OrderType, OrderStatus, ResultType
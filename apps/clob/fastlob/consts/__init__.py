@@ -8,4 +8,5 @@ from .consts import (
     MAX_VALUE,
     ORDERS_ID_SIZE,
     DEFAULT_LIMITS_VIEW,
+    TOP_LEVELS,
 )
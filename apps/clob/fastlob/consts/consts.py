@@ -26,3 +26,8 @@ MAX_VALUE = Decimal(int(10e10))
 ORDERS_ID_SIZE = 4
 
 DEFAULT_LIMITS_VIEW = 10
+
+ENV_TOP_LEVELS: str = 'FASTLOB_TOP_LEVELS'
+
+TOP_LEVELS: int = int(os.environ.get(ENV_TOP_LEVELS) or 20)
+# ^ number of levels per side in the published top-of-book snapshots
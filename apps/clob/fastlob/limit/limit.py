@@ -109,12 +109,12 @@ class Limit:
         self._volume += diff
         order.update(new_qty)
 
-    def cancel_order(self, order: Order) -> None:
-        """Cancel an order."""
+    def cancel_order(self, order: Order, release: bool = True) -> None:
+        """Cancel an order (see `Order.cancel` for `release`)."""
 
         self._volume -= order.quantity()
         self._valid_orders -= 1
-        order.cancel()
+        order.cancel(release)
 
     def _prune_canceled(self) -> None:
         """Pop the next order while it is a canceled one."""
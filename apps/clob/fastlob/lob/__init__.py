@@ -1,3 +1,4 @@
 '''Main module containing the Orderbook class.'''
 
 from .orderbook import Orderbook
+from .top import TopOfBook
@@ -0,0 +1,64 @@
+"""Index of the resting orders of each client of a lob."""
+
+from decimal import Decimal
+from typing import Optional
+from sortedcontainers import SortedDict
+
+from fastlob.order import Order
+from fastlob.enums import OrderSide
+
+
+class ClientOrders:
+    """
+    The resting orders of one client, per side and price. Orders are added when they rest and removed when canceled;
+    those filled since are dropped when met, so lookups return valid orders only.
+    """
+
+    _ladders: dict[OrderSide, SortedDict]
+    # ^ side -> price -> {order id: order}
+
+    def __init__(self):
+        self._ladders = {OrderSide.BID: SortedDict(), OrderSide.ASK: SortedDict()}
+
+    def add(self, order: Order) -> None:
+        """Index a resting order."""
+
+        self._ladders[order.side()].setdefault(order.price(), dict())[order.id()] = order
+
+    def remove(self, order: Order) -> None:
+        """Remove an order from the index, if it is there."""
+
+        ladder = self._ladders[order.side()]
+        level = ladder.get(order.price())
+        if level is None:
+            return
+        level.pop(order.id(), None)
+        if not level:
+            del ladder[order.price()]
+
+    def orders(
+        self,
+        side: Optional[OrderSide] = None,
+        low: Optional[Decimal] = None,
+        high: Optional[Decimal] = None,
+    ) -> list[Order]:
+        """Valid orders on `side` (both if None) priced in [`low`, `high`] (unbounded if None), by price then age."""
+
+        result = list()
+        for s in (side,) if side is not None else (OrderSide.BID, OrderSide.ASK):
+            ladder = self._ladders[s]
+            for price in list(ladder.irange(low, high)):
+                level = ladder[price]
+                for order in list(level.values()):
+                    if order.valid():
+                        result.append(order)
+                    else:
+                        del level[order.id()]
+                if not level:
+                    del ladder[price]
+        return result
+
+    def empty(self) -> bool:
+        """True if no order is indexed (some may be filled already)."""
+
+        return not self._ladders[OrderSide.BID] and not self._ladders[OrderSide.ASK]
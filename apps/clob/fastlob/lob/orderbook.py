@@ -4,22 +4,33 @@ import io
 import time
 import logging
 import threading
+import itertools
+from contextlib import nullcontext
 from decimal import Decimal
-from typing import Optional, Iterable
+from typing import Callable, Optional, Iterable
 from numbers import Number
 from sortedcontainers import SortedDict
 from termcolor import colored
 
+from account import ledger
 from fastlob import engine
 from fastlob.limit import Limit
 from fastlob.side import AskSide, BidSide
 from fastlob.order import OrderParams, Order, AskOrder, BidOrder
+from fastlob.trade import Trade
 from fastlob.enums import OrderSide, OrderStatus, OrderType
-from fastlob.result import ResultBuilder, ExecutionResult
-from fastlob.utils import time_asint, todecimal_quantity
+from fastlob.result import ResultBuilder, ExecutionResult, QuoteResult
+from fastlob.utils import time_asint, todecimal_price, todecimal_quantity, zero
 from fastlob.consts import *
 
 from .utils import not_running_error, check_limit_order
+from .clients import ClientOrders
+from .top import TopOfBook
+from metrics import Histogram, engine_stage_latency
+
+_versions = itertools.count(1)
+# ^ shared by all books so that a version is never reused, even by a book created after a reset;
+#   next() on itertools.count is atomic, the expiry thread can bump versions too
 
 
 class Orderbook:
@@ -36,6 +47,8 @@ class Orderbook:
     _askside: AskSide
     _bidside: BidSide
     _orders: dict[int, Order]
+    _clients: dict[str, ClientOrders]
+    _client_listener: Optional[Callable[[str, bool], None]]
     _expirymap: SortedDict
     _start_time: int
     _alive: bool
@@ -43,6 +56,11 @@ class Orderbook:
     _updates: Iterable[dict]
     _base: str
     _quote: str
+    _version: int
+    _top: TopOfBook
+    _top_listener: Optional[Callable[[TopOfBook], None]]
+    _publish_lock: threading.Lock
+    _latency: dict[str, Histogram]
 
     def __init__(self, name: Optional[str] = "LOB-1", start: Optional[bool] = False):
         """
@@ -58,10 +76,22 @@ class Orderbook:
         self._askside = AskSide(self._base, self._quote)
         self._bidside = BidSide(self._base, self._quote)
         self._orders = dict()
+        self._clients = dict()
+        self._client_listener = None
         self._expirymap = SortedDict()
         self._start_time = None
         self._alive = False
         self._updates = None
+        self._publish_lock = threading.Lock()
+        self._version = next(_versions)
+        self._top = TopOfBook(self._version, (), ())
+        self._top_listener = None
+        # order: Order construction (with its reservation), lock: wait for a side lock,
+        # execute: matching of a market order
+        self._latency = {
+            stage: engine_stage_latency.labels(stage, name)
+            for stage in ("order", "lock", "execute")
+        }
 
         self._logger = logging.getLogger(f"[{name}]")
         self._logger.info("lob initialized, ready to be started using <ob.start>")
@@ -102,6 +132,7 @@ class Orderbook:
 
         lob._askside.apply_snapshot(asks)
         lob._bidside.apply_snapshot(bids)
+        lob._publish()
 
         lob._logger.info("snapshot applied successfully")
 
@@ -150,6 +181,58 @@ class Orderbook:
     def is_running(self) -> bool:
         return self._alive
 
+    def version(self) -> int:
+        """Version of the lob content, changes after every mutation (orders, fills, cancels, updates)."""
+
+        return self._version
+
+    def top(self) -> TopOfBook:
+        """The best `TOP_LEVELS` levels of each side as of the last mutation. Never blocks, from any thread."""
+
+        return self._top
+
+    def depth(self, n: int) -> TopOfBook:
+        """The best `n` levels of each side: from `top` if it has that many, otherwise read under the side locks."""
+
+        if n <= TOP_LEVELS:
+            return self._top.head(n)
+        with self._bidside.lock(), self._askside.lock():
+            return TopOfBook(
+                self._version,
+                tuple(self._bidside.best_limits(n)),
+                tuple(self._askside.best_limits(n)),
+                self._top.last_trade,
+            )
+
+    def set_top_listener(self, listener: Optional[Callable[[TopOfBook], None]]):
+        """Call `listener(top)` with every `top` published, in publication order. It runs under the lob locks
+        and must be quick."""
+
+        self._top_listener = listener
+
+    def _publish(self, bids: bool = True, asks: bool = True, trade: Optional[Trade] = None):
+        """
+        Bump the version and publish a new `top`, with the levels of the sides changed (`bids`, `asks`) read again
+        and those of the other shared with the previous one, and `trade` as last trade if given. To call after a
+        mutation, not holding the side locks.
+        """
+
+        with (
+            self._bidside.lock() if bids else nullcontext(),
+            self._askside.lock() if asks else nullcontext(),
+            self._publish_lock,
+        ):
+            top = self._top
+            self._version = next(_versions)
+            self._top = TopOfBook(
+                self._version,
+                tuple(self._bidside.best_limits(TOP_LEVELS)) if bids else top.bids,
+                tuple(self._askside.best_limits(TOP_LEVELS)) if asks else top.asks,
+                (trade.price(), trade.quantity(), trade.time()) if trade else top.last_trade,
+            )
+            if self._top_listener is not None:
+                self._top_listener(self._top)
+
     # CONTEXT MANAGERS #########################################################
 
     def __enter__(self):
@@ -268,13 +351,16 @@ class Orderbook:
 
         self._logger.info("processing order params")
 
+        t0 = time.perf_counter_ns()
         match orderparams.side:
             case OrderSide.BID:
                 order = BidOrder(orderparams)
+                self._latency["order"].record(time.perf_counter_ns() - t0)
                 result = self._process_bid_order(order)
 
             case OrderSide.ASK:
                 order = AskOrder(orderparams)
+                self._latency["order"].record(time.perf_counter_ns() - t0)
                 result = self._process_ask_order(order)
 
         if result.success():
@@ -289,14 +375,18 @@ class Orderbook:
             self._logger.info(msg)
             result.add_message(msg)
 
+        self._publish(trade=order.trades()[-1] if order.trades() else None)
         return result.build()
 
     def update(self, orderid: int, new_qty: Number) -> ExecutionResult:
-        """Update the quantity of an order sitting in the lob, given its id.
+        """Reduce the quantity of an order sitting in the lob, given its id. The order keeps its place in the queue
+        and the reservation of the quantity removed is released.
 
         Args:
             orderid (str): Identifier of the order to cancel.
-            new_qty (Number): New quantity of the order. Must be > 0, otherwise you should call `lob.cancel` instead.
+            new_qty (Number): New quantity of the order. Must be > 0, otherwise you should call `lob.cancel` instead,
+                and at most the current quantity: a larger order goes to the back of the queue, it must be canceled
+                and placed again.
 
         Returns:
             ExecutionResult: The result of the update.
@@ -352,9 +442,13 @@ class Orderbook:
                         self._logger.warning(errmsg)
                         return result.build()
 
+                    if new_qty_decimal > order.quantity():
+                        return self._increase_error(result, order, new_qty_decimal)
+
                     self._logger.info(
                         "updating bid order [%s] to qty [%f]", orderid, new_qty_decimal
                     )
+                    order.release_above(new_qty_decimal)
                     self._bidside.update_order(order, new_qty_decimal)
 
             case OrderSide.ASK:
@@ -367,17 +461,93 @@ class Orderbook:
                         self._logger.warning(errmsg)
                         return result.build()
 
+                    if new_qty_decimal > order.quantity():
+                        return self._increase_error(result, order, new_qty_decimal)
+
                     self._logger.info(
                         "updating ask order [%s] to qty [%f]", orderid, new_qty_decimal
                     )
+                    order.release_above(new_qty_decimal)
                     self._askside.update_order(order, new_qty_decimal)
 
         msg = f"order [{order.id()}] updated properly to [{new_qty_decimal}]"
+        self._publish(bids=order.side() == OrderSide.BID, asks=order.side() == OrderSide.ASK)
         result.set_success(True)
         result.add_message(msg)
         self._logger.info(msg)
         return result.build()
 
+    def would_cross(self, side: OrderSide, price: Decimal, without: Optional[Order] = None) -> bool:
+        """True if a limit order on `side` at `price` would match at once, as if `without` was canceled first."""
+
+        other = self._askside if side == OrderSide.BID else self._bidside
+        for level_price, volume, _ in other.best_limits(2):
+            if (
+                without is not None
+                and without.side() != side
+                and level_price == without.price()
+                and volume <= without.quantity()
+            ):
+                continue  # the level is emptied by the cancel
+            return level_price <= price if side == OrderSide.BID else level_price >= price
+        return False
+
+    def cancel_orders(
+        self,
+        client_id: str,
+        side: Optional[OrderSide] = None,
+        low: Optional[Decimal] = None,
+        high: Optional[Decimal] = None,
+        tag: Optional[str] = None,
+    ) -> list[Order]:
+        """Cancel the resting orders of a client on `side` (both if None) priced in [`low`, `high`] and, if `tag` is
+        given, whose client order id starts with it. Each side is swept once with its lock held, emptied limits are
+        removed together and the reservations released with one ledger update per asset.
+
+        Returns:
+            list[Order]: The orders canceled, oldest first.
+        """
+
+        if not self._alive:
+            self._logger.error("lob is not running (<ob.start> must be called before it can be used)")
+            return []
+
+        canceled = list()
+        released: dict[int, Decimal] = dict()
+        for s in (side,) if side is not None else (OrderSide.BID, OrderSide.ASK):
+            lobside = self._bidside if s == OrderSide.BID else self._askside
+            with lobside.lock():
+                orders = [
+                    order
+                    for order in self.client_orders(client_id, s, low, high)
+                    if tag is None or order.client_order_id().startswith(tag)
+                ]
+                for order in orders:
+                    asset_id, amount = order.reservation()
+                    released[asset_id] = released.get(asset_id, zero()) + amount
+                lobside.cancel_orders(orders)
+            canceled.extend(orders)
+
+        if not canceled:
+            return canceled
+
+        for order in canceled:
+            self._forget_order(order)
+        account_id = ledger.account_id(client_id)
+        for asset_id, amount in released.items():
+            ledger.release(account_id, asset_id, amount)
+
+        self._publish(bids=side != OrderSide.ASK, asks=side != OrderSide.BID)
+        self._logger.info("%s orders of [%s] canceled", len(canceled), client_id)
+        return sorted(canceled, key=Order.id)
+
+    def _increase_error(self, result: ResultBuilder, order: Order, new_qty: Decimal) -> ExecutionResult:
+        result.set_success(False)
+        errmsg = f"order [{order.id()}] quantity can not be increased in place ({new_qty} > {order.quantity()})"
+        result.add_message(errmsg)
+        self._logger.warning(errmsg)
+        return result.build()
+
     def cancel(self, orderid: int) -> ExecutionResult:
         """Cancel an order sitting in the lob, given its id.
 
@@ -433,13 +603,202 @@ class Orderbook:
                     self._askside.cancel_order(order)
 
         msg = f"order [{order.id()}] canceled properly"
-        del self._orders[order.id()]
+        self._forget_order(order)
+        self._publish(bids=order.side() == OrderSide.BID, asks=order.side() == OrderSide.ASK)
 
         result.set_success(True)
         result.add_message(msg)
         self._logger.info(msg)
         return result.build()
 
+    def replace_quotes(
+        self,
+        client_id: str,
+        bids: Iterable[tuple[Number, Number]],
+        asks: Iterable[tuple[Number, Number]],
+    ) -> QuoteResult:
+        """Replace the resting orders of a client by a new set of quotes, (price, quantity) pairs per side, in one step
+        with both sides locked. At a price still quoted, the client's orders keep their queue position: from the front
+        of the queue they are kept while they fit in the new quantity, the one straddling it is reduced in place and
+        the others are canceled; any missing quantity is placed at the back. Everything is checked first (valid
+        quotes, not crossing the book, enough balance): if anything fails the book is left untouched.
+
+        Returns:
+            QuoteResult: The orders placed, reduced and canceled.
+        """
+        result = QuoteResult()
+
+        if not self._alive:
+            result.fail("lob is not running (<ob.start> must be called before it can be used)")
+            return result
+
+        targets: dict[OrderSide, dict[Decimal, Decimal]] = dict()
+        try:
+            for side, quotes in ((OrderSide.BID, bids), (OrderSide.ASK, asks)):
+                levels = targets[side] = dict()
+                for price, quantity in quotes:
+                    OrderParams.check_args(side, price, quantity, False, OrderType.GTC, None)
+                    price = todecimal_price(price)
+                    levels[price] = levels.get(price, zero()) + todecimal_quantity(quantity)
+        except (TypeError, ValueError) as e:
+            result.fail(f"invalid quote: {e}")
+            self._logger.warning(result.messages()[0])
+            return result
+
+        bid_levels, ask_levels = targets[OrderSide.BID], targets[OrderSide.ASK]
+        if bid_levels and ask_levels and max(bid_levels) >= min(ask_levels):
+            result.fail("bid quotes must be priced below ask quotes")
+            self._logger.warning(result.messages()[0])
+            return result
+
+        with self._bidside.lock(), self._askside.lock():
+            bidplan = self._plan_quotes(self._bidside, client_id, bid_levels)
+            askplan = self._plan_quotes(self._askside, client_id, ask_levels)
+
+            errmsg = self._check_quotes(client_id, bid_levels, ask_levels, bidplan, askplan)
+            if errmsg:
+                result.fail(errmsg)
+                self._logger.warning(errmsg)
+                return result
+
+            # releases first, so that the new orders can reserve what they free
+            for side, (_, cancel, reduce, _) in ((self._bidside, bidplan), (self._askside, askplan)):
+                for order in cancel:
+                    side.cancel_order(order)
+                    self._forget_order(order)
+                    result.canceled().append(order)
+                for order, quantity in reduce:
+                    order.release_above(quantity)
+                    side.update_order(order, quantity)
+                    result.amended().append(order)
+
+            for side, (_, _, _, place) in ((self._bidside, bidplan), (self._askside, askplan)):
+                for price, quantity in place:
+                    params = OrderParams(client_id, None, side.side(), price, quantity, False)
+                    params.base = self._base
+                    params.quote = self._quote
+                    order = BidOrder(params) if side.side() == OrderSide.BID else AskOrder(params)
+                    side.place(order)
+                    self._orders[order.id()] = order
+                    self._index_order(order)
+                    result.placed().append(order)
+
+        self._publish()
+        self._logger.info("quotes of [%s] replaced: %s", client_id, result)
+        return result
+
+    def _plan_quotes(self, side, client_id: str, levels: dict[Decimal, Decimal]) -> tuple:
+        """
+        What `replace_quotes` does on `side`: (volume of the client per price, orders to cancel,
+        (order, quantity) to reduce, (price, quantity) to place). The side must be locked.
+        """
+        mine: dict[Decimal, Decimal] = dict()
+        for order in self.client_orders(client_id, side.side()):
+            mine[order.price()] = mine.get(order.price(), zero()) + order.quantity()
+
+        cancel, reduce, place = list(), list(), list()
+        for price in sorted(mine.keys() | levels.keys()):
+            left = levels.get(price, zero())
+            if price in mine:
+                for order in side.get_limit(price)._orderqueue:
+                    if order.client_id() != client_id or not order.valid():
+                        continue
+                    if order.quantity() <= left:
+                        left -= order.quantity()
+                    elif left > 0:
+                        reduce.append((order, left))
+                        left = zero()
+                    else:
+                        cancel.append(order)
+            if left > 0:
+                place.append((price, left))
+
+        return mine, cancel, reduce, place
+
+    def _check_quotes(self, client_id: str, bid_levels, ask_levels, bidplan, askplan) -> Optional[str]:
+        """Why the planned quotes (see `_plan_quotes`) can not be placed, None if they can. Both sides must be locked."""
+
+        def best_of_others(side, mine) -> Optional[Decimal]:
+            for limit in side.limits():
+                if limit.volume() > mine.get(limit.price(), zero()):
+                    return limit.price()
+            return None
+
+        best_ask = best_of_others(self._askside, askplan[0])
+        if bid_levels and best_ask is not None and max(bid_levels) >= best_ask:
+            return f"bid quotes would cross the best ask ({best_ask})"
+        best_bid = best_of_others(self._bidside, bidplan[0])
+        if ask_levels and best_bid is not None and min(ask_levels) <= best_bid:
+            return f"ask quotes would cross the best bid ({best_bid})"
+
+        # balance needed once the cancels and reductions have released theirs
+        _, cancel, reduce, place = bidplan
+        quote_needed = sum((price * quantity for price, quantity in place), zero())
+        quote_needed -= sum((o._orig_quote_qty - o._cummulative_quote_qty for o in cancel), zero())
+        quote_needed -= sum(((o.quantity() - q) * o.price() for o, q in reduce), zero())
+        _, cancel, reduce, place = askplan
+        base_needed = sum((quantity for _, quantity in place), zero())
+        base_needed -= sum((o.quantity() for o in cancel), zero())
+        base_needed -= sum((o.quantity() - q for o, q in reduce), zero())
+
+        account_id = ledger.account_id(client_id)
+        for asset, needed in ((self._quote, quote_needed), (self._base, base_needed)):
+            if needed > 0 and needed > ledger.balance(account_id, ledger.asset_id(asset))[0]:
+                return f"not enough available {asset} balance for the quotes"
+        return None
+
+    # PERSISTENCE ##############################################################
+
+    def orders(self) -> list[Order]:
+        """Every order known to the lob (resting and filled), in insertion order."""
+
+        return list(self._orders.values())
+
+    def resting_queues(self) -> list[tuple[OrderSide, Decimal, list[Order]]]:
+        """(side, price, orders in FIFO order) for every price level, bids then asks, best first."""
+
+        queues = []
+        for side in (self._bidside, self._askside):
+            with side.lock():
+                for limit in side.limits():
+                    queue = [order for order in limit._orderqueue if order.valid()]
+                    if queue:
+                        queues.append((side.side(), limit.price(), queue))
+        return queues
+
+    def load_orders(
+        self,
+        orders: Iterable[Order],
+        queues: Iterable[tuple[OrderSide, Decimal, list[Order]]],
+    ) -> None:
+        """
+        Bulk-load a saved state (see `orders` and `resting_queues`) into an empty lob.
+        Orders are put back as they were: nothing is matched, reserved or re-validated.
+        """
+
+        if self._orders:
+            raise ValueError("orders can only be loaded into an empty lob")
+
+        for order in orders:
+            self._orders[order.id()] = order
+            if order.valid():
+                self._index_order(order)
+            if order.otype() == OrderType.GTD and order.valid():
+                self._expirymap.setdefault(order.expiry(), []).append(order)
+
+        for side_kind, price, queue in queues:
+            side = self._bidside if side_kind == OrderSide.BID else self._askside
+            limit = Limit(price)
+            limit._orderqueue.extend(queue)
+            limit._valid_orders = len(queue)
+            for order in queue:
+                limit._volume += order.quantity()
+            side._price2limits[price] = limit
+            side.update_volume(limit.volume())
+
+        self._publish()
+        self._logger.info("%s orders loaded", len(self._orders))
+
     # DATA-COLLECTION ##########################################################
 
     def running_time(self) -> int:
@@ -461,15 +820,35 @@ class Orderbook:
         return order
 
     def get_open_orders_by_client_id(self, client_id: str) -> list[Order]:
-        return [
-            order
-            for order in self._orders.values()
-            if order.client_id() == client_id
-            and (
-                order.status() == OrderStatus.PENDING
-                or order.status() == OrderStatus.PARTIAL
-            )
-        ]
+        return sorted(self.client_orders(client_id), key=Order.id)
+
+    def client_orders(
+        self,
+        client_id: str,
+        side: Optional[OrderSide] = None,
+        low: Optional[Decimal] = None,
+        high: Optional[Decimal] = None,
+    ) -> list[Order]:
+        """Resting orders of a client on `side` (both if None) priced in [`low`, `high`], by price then age."""
+
+        clients = self._clients.get(client_id)
+        if clients is None:
+            return []
+        orders = clients.orders(side, low, high)
+        if clients.empty():  # all filled
+            self._drop_client(client_id)
+        return orders
+
+    def clients(self) -> list[str]:
+        """Clients with resting orders in the lob (or filled since the last lookup of their orders)."""
+
+        return list(self._clients.keys())
+
+    def set_client_listener(self, listener: Optional[Callable[[str, bool], None]]):
+        """Call `listener(client_id, True)` when a client gets resting orders in the lob, and
+        `listener(client_id, False)` once it is known to have none left (see `clients`)."""
+
+        self._client_listener = listener
 
     def get_order_by_client_order_id(
         self,
@@ -714,8 +1093,8 @@ class Orderbook:
 
         bids, asks = updates["bids"], updates["asks"]
 
-        # lock all to aply updates
-        with self._askside.lock(), self._bidside.lock():
+        # lock all to aply updates (bids first, like every path locking both sides)
+        with self._bidside.lock(), self._askside.lock():
 
             # apply updates to ask side
             self._askside.apply_updates(asks)
@@ -723,6 +1102,7 @@ class Orderbook:
             # apply updates to bid side
             self._bidside.apply_updates(bids)
 
+        self._publish()
         self._logger.info("updates applied successfully")
 
     def step(self):
@@ -766,8 +1146,13 @@ class Orderbook:
                 return result
 
             # execute the order
+            t0 = time.perf_counter_ns()
             with self._askside.lock():
+                t1 = time.perf_counter_ns()
                 result = engine.execute(order, self._askside)
+                t2 = time.perf_counter_ns()
+            self._latency["lock"].record(t1 - t0)
+            self._latency["execute"].record(t2 - t1)
 
             if not result.success():
                 self._logger.error(
@@ -801,7 +1186,9 @@ class Orderbook:
             return result
 
         # place the order in the side
+        t0 = time.perf_counter_ns()
         with self._bidside.lock():
+            self._latency["lock"].record(time.perf_counter_ns() - t0)
             self._bidside.place(order)
 
         result.set_success(True)
@@ -829,8 +1216,13 @@ class Orderbook:
                 return result
 
             # execute the order
+            t0 = time.perf_counter_ns()
             with self._bidside.lock():
+                t1 = time.perf_counter_ns()
                 result = engine.execute(order, self._bidside)
+                t2 = time.perf_counter_ns()
+            self._latency["lock"].record(t1 - t0)
+            self._latency["execute"].record(t2 - t1)
 
             if not result.success():
                 self._logger.error(
@@ -864,7 +1256,9 @@ class Orderbook:
             return result
 
         # place the order in the side
+        t0 = time.perf_counter_ns()
         with self._askside.lock():
+            self._latency["lock"].record(time.perf_counter_ns() - t0)
             self._askside.place(order)
 
         result.set_success(True)
@@ -874,6 +1268,8 @@ class Orderbook:
     def _save_order(self, order: Order, result: ResultBuilder):
         self._logger.info("adding order to history")
         self._orders[order.id()] = order
+        if order.valid():  # resting
+            self._index_order(order)
 
         if order.otype() == OrderType.GTD and result._kind.in_limit():
 
@@ -882,6 +1278,29 @@ class Orderbook:
                 self._expirymap[order.expiry()] = list()
             self._expirymap[order.expiry()].append(order)
 
+    def _index_order(self, order: Order):
+        clients = self._clients.get(order.client_id())
+        if clients is None:
+            clients = self._clients[order.client_id()] = ClientOrders()
+            if self._client_listener is not None:
+                self._client_listener(order.client_id(), True)
+        clients.add(order)
+
+    def _drop_client(self, client_id: str):
+        # the expiry thread may drop it too
+        if self._clients.pop(client_id, None) is not None and self._client_listener is not None:
+            self._client_listener(client_id, False)
+
+    def _forget_order(self, order: Order):
+        """Remove a canceled order from the lob."""
+
+        del self._orders[order.id()]
+        clients = self._clients.get(order.client_id())
+        if clients is not None:
+            clients.remove(order)
+            if clients.empty():
+                self._drop_client(order.client_id())
+
     def _cancel_expired_orders(self):
         """Background expired orders cleaner."""
 
@@ -912,6 +1331,7 @@ class Orderbook:
                         with self._bidside.lock():
                             self._bidside.cancel_order(order)
 
-                del self._orders[order.id()]
+                self._forget_order(order)
 
             del self._expirymap[key]
+            self._publish()
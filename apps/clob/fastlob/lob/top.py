@@ -0,0 +1,34 @@
+"""Immutable snapshots of the best levels of a lob."""
+
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+Level = tuple[Decimal, Decimal, int]
+# ^ (price, volume, #orders)
+LastTrade = tuple[Decimal, Decimal, int]
+# ^ (price, quantity, time in ms)
+
+
+class TopOfBook(NamedTuple):
+    """
+    The best levels of each side of a lob at `version`, best first, and the last trade of the lob (None until the
+    first one). Published by the lob after every mutation and never modified afterwards, so readers can use it from
+    any thread without locking.
+    """
+
+    version: int
+    bids: tuple[Level, ...]
+    asks: tuple[Level, ...]
+    last_trade: Optional[LastTrade] = None
+
+    def best_bid(self) -> Optional[Level]:
+        """Best bid level, None if there is no bid."""
+        return self.bids[0] if self.bids else None
+
+    def best_ask(self) -> Optional[Level]:
+        """Best ask level, None if there is no ask."""
+        return self.asks[0] if self.asks else None
+
+    def head(self, n: int) -> "TopOfBook":
+        """The same snapshot limited to the best `n` levels of each side."""
+        return TopOfBook(self.version, self.bids[:n], self.asks[:n], self.last_trade)
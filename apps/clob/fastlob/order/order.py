@@ -1,16 +1,22 @@
 """The order object manipulated by the lob."""
 
 import abc
-import secrets
 from typing import Optional
 from decimal import Decimal
 from dataclasses import dataclass
-from account import SpotAccount, get_account
+from account import ledger, LEDGER_DECIMALS
+from fastlob.consts import DECIMAL_PRECISION_PRICE, DECIMAL_PRECISION_QTY
 from fastlob.enums import OrderSide, OrderType, OrderStatus
 from fastlob.trade import Trade
-from fastlob.consts import ORDERS_ID_SIZE
+from fastlob.utils import order_ids, time_asms
 from .params import OrderParams
-import time
+
+# the ledger takes notionals (price * quantity) exactly: checked once here, a fill cannot fail on it midway
+if DECIMAL_PRECISION_PRICE + DECIMAL_PRECISION_QTY > LEDGER_DECIMALS:
+    raise ValueError(
+        f"price and quantity precisions ({DECIMAL_PRECISION_PRICE} + {DECIMAL_PRECISION_QTY}) "
+        f"exceed the {LEDGER_DECIMALS} decimals of the ledger"
+    )
 
 
 @dataclass
@@ -35,15 +41,15 @@ class Order(abc.ABC):
 
     _base: str
     _quote: str
-    _account: SpotAccount
+    _account_id: int
+    _base_id: int
+    _quote_id: int
 
     def __init__(self, params: OrderParams):
-        self._id = int(secrets.token_hex(nbytes=ORDERS_ID_SIZE), 16)
+        self._id = order_ids()
         self._client_id = params.client_id
         self._client_order_id = (
-            params.client_order_id
-            if params.client_order_id
-            else secrets.token_urlsafe(nbytes=ORDERS_ID_SIZE)
+            params.client_order_id if params.client_order_id else f"auto-{self._id}"
         )
         self._price = params.price
         self._org_quantity = params.quantity
@@ -54,22 +60,64 @@ class Order(abc.ABC):
         self._status = OrderStatus.CREATED
         self._orig_quote_qty = params.quantity * params.price
         self._cummulative_quote_qty = Decimal("0")
-        self._time = int(time.time() * 1000)
+        self._time = time_asms()
         self._trades = []
         self._base = params.base
         self._quote = params.quote
         self._side = params.side
 
-        self._account = get_account(params.client_id)
+        self._account_id = ledger.account_id(params.client_id)
+        self._base_id = ledger.asset_id(params.base)
+        self._quote_id = ledger.asset_id(params.quote)
         if not self._is_market:
             if self._side == OrderSide.BID:
-                self._account.get_balance(self._quote).on_place_limit_order(
-                    self._orig_quote_qty
-                )
+                ledger.reserve(self._account_id, self._quote_id, self._orig_quote_qty)
             else:
-                self._account.get_balance(self._base).on_place_limit_order(
-                    self._org_quantity
-                )
+                ledger.reserve(self._account_id, self._base_id, self._org_quantity)
+
+    @staticmethod
+    def restore(
+        id: int,
+        client_id: str,
+        client_order_id: str,
+        side: OrderSide,
+        price: Decimal,
+        org_quantity: Decimal,
+        quantity: Decimal,
+        is_market: bool,
+        otype: OrderType,
+        expiry: Optional[int],
+        status: OrderStatus,
+        orig_quote_qty: Decimal,
+        cummulative_quote_qty: Decimal,
+        time: int,
+        trades: list[Trade],
+        base: str,
+        quote: str,
+    ) -> "Order":
+        """Rebuild a saved order as is: no id is drawn and no balance is reserved."""
+        order = object.__new__(BidOrder if side == OrderSide.BID else AskOrder)
+        order._id = id
+        order._client_id = client_id
+        order._client_order_id = client_order_id
+        order._side = side
+        order._price = price
+        order._org_quantity = org_quantity
+        order._quantity = quantity
+        order._is_market = is_market
+        order._otype = otype
+        order._expiry = expiry
+        order._status = status
+        order._orig_quote_qty = orig_quote_qty
+        order._cummulative_quote_qty = cummulative_quote_qty
+        order._time = time
+        order._trades = trades
+        order._base = base
+        order._quote = quote
+        order._account_id = ledger.account_id(client_id)
+        order._base_id = ledger.asset_id(base)
+        order._quote_id = ledger.asset_id(quote)
+        return order
 
     def id(self) -> int:
         """Getter for order identifier."""
@@ -117,15 +165,18 @@ class Order(abc.ABC):
         """Set the order status."""
         self._status = status
 
-    def cancel(self):
-        """Cancel the order."""
-        self.set_status(OrderStatus.CANCELED)
+    def reservation(self) -> tuple[int, Decimal]:
+        """(asset id, amount) still reserved by the order."""
         if self._side == OrderSide.BID:
-            self._account.get_balance(self._quote).on_cancel_limit_order(
-                self._orig_quote_qty - self._cummulative_quote_qty
-            )
-        else:
-            self._account.get_balance(self._base).on_cancel_limit_order(self._quantity)
+            return self._quote_id, self._orig_quote_qty - self._cummulative_quote_qty
+        return self._base_id, self._quantity
+
+    def cancel(self, release: bool = True):
+        """Cancel the order. Its reservation is released, unless `release` is False: the caller then releases it
+        (see `reservation`)."""
+        self.set_status(OrderStatus.CANCELED)
+        if release:
+            ledger.release(self._account_id, *self.reservation())
 
     def fill(self, quantity: Decimal, price: Optional[Decimal] = None):
         """Decrease the quantity of the order by some numerical value. If `quantity` is greater than the order qty,
@@ -139,18 +190,26 @@ class Order(abc.ABC):
         quote_qty = executed_qty * executed_price
         self._cummulative_quote_qty += quote_qty
 
+        # a resting order pays out of its reservation, a market order out of
+        # the available balance
         if self._side == OrderSide.BID:
-            if self._is_market:
-                self._account.get_balance(self._quote).on_withdraw(quote_qty)
-            else:
-                self._account.get_balance(self._quote).take_reservation(quote_qty)
-            self._account.get_balance(self._base).on_deposit(executed_qty)
+            ledger.settle(
+                self._account_id,
+                self._quote_id,
+                quote_qty,
+                not self._is_market,
+                self._base_id,
+                executed_qty,
+            )
         else:
-            if self._is_market:
-                self._account.get_balance(self._base).on_withdraw(executed_qty)
-            else:
-                self._account.get_balance(self._base).take_reservation(executed_qty)
-            self._account.get_balance(self._quote).on_deposit(quote_qty)
+            ledger.settle(
+                self._account_id,
+                self._base_id,
+                executed_qty,
+                not self._is_market,
+                self._quote_id,
+                quote_qty,
+            )
 
         trade = Trade(
             self._id,
@@ -170,6 +229,18 @@ class Order(abc.ABC):
         """Update the quantity of the order to some numerical value"""
         self._quantity = quantity
 
+    def release_above(self, quantity: Decimal):
+        """Lower the order size so that only `quantity` remains, releasing the reservation of the difference.
+        The remaining quantity itself is set by the limit, see `Limit.update_order`.
+        """
+        diff = self._quantity - quantity
+        self._org_quantity -= diff
+        if self._side == OrderSide.BID:
+            self._orig_quote_qty -= diff * self._price
+            ledger.release(self._account_id, self._quote_id, diff * self._price)
+        else:
+            ledger.release(self._account_id, self._base_id, diff)
+
     def valid(self) -> bool:
         """True if order is valid (can be matched)."""
         return self.status() in OrderStatus.valid_states()
@@ -1,13 +1,12 @@
 """Order params are used to create orders, they are created by the client."""
 
-import time
 from math import ceil
 from decimal import Decimal
 from numbers import Number
 from typing import Optional
 
 from fastlob.enums import OrderSide, OrderType
-from fastlob.utils import todecimal_price, todecimal_quantity
+from fastlob.utils import todecimal_price, todecimal_quantity, now as clock_now
 from fastlob.consts import TICK_SIZE_PRICE, TICK_SIZE_QTY, MAX_VALUE
 
 
@@ -94,7 +93,7 @@ class OrderParams:
                 raise ValueError("order is GTD but expiry is None")
 
             expiry = int(expiry)
-            now = ceil(time.time())
+            now = ceil(clock_now())
             if expiry <= now:
                 raise ValueError(
                     f"order expiry ({expiry}) is less than current timestamp ({now}), or too close"
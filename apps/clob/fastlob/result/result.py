@@ -20,8 +20,7 @@ class ResultBuilder:
     def __init__(self, kind: ResultType, orderid: int, client_order_id: Optional[str] = None):
         self._kind = kind
         self._orderid = orderid
-        if client_order_id:
-            self._client_order_id = client_order_id
+        self._client_order_id = client_order_id
         self._messages = list()
         self._orders_matched = 0
         self._execprices = defaultdict(Decimal) if kind == ResultType.MARKET else None
@@ -138,3 +137,52 @@ class ExecutionResult:
                 f'orderid={self.orderid()}, messages={self.messages()})'
 
         return f'ExecutionResult(type={self.kind().name}, success={self.success()}, orderid={self.orderid()})'
+
+class QuoteResult:
+    '''The result of `Orderbook.replace_quotes`: the orders it placed, reduced in place and canceled.'''
+
+    _success: bool
+    _messages: list[str]
+    _placed: list
+    _amended: list
+    _canceled: list
+
+    def __init__(self):
+        self._success = True
+        self._messages = list()
+        self._placed = list()
+        self._amended = list()
+        self._canceled = list()
+
+    def fail(self, message: str):
+        '''Mark the replacement as rejected (nothing was changed) because of `message`.'''
+        self._success = False
+        self._messages.append(message)
+
+    def success(self) -> bool:
+        '''Getter for success attribute, true if the quotes were replaced.'''
+        return self._success
+
+    def messages(self) -> list[str]:
+        '''Getter for info messages.'''
+        return self._messages.copy()
+
+    def placed(self) -> list:
+        '''Orders placed, at the back of their queue.'''
+        return self._placed
+
+    def amended(self) -> list:
+        '''Orders whose quantity was reduced, keeping their queue position.'''
+        return self._amended
+
+    def canceled(self) -> list:
+        '''Orders canceled.'''
+        return self._canceled
+
+    def prices(self) -> set[Decimal]:
+        '''Prices of every level changed.'''
+        return {order.price() for order in self._placed + self._amended + self._canceled}
+
+    def __repr__(self) -> str:
+        return f'QuoteResult(success={self.success()}, placed={len(self._placed)}, ' + \
+            f'amended={len(self._amended)}, canceled={len(self._canceled)}, messages={self.messages()})'
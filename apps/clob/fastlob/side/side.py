@@ -112,6 +112,20 @@ class Side(abc.ABC):
         if lim.empty():
             del self._price2limits[lim.price()]
 
+    def cancel_orders(self, orders: Iterable[Order]) -> None:
+        """Cancel orders sitting in the side, leaving their reservations to the caller (see `Order.reservation`).
+        The limits emptied are removed once, at the end."""
+
+        touched = dict()
+        for order in orders:
+            self._volume -= order.quantity()
+            lim = self.get_limit(order.price())
+            lim.cancel_order(order, release=False)
+            touched[lim.price()] = lim
+        for price, lim in touched.items():
+            if lim.empty():
+                del self._price2limits[price]
+
     def get_limit(self, price: Decimal) -> Limit:
         """Get the limit sitting at a certain price."""
 
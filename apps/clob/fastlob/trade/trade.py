@@ -1,11 +1,9 @@
 """The order object manipulated by the lob."""
 
-import secrets
 from decimal import Decimal
 from dataclasses import dataclass
 
-from fastlob.consts import ORDERS_ID_SIZE
-import time
+from fastlob.utils import trade_ids, time_asms
 
 @dataclass
 class Trade:
@@ -20,7 +18,7 @@ class Trade:
     _time: int
 
     def __init__(self, order_id: int, price: Decimal, quantity: Decimal, is_buyer: bool = False, is_maker: bool = False):
-        self._id = int(secrets.token_hex(nbytes=ORDERS_ID_SIZE), 16)
+        self._id = trade_ids()
         
         self._order_id = order_id
         self._price = price
@@ -29,7 +27,22 @@ class Trade:
 
         self._is_buyer = is_buyer
         self._is_maker = is_maker
-        self._time = int(time.time() * 1000)
+        self._time = time_asms()
+
+    @staticmethod
+    def restore(id: int, order_id: int, price: Decimal, quantity: Decimal, quote_qty: Decimal,
+                is_buyer: bool, is_maker: bool, time: int) -> "Trade":
+        """Rebuild a saved trade as is, without drawing an id."""
+        trade = object.__new__(Trade)
+        trade._id = id
+        trade._order_id = order_id
+        trade._price = price
+        trade._quantity = quantity
+        trade._quote_qty = quote_qty
+        trade._is_buyer = is_buyer
+        trade._is_maker = is_maker
+        trade._time = time
+        return trade
 
     def id(self) -> int:
         """Getter for trade identifier."""
@@ -54,4 +67,8 @@ class Trade:
         return self._is_buyer
     
     def is_maker(self) -> bool:
-        return self._is_maker
\ No newline at end of file
+        return self._is_maker
+
+    def time(self) -> int:
+        """Getter for the trade time (ms)."""
+        return self._time
@@ -4,5 +4,11 @@ from .utils import (
     todecimal_price,
     todecimal_quantity,
     time_asint,
+    time_asms,
+    now,
+    pin_time,
+    IdSequence,
+    order_ids,
+    trade_ids,
     zero,
 )
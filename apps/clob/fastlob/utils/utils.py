@@ -1,8 +1,10 @@
 '''Global utility functions.'''
 
 import time
+import threading
 from decimal import Decimal
 from numbers import Number
+from typing import Optional
 
 from fastlob.consts import DECIMAL_PRECISION_PRICE, DECIMAL_PRECISION_QTY
 
@@ -31,7 +33,66 @@ def zero():
 
     return Decimal('0')
 
+class _PinnedClock(threading.local):
+    '''Time pinned by `pin_time`, per thread: the expiry thread and the event loop keep the real clock
+    while a command runs on another thread.'''
+
+    ms: Optional[int] = None
+
+_pinned = _PinnedClock()
+
+def now() -> float:
+    '''time.time(), or the time pinned with `pin_time` in this thread.'''
+
+    ms = _pinned.ms
+    return time.time() if ms is None else ms / 1000
+
+def pin_time(ms: Optional[int]) -> None:
+    '''Make the clock of the calling thread return `ms` (epoch milliseconds) until unpinned with `pin_time(None)`.
+    Commands are run with the clock pinned so that replaying them yields the same timestamps.'''
+
+    _pinned.ms = ms
+
 def time_asint() -> int:
-    '''int(time.time())'''
+    '''int(now())'''
+
+    return int(now())
+
+def time_asms() -> int:
+    '''int(now() * 1000)'''
+
+    ms = _pinned.ms
+    return int(time.time() * 1000) if ms is None else ms
+
+class IdSequence:
+    '''Thread-safe sequence of increasing ids, starting at 1.'''
+
+    _next: int
+    _lock: threading.Lock
+
+    def __init__(self):
+        self._next = 1
+        self._lock = threading.Lock()
+
+    def __call__(self) -> int:
+        '''Return the next id.'''
+
+        with self._lock:
+            i = self._next
+            self._next += 1
+            return i
+
+    def peek(self) -> int:
+        '''The id the next call will return.'''
+
+        return self._next
+
+    def restore(self, next_id: int) -> None:
+        '''Continue the sequence at `next_id`.'''
+
+        with self._lock:
+            self._next = next_id
+
+order_ids = IdSequence()
 
-    return int(time.time())
+trade_ids = IdSequence()
@@ -0,0 +1,54 @@
+"""
+Stateless HTTP gateway in front of the standalone engine process (`engine`):
+the REST API of `app`, without the websocket streams, parsed and validated
+here and run by the engine over a Unix domain socket (see `exchange.ipc`).
+It holds no state, so it can run as many workers as there are cores to spare:
+
+    CLOB_ENGINE_SOCKET=/tmp/clob-engine.sock python engine.py
+    CLOB_ENGINE_SOCKET=/tmp/clob-engine.sock uvicorn gateway_app:app --port 8079 --workers 4
+"""
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from apis.routes import gateway, metrics
+from metrics import loop_monitor
+from middleware import (
+    BodyNormalizeMiddleware,
+    RateLimitMiddleware,
+    RequestTimingMiddleware,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    yield
+    await gateway.engine.close()
+    loop_monitor.stop()
+
+
+app = FastAPI(
+    lifespan=lifespan,
+    title="Test Environment gateway",
+    description="API for testing orderbook, served by a standalone engine",
+    version="1.0.0",
+    docs_url="/docs",
+    redoc_url="/redoc",
+    openapi_url="/openapi.json",
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Adjust origins for production
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(BodyNormalizeMiddleware)
+# before the body is read, see `apis.rate_limit`
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(RequestTimingMiddleware)
+
+app.include_router(gateway.router)
+app.include_router(metrics.router)
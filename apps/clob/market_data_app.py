@@ -0,0 +1,47 @@
+"""
+Read-only market data API: `/depth`, `/ticker/bookTicker` and `/exchangeInfo`
+served from the top-of-book the engine process (`app`) shares in memory, so
+that any number of worker processes can take the public market data load off
+the engine. Start the engine with CLOB_SHM_NAME set, then the workers with
+the same name, e.g.
+
+    CLOB_SHM_NAME=clob-top uvicorn app:app --port 8079
+    CLOB_SHM_NAME=clob-top uvicorn market_data_app:app --port 8080 --workers 4
+"""
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from apis.routes import shared_market_data
+from metrics import loop_monitor
+from middleware import RequestTimingMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    yield
+    shared_market_data.close_reader()
+    loop_monitor.stop()
+
+
+app = FastAPI(
+    lifespan=lifespan,
+    title="Test Environment market data",
+    description="Read-only market data of the testing orderbook",
+    version="1.0.0",
+    docs_url="/docs",
+    redoc_url="/redoc",
+    openapi_url="/openapi.json",
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Adjust origins for production
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(RequestTimingMiddleware)
+
+app.include_router(shared_market_data.router)
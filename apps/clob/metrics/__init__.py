@@ -0,0 +1,33 @@
+from .histogram import Histogram, RollingHistogram, DEFAULT_PERCENTILES
+from .registry import (
+    registry,
+    Registry,
+    LatencyFamily,
+    CounterFamily,
+    GaugeFamily,
+    LATENCY_BUCKETS_S,
+)
+
+# whole requests, from the first byte in to the last byte out
+request_latency = registry.latency(
+    "clob_request_duration_seconds",
+    "HTTP request latency per route.",
+    ("method", "route"),
+)
+
+# parse: body read and validation, handler: route function, response: encoding and send
+request_stage_latency = registry.latency(
+    "clob_request_stage_duration_seconds",
+    "HTTP request latency per route and stage (parse, handler, response).",
+    ("method", "route", "stage"),
+)
+
+# stages of the matching path, see the `stage` label values where they are observed
+engine_stage_latency = registry.latency(
+    "clob_engine_stage_duration_seconds",
+    "Matching path latency per stage and symbol.",
+    ("stage", "symbol"),
+)
+
+# event loop lag, GC pauses and stalls, see `loop_monitor`
+from .loop_monitor import loop_monitor  # noqa: E402
@@ -0,0 +1,209 @@
+"""Log-linear histogram of integer measurements (latencies in nanoseconds, sizes...)."""
+
+import time
+from typing import Callable, Iterable, Optional
+
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Histogram:
+    """
+    Records non-negative integers into log-linear buckets, HdrHistogram style:
+    each power of two is split in `2**precision_bits` linear sub-buckets, so a
+    value is reported with a relative error below `2**-precision_bits` (3% by
+    default) whatever its magnitude, in constant memory.
+
+    Recording is a few integer operations and a list increment. It is not
+    locked: record from one thread, or accept the odd lost increment.
+    """
+
+    _bits: int
+    _sub_buckets: int
+    _counts: list[int]
+    _count: int
+    _total: int
+    _min: Optional[int]
+    _max: int
+
+    def __init__(self, precision_bits: int = 5):
+        self._bits = precision_bits
+        self._sub_buckets = 1 << precision_bits
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded value."""
+
+        self._counts = [0] * (2 * self._sub_buckets)
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self._sub_buckets:
+            return value
+        shift = value.bit_length() - self._bits - 1
+        return ((shift + 1) << self._bits) + (value >> shift) - self._sub_buckets
+
+    def _upper_bound(self, index: int) -> int:
+        """Highest value falling into bucket `index`."""
+
+        if index < self._sub_buckets:
+            return index
+        shift = (index >> self._bits) - 1
+        mantissa = (index & (self._sub_buckets - 1)) + self._sub_buckets
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int, count: int = 1):
+        """Record `value` (clamped at 0) `count` times."""
+
+        if value < 0:
+            value = 0
+        i = self._index(value)
+        counts = self._counts
+        if i >= len(counts):
+            counts.extend([0] * (i + 1 - len(counts)))
+        counts[i] += count
+        self._count += count
+        self._total += value * count
+        if self._min is None or value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+
+    def merge(self, other: "Histogram"):
+        """Add the values recorded by `other`, which must have the same precision."""
+
+        if other._bits != self._bits:
+            raise ValueError("histograms of different precision can not be merged")
+        if len(other._counts) > len(self._counts):
+            self._counts.extend([0] * (len(other._counts) - len(self._counts)))
+        for i, n in enumerate(other._counts):
+            if n:
+                self._counts[i] += n
+        self._count += other._count
+        self._total += other._total
+        if other._min is not None and (self._min is None or other._min < self._min):
+            self._min = other._min
+        self._max = max(self._max, other._max)
+
+    def count(self) -> int:
+        return self._count
+
+    def total(self) -> int:
+        """Sum of the recorded values."""
+
+        return self._total
+
+    def min(self) -> int:
+        return self._min or 0
+
+    def max(self) -> int:
+        return self._max
+
+    def mean(self) -> float:
+        return self._total / self._count if self._count else 0.0
+
+    def percentile(self, q: float) -> int:
+        """Value below or at which `q` percent of the recorded values fall (0 if empty)."""
+
+        if not self._count:
+            return 0
+        rank = max(1, -(-self._count * q // 100))
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                return min(self._upper_bound(i), self._max)
+        return self._max
+
+    def percentiles(self, qs: Iterable[float] = DEFAULT_PERCENTILES) -> dict[float, int]:
+        """`percentile` of each of `qs`, computed in one pass."""
+
+        qs = sorted(qs)
+        result = {q: 0 for q in qs}
+        if not self._count:
+            return result
+        ranks = [(max(1, -(-self._count * q // 100)), q) for q in qs]
+        seen = 0
+        r = 0
+        for i, n in enumerate(self._counts):
+            if not n:
+                continue
+            seen += n
+            while r < len(ranks) and seen >= ranks[r][0]:
+                result[ranks[r][1]] = min(self._upper_bound(i), self._max)
+                r += 1
+            if r == len(ranks):
+                break
+        return result
+
+    def buckets(self) -> Iterable[tuple[int, int]]:
+        """(upper bound, count) of every non-empty bucket, in increasing order."""
+
+        for i, n in enumerate(self._counts):
+            if n:
+                yield self._upper_bound(i), n
+
+    def summary(
+        self, qs: Iterable[float] = DEFAULT_PERCENTILES, scale: float = 1.0
+    ) -> dict:
+        """Count, mean, max and percentiles as a dict, values divided by `scale`."""
+
+        summary = {"count": self._count, "mean": self.mean() / scale}
+        for q, value in self.percentiles(qs).items():
+            summary[f"p{q:g}"] = value / scale
+        summary["max"] = self._max / scale
+        return summary
+
+
+class RollingHistogram:
+    """
+    The values recorded in the last `window_s` seconds (give or take one
+    slot): `slots` histograms each covering `window_s / slots` seconds, the
+    oldest reset as the window moves. Not locked, like `Histogram`.
+    """
+
+    window_s: float
+    _slot_s: float
+    _slots: list[Histogram]
+    _slot: int
+    _slot_start: float
+    _clock: Callable[[], float]
+
+    def __init__(
+        self,
+        window_s: float = 60.0,
+        slots: int = 6,
+        precision_bits: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window_s = window_s
+        self._slot_s = window_s / slots
+        self._slots = [Histogram(precision_bits) for _ in range(slots)]
+        self._slot = 0
+        self._clock = clock
+        self._slot_start = clock()
+
+    def _advance(self):
+        elapsed = self._clock() - self._slot_start
+        if elapsed < self._slot_s:
+            return
+        steps = int(elapsed // self._slot_s)
+        for _ in range(min(steps, len(self._slots))):
+            self._slot = (self._slot + 1) % len(self._slots)
+            self._slots[self._slot].reset()
+        self._slot_start += steps * self._slot_s
+
+    def record(self, value: int, count: int = 1):
+        self._advance()
+        self._slots[self._slot].record(value, count)
+
+    def snapshot(self) -> Histogram:
+        """The values of the window, merged in a new histogram."""
+
+        self._advance()
+        merged = Histogram(self._slots[0]._bits)
+        for histogram in self._slots:
+            merged.merge(histogram)
+        return merged
@@ -0,0 +1,293 @@
+"""
+Event loop lag and GC pause monitor.
+
+The API handlers, the matching engine and the websocket fan-out all run on the
+event loop thread, so anything slow there (a large scan, a GC pause) delays
+everything else. `LoopMonitor` measures it three ways:
+
+- lag: a task sleeping `interval_s` in a loop records how late it wakes up,
+  i.e. how long the loop was busy when it should have run it;
+- GC pauses: `gc.callbacks` time every collection, per generation;
+- stalls: a watchdog thread notices when the lag task has not run for
+  `stall_threshold_s` and, while the loop is still blocked, records what it is
+  running: the route when it is an HTTP handler (see `label_frames`), the
+  running task otherwise, and the stack.
+
+Lag and pauses are recorded both in the cumulative histograms exposed at
+/metrics and in rolling windows, from which `health` decides whether the
+process should take more load.
+"""
+
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from .histogram import RollingHistogram
+from .profiler import frame_name
+from .registry import registry
+
+LAG_INTERVAL_S = float(os.environ.get("CLOB_LOOP_LAG_INTERVAL_MS", "10")) / 1000
+STALL_THRESHOLD_S = float(os.environ.get("CLOB_LOOP_STALL_THRESHOLD_MS", "50")) / 1000
+# `health` reports overloaded above this rolling p99 lag
+HEALTH_MAX_LAG_S = float(os.environ.get("CLOB_HEALTH_MAX_LAG_MS", "100")) / 1000
+WINDOW_S = 60.0
+
+ROLLING_QUANTILES = (50, 99, 99.9)
+STACK_DEPTH = 24
+
+loop_lag = registry.latency(
+    "clob_event_loop_lag_seconds",
+    "Delay of the event loop in running a task due to run.",
+)
+gc_pause = registry.latency(
+    "clob_gc_pause_seconds",
+    "Garbage collection pause per generation.",
+    ("generation",),
+)
+loop_stalls = registry.counter(
+    "clob_event_loop_stalls_total",
+    "Event loop blocked longer than the stall threshold, per running handler.",
+    ("handler",),
+)
+
+
+class Stall:
+    """The event loop blocked by `handler` since `started_ns`, `stack` innermost last."""
+
+    __slots__ = ("time_ms", "started_ns", "handler", "stack", "lag_ns")
+
+    def __init__(self, started_ns: int, handler: str, stack: list[str]):
+        self.time_ms = int(time.time() * 1000)
+        self.started_ns = started_ns
+        self.handler = handler
+        self.stack = stack
+        # set once the loop is back, the whole lag of the stalled iteration
+        self.lag_ns: Optional[int] = None
+
+    def to_json(self) -> dict:
+        return {
+            "time": self.time_ms,
+            "handler": self.handler,
+            "lagMs": self.lag_ns / 1e6 if self.lag_ns is not None else None,
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    interval_s: float
+    stall_threshold_s: float
+    lag: RollingHistogram
+    gc_pauses: list[RollingHistogram]
+    stalls: deque
+    _label_frames: dict
+    _loop_thread: Optional[int]
+    _heartbeat_ns: int
+    _pending: Optional[Stall]
+    _gc_start_ns: Optional[int]
+    _task: Optional[asyncio.Task]
+    _watchdog: Optional[threading.Thread]
+    _stop: threading.Event
+
+    def __init__(
+        self,
+        interval_s: float = LAG_INTERVAL_S,
+        stall_threshold_s: float = STALL_THRESHOLD_S,
+        window_s: float = WINDOW_S,
+    ):
+        self.interval_s = interval_s
+        self.stall_threshold_s = stall_threshold_s
+        self.lag = RollingHistogram(window_s)
+        self.gc_pauses = [RollingHistogram(window_s) for _ in range(3)]
+        self.stalls = deque(maxlen=64)
+        self._label_frames = {}
+        self._loop_thread = None
+        self._heartbeat_ns = 0
+        self._pending = None
+        self._gc_start_ns = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    def label_frames(self, code, local: str):
+        """Name a stall after local `local` of the innermost frame running `code`."""
+
+        self._label_frames[code] = local
+
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Start monitoring the running event loop."""
+
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat_ns = time.perf_counter_ns()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure_lag())
+        gc.callbacks.append(self._on_gc)
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        self._stop.set()
+        self._watchdog.join()
+        self._watchdog = None
+
+    async def _measure_lag(self):
+        interval_ns = int(self.interval_s * 1e9)
+        threshold_ns = int(self.stall_threshold_s * 1e9)
+        clock = time.perf_counter_ns
+        while True:
+            due = clock() + interval_ns
+            await asyncio.sleep(self.interval_s)
+            now = clock()
+            lag = now - due
+            if lag < 0:
+                lag = 0
+            self._heartbeat_ns = now
+            self.lag.record(lag)
+            loop_lag.observe(lag)
+            if lag >= threshold_ns:
+                stall = self._pending
+                self._pending = None
+                if stall is None:  # the watchdog did not see it, too short
+                    stall = Stall(due, "unknown", [])
+                    self.stalls.append(stall)
+                    loop_stalls.inc("unknown")
+                stall.lag_ns = lag
+
+    def _watch(self):
+        interval_ns = int(self.interval_s * 1e9)
+        threshold_ns = int(self.stall_threshold_s * 1e9)
+        while not self._stop.wait(max(self.stall_threshold_s / 4, 0.002)):
+            heartbeat = self._heartbeat_ns
+            started = heartbeat + interval_ns
+            if self._pending is not None or time.perf_counter_ns() - started < threshold_ns:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None or self._heartbeat_ns != heartbeat:
+                continue
+            handler, stack = self._describe(frame)
+            stall = Stall(started, handler, stack)
+            self._pending = stall
+            self.stalls.append(stall)
+            loop_stalls.inc(handler)
+
+    def _describe(self, frame) -> tuple[str, list[str]]:
+        """(handler, stack) of the loop thread, whose innermost frame is `frame`."""
+
+        handler = None
+        task = None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if len(stack) < STACK_DEPTH:
+                stack.append(frame_name(frame))
+            if handler is None and code in self._label_frames:
+                handler = str(frame.f_locals.get(self._label_frames[code]))
+            caller = frame.f_back
+            # the first frame under the loop's callback runner: the running task
+            if (
+                caller is not None
+                and caller.f_code.co_name == "_run"
+                and caller.f_code.co_filename.endswith("events.py")
+            ):
+                task = frame_name(frame)
+            frame = caller
+        stack.reverse()
+        return handler or task or "unknown", stack
+
+    def _on_gc(self, phase: str, info: dict):
+        # collections hold the GIL, so start and stop come in pairs, in any thread
+        if phase == "start":
+            self._gc_start_ns = time.perf_counter_ns()
+        elif self._gc_start_ns is not None:
+            pause = time.perf_counter_ns() - self._gc_start_ns
+            self._gc_start_ns = None
+            generation = info["generation"]
+            self.gc_pauses[generation].record(pause)
+            gc_pause.observe(pause, generation)
+
+    def rolling(self) -> dict:
+        """Rolling window percentiles (ms) of the lag and of the GC pauses per generation."""
+
+        def summary(histogram) -> dict:
+            s = histogram.snapshot().summary(ROLLING_QUANTILES, scale=1e6)
+            return {k: v for k, v in s.items() if k != "mean"}
+
+        return {
+            "lagMs": summary(self.lag),
+            "gcPauseMs": {
+                str(generation): summary(histogram)
+                for generation, histogram in enumerate(self.gc_pauses)
+            },
+        }
+
+    def blocked_ns(self) -> int:
+        """How long the loop has been blocked now (0 when read from the loop itself)."""
+
+        late = time.perf_counter_ns() - self._heartbeat_ns - int(self.interval_s * 1e9)
+        return max(late, 0)
+
+    def health(self, max_lag_s: float = HEALTH_MAX_LAG_S) -> tuple[bool, dict]:
+        """
+        (healthy, details): unhealthy when the rolling p99 lag or the current
+        blocking exceeds `max_lag_s`. Without monitoring (e.g. an app run
+        without its lifespan) nothing is measured: healthy, status
+        "unmonitored".
+        """
+
+        rolling = self.rolling()
+        max_lag_ms = max_lag_s * 1000
+        monitoring = self.is_running()
+        blocked_ms = self.blocked_ns() / 1e6 if monitoring else 0.0
+        healthy = not monitoring or (
+            rolling["lagMs"]["p99"] <= max_lag_ms and blocked_ms <= max_lag_ms
+        )
+        if not monitoring:
+            status = "unmonitored"
+        else:
+            status = "ok" if healthy else "overloaded"
+        return healthy, {
+            "status": status,
+            "monitoring": monitoring,
+            "maxLagMs": max_lag_ms,
+            "blockedMs": blocked_ms,
+            **rolling,
+            "stalls": [stall.to_json() for stall in list(self.stalls)[-5:]],
+        }
+
+    def _rolling_quantiles(self):
+        """Series of the rolling gauges, see `metrics`."""
+
+        lag = self.lag.snapshot().percentiles(ROLLING_QUANTILES)
+        for q, value in lag.items():
+            yield ("lag", "", f"{q / 100:g}"), value / 1e9
+        for generation, histogram in enumerate(self.gc_pauses):
+            pauses = histogram.snapshot().percentiles(ROLLING_QUANTILES)
+            for q, value in pauses.items():
+                yield ("gc_pause", str(generation), f"{q / 100:g}"), value / 1e9
+
+
+loop_monitor = LoopMonitor()
+
+registry.gauge(
+    "clob_loop_rolling_seconds",
+    f"Rolling {WINDOW_S:g} s percentiles of the event loop lag and GC pauses.",
+    ("measure", "generation", "quantile"),
+    collect=loop_monitor._rolling_quantiles,
+)
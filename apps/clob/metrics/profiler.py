@@ -0,0 +1,164 @@
+"""
+On-demand profiling of the running process.
+
+Two profilers, both time-boxed:
+
+- `sample`: a background thread samples the stack of one thread (the event
+  loop thread, which runs the API and the matching engine) every interval and
+  counts identical stacks. The result is in the collapsed-stack format
+  (`frame;frame;frame count` per line, root first), read by flamegraph.pl,
+  speedscope and most flame graph tools. Its overhead does not depend on how
+  busy the profiled thread is, so it is the one to use under load.
+- `cprofile`: deterministic profiling of every call made in the current
+  thread (cProfile). Exact call counts, but it slows every call down. The
+  result is a pstats dump, loaded with `pstats.Stats(path)`.
+
+`ProfileGuard` keeps them from running continuously: one profile at a time, a
+maximum duration and a cooldown after each.
+"""
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# bounds of a profile; the cooldown is counted from the end of the previous one
+MAX_DURATION_S = float(os.environ.get("CLOB_PROFILE_MAX_DURATION_S", "30"))
+COOLDOWN_S = float(os.environ.get("CLOB_PROFILE_COOLDOWN_S", "60"))
+MIN_INTERVAL_S = 0.0005
+
+
+class ProfileUnavailable(Exception):
+    """A profile cannot start now; `retry_after_s` is when it could, if known."""
+
+    def __init__(self, message: str, retry_after_s: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class ProfileGuard:
+    """Admits one profile at a time, of at most `max_duration_s`, `cooldown_s` apart."""
+
+    max_duration_s: float
+    cooldown_s: float
+    _lock: threading.Lock
+    _running: bool
+    _ended_at: Optional[float]
+
+    def __init__(self, max_duration_s: float = MAX_DURATION_S, cooldown_s: float = COOLDOWN_S):
+        self.max_duration_s = max_duration_s
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self._running = False
+        self._ended_at = None
+
+    def acquire(self, duration_s: float):
+        if not 0 < duration_s <= self.max_duration_s:
+            raise ValueError(
+                f"duration must be greater than 0 and at most {self.max_duration_s:g} s"
+            )
+        with self._lock:
+            if self._running:
+                raise ProfileUnavailable("a profile is already running", duration_s)
+            if self._ended_at is not None:
+                wait = self._ended_at + self.cooldown_s - time.monotonic()
+                if wait > 0:
+                    raise ProfileUnavailable("profiler cooling down", wait)
+            self._running = True
+
+    def release(self):
+        with self._lock:
+            self._running = False
+            self._ended_at = time.monotonic()
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stack of thread `thread_id`, see the module docstring."""
+
+    thread_id: int
+    interval_s: float
+    stacks: Counter
+    samples: int
+    _stop: threading.Event
+    _thread: Optional[threading.Thread]
+
+    def __init__(self, thread_id: int, interval_s: float = 0.001):
+        self.thread_id = thread_id
+        self.interval_s = max(interval_s, MIN_INTERVAL_S)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        names: dict = {}  # code object -> frame name, built once per code object
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = frame_name(frame)
+                stack.append(name)
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """The sampled stacks in the collapsed-stack format, most frequent first."""
+
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class CallProfiler:
+    """cProfile of the thread calling `start` until `stop`."""
+
+    _profile: cProfile.Profile
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def pstats_dump(self) -> bytes:
+        """The profile in the format of `pstats.Stats.dump_stats`."""
+
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)
+
+    def text(self, limit: int = 50) -> str:
+        """The `limit` functions with the largest cumulative time, as printed by pstats."""
+
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
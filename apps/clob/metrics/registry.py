@@ -0,0 +1,213 @@
+"""
+Metric families and their Prometheus text exposition.
+
+A family is a named metric with a fixed set of label names; each combination
+of label values gets its own series, created on first use. Latencies are
+recorded in nanoseconds into log-linear `Histogram`s (one integer increment
+per observation) and only folded into the Prometheus `le` buckets when
+rendered, so recording stays cheap on the matching path.
+"""
+
+import threading
+from typing import Callable, Iterable, Optional
+
+from .histogram import Histogram
+
+# `le` bounds of the exposed latency histograms, in seconds
+LATENCY_BUCKETS_S = tuple(
+    m * 10.0**e for e in range(-6, 1) for m in (1, 2.5, 5)
+) + (10.0,)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class LatencyFamily:
+    """Latency histograms (observed in ns, exposed in seconds) per label values."""
+
+    name: str
+    help: str
+    label_names: tuple[str, ...]
+    _series: dict[tuple, Histogram]
+    _lock: threading.Lock
+
+    def __init__(self, name: str, help: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> Histogram:
+        """The histogram of the given label values, created if needed."""
+
+        histogram = self._series.get(values)
+        if histogram is None:
+            with self._lock:
+                histogram = self._series.setdefault(values, Histogram())
+        return histogram
+
+    def observe(self, ns: int, *values):
+        self.labels(*values).record(ns)
+
+    def series(self) -> list[tuple[tuple, Histogram]]:
+        return list(self._series.items())
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def render(self, lines: list[str]):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for values, histogram in sorted(
+            self.series(), key=lambda item: tuple(map(str, item[0]))
+        ):
+            buckets = list(histogram.buckets())
+            i = 0
+            cumulative = 0
+            for bound in LATENCY_BUCKETS_S:
+                bound_ns = bound * 1e9
+                # buckets straddling a bound are counted in the next one
+                while i < len(buckets) and buckets[i][0] <= bound_ns:
+                    cumulative += buckets[i][1]
+                    i += 1
+                le = _labels(self.label_names, values, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _labels(self.label_names, values)
+            inf = _labels(self.label_names, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {histogram.count()}")
+            lines.append(f"{self.name}_sum{labels} {histogram.total() / 1e9!r}")
+            lines.append(f"{self.name}_count{labels} {histogram.count()}")
+
+
+class CounterFamily:
+    """Monotonic counters per label values."""
+
+    name: str
+    help: str
+    label_names: tuple[str, ...]
+    _values: dict[tuple, float]
+
+    def __init__(self, name: str, help: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+
+    def inc(self, *values, amount: float = 1):
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def value(self, *values) -> float:
+        return self._values.get(values, 0)
+
+    def series(self) -> list[tuple[tuple, float]]:
+        return list(self._values.items())
+
+    def reset(self):
+        self._values = {}
+
+    def render(self, lines: list[str]):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        for values, value in sorted(self.series(), key=lambda item: tuple(map(str, item[0]))):
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {value!r}")
+
+
+class GaugeFamily:
+    """
+    Gauges per label values, either set as they change or, with `collect`,
+    read when rendered: `collect()` yields the (label values, value) pairs.
+    """
+
+    name: str
+    help: str
+    label_names: tuple[str, ...]
+    _values: dict[tuple, float]
+    _collect: Optional[Callable[[], Iterable[tuple[tuple, float]]]]
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Iterable[str] = (),
+        collect: Optional[Callable[[], Iterable[tuple[tuple, float]]]] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._collect = collect
+
+    def set(self, value: float, *values):
+        self._values[values] = value
+
+    def series(self) -> list[tuple[tuple, float]]:
+        if self._collect is not None:
+            return list(self._collect())
+        return list(self._values.items())
+
+    def reset(self):
+        self._values = {}
+
+    def render(self, lines: list[str]):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} gauge")
+        for values, value in sorted(self.series(), key=lambda item: tuple(map(str, item[0]))):
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {float(value)!r}")
+
+
+class Registry:
+    """The metric families exposed together."""
+
+    _families: dict[str, object]
+
+    def __init__(self):
+        self._families = {}
+
+    def register(self, family):
+        if family.name in self._families:
+            raise ValueError(f"metric {family.name} already registered")
+        self._families[family.name] = family
+        return family
+
+    def latency(
+        self, name: str, help: str, label_names: Iterable[str] = ()
+    ) -> LatencyFamily:
+        return self.register(LatencyFamily(name, help, label_names))
+
+    def counter(
+        self, name: str, help: str, label_names: Iterable[str] = ()
+    ) -> CounterFamily:
+        return self.register(CounterFamily(name, help, label_names))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        label_names: Iterable[str] = (),
+        collect: Optional[Callable[[], Iterable[tuple[tuple, float]]]] = None,
+    ) -> GaugeFamily:
+        return self.register(GaugeFamily(name, help, label_names, collect))
+
+    def get(self, name: str) -> Optional[object]:
+        return self._families.get(name)
+
+    def render(self) -> str:
+        """Every family in the Prometheus text format (version 0.0.4)."""
+
+        lines: list[str] = []
+        for family in self._families.values():
+            family.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -1,96 +1,191 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from starlette.responses import JSONResponse
 from urllib.parse import parse_qs
 import json
 import logging
 
-logger = logging.getLogger("BodyAutoDetectMiddleware")
+from apis.api_key import API_KEY_NAME
+from apis.rate_limit import DEFAULT_COST, ROUTE_COSTS, RateLimited, RateLimiter, rate_limiter
+from apis.responses import rate_limited_response
+from apis.timing import RequestTiming, current_timing
+
+logger = logging.getLogger("BodyNormalizeMiddleware")
 logger.setLevel(logging.INFO)
 
+FORM_CONTENT_TYPE = b"application/x-www-form-urlencoded"
+BODY_METHODS = frozenset(("POST", "PUT", "DELETE"))
+API_KEY_HEADER = API_KEY_NAME.lower().encode("latin-1")
+
+
+class BodyNormalizeMiddleware:
+    """
+    Pure ASGI middleware rewriting url-encoded request bodies into JSON.
 
-class BodyAutoDetectMiddleware(BaseHTTPMiddleware):
+    Routes only declare JSON bodies, but some clients post
+    `key=value&key2=value2`. The decision is made from the Content-Type header
+    alone, so JSON requests are passed through untouched: no buffering, no
+    parsing and no header rewrite. A body without Content-Type is sniffed on
+    its first byte, as FastAPI would otherwise parse it as JSON.
+    """
 
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in BODY_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        content_type = None
+        for key, value in scope["headers"]:
+            if key == b"content-type":
+                content_type = value
+                break
+
+        if content_type is not None and not content_type.startswith(
+            FORM_CONTENT_TYPE
+        ):
+            await self._call_app(scope, receive, send)
+            return
+
+        # url-encoded (or untyped) body: buffer it to decide and rewrite
+        body, connected = await _read_body(receive)
+        if content_type is None and (not body or body.lstrip()[:1] in (b"{", b"[")):
+            await self._call_app(scope, _replay(body, connected, receive), send)
+            return
 
-    async def dispatch(self, request: Request, call_next):
+        try:
+            parsed = parse_qs(body.decode("utf-8"))
+            # flatten the dictionary: {'key': ['value']} -> {'key': 'value'}
+            body = json.dumps({k: v[0] for k, v in parsed.items()}).encode("utf-8")
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, v)
+                for k, v in scope["headers"]
+                if k != b"content-type" and k != b"content-length"
+            ] + [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ]
+        except Exception as e:
+            # let the request proceed with its original body and fail gracefully
+            # at the Pydantic level
+            logger.error(f"Error during URL-encoded transform: {e}. Keeping body.")
 
-        # Only process requests that are expected to have a body
-        if request.method not in ["POST", "PUT", "DELETE"]:
-            return await call_next(request)
+        await self._call_app(scope, _replay(body, connected, receive), send)
 
-        # 1. Read the raw body bytes (consumes the stream temporarily)
-        original_body_bytes = await request.body()
+    async def _call_app(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await self.app(scope, receive, send)
+        except Exception as e:
+            logger.error(f"Middleware caught exception: {e}")
+            try:
+                response = JSONResponse(status_code=400, content={"detail": str(e)})
+                await response(scope, receive, send)
+            except Exception:
+                # the response had already started, nothing sane left to send
+                raise e
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware applying the per-client rate limits (see
+    `apis.rate_limit`) from the method, path and API key header (or client
+    address) alone: a request over a limit is answered 429 before its body is
+    read, validated or reaches the engine. Admitted responses carry the
+    client's usage headers.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.limiter.enabled():
+            await self.app(scope, receive, send)
+            return
+
+        client_id = None
+        for key, value in scope["headers"]:
+            if key == API_KEY_HEADER:
+                client_id = value.decode("latin-1")
+                break
+        if not client_id:
+            # keyless requests share the buckets of their address
+            client = scope.get("client")
+            client_id = ("ip", client[0] if client else "")
+
+        weight, orders = ROUTE_COSTS.get((scope["method"], scope["path"]), DEFAULT_COST)
+        try:
+            self.limiter.acquire(client_id, weight, orders)
+        except RateLimited as e:
+            await rate_limited_response(e, self.limiter)(scope, receive, send)
+            return
 
-        if not original_body_bytes:
-            # No body, nothing to do. Proceed.
-            return await call_next(request)
+        async def send_with_usage(message: Message):
+            if message["type"] == "http.response.start":
+                # read when answering, the route may have charged more orders
+                usage = self.limiter.usage_headers(self.limiter.usage(client_id))
+                message = {**message, "headers": [*message.get("headers", ()), *usage]}
+            await send(message)
 
-        body_str = original_body_bytes.decode("utf-8")
+        await self.app(scope, receive, send_with_usage)
 
-        # Determine if the body needs transformation
-        needs_transform = True
 
-        # --- Attempt 1: Check if the body is already valid JSON ---
-        try:
-            # If this succeeds, the body is already JSON.
-            # We don't need to parse it, just ensure the header is right.
-            json.loads(body_str)
-            needs_transform = False
-            logger.info("Auto-Detect: Body is already valid JSON. Bypassing transform.")
-
-        except json.JSONDecodeError:
-            # If decoding fails, it's not JSON. We assume it's URL-encoded data.
-            logger.info(
-                "Auto-Detect: Body is NOT JSON. Attempting URL-encoded transform."
-            )
-            pass  # Keep needs_transform = True
-
-        # --- Attempt 2: Transform URL-encoded data if needed ---
-        if needs_transform:
-            try:
-                # Parse the key=value&key2=value2 string
-                parsed_dict_lists = parse_qs(body_str)
-
-                # Flatten the dictionary: {'key': ['value']} -> {'key': 'value'}
-                payload_dict = {k: v[0] for k, v in parsed_dict_lists.items()}
-
-                # Convert the dictionary back to JSON bytes
-                json_bytes = json.dumps(payload_dict).encode("utf-8")
-
-                # OVERWRITE the request scope's body and content-type
-                request._body = json_bytes
-
-                # Update headers to officially mark it as application/json
-                request.scope["headers"] = [
-                    (k.lower().encode(), v.encode())
-                    for k, v in dict(request.headers).items()
-                    if k.lower() != "content-type"
-                ] + [(b"content-type", b"application/json")]
-
-                logger.info(
-                    "Auto-Detect: Successfully transformed URL-encoded body to application/json."
-                )
-
-            except Exception as e:
-                # If parsing/transforming fails, reset the body to the original
-                # and let the request proceed to fail gracefully at the Pydantic level.
-                logger.error(
-                    f"Auto-Detect Error during URL-encoded transform: {e}. Resetting body."
-                )
-                request._body = original_body_bytes
-
-        else:
-            # If it was already JSON, we just need to reset the body
-            # so the stream is available for the route handler.
-            request._body = original_body_bytes
+class RequestTimingMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request, from the first byte in to
+    the last byte out, per route and stage (see `apis.timing`).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        method = scope["method"]
+
+        async def timed_send(message: Message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                timing.finish(method)
 
         try:
-            # Process the request with the (potentially modified) body
-            response = await call_next(request)
-            return response
-        except Exception as e:
-            logger.error(f"Middleware caught exception: {e}")
-            return JSONResponse(status_code=400, content={"detail": str(e)})
+            await self.app(scope, receive, timed_send)
+        finally:
+            current_timing.reset(token)
+
+
+async def _read_body(receive: Receive) -> tuple[bytes, bool]:
+    """Drain the request body. Returns it and whether the client is still connected."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b"".join(chunks), False
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks), True
+
+
+def _replay(body: bytes, connected: bool, receive: Receive) -> Receive:
+    """Build a `receive` callable yielding `body` once, then the original stream."""
+    sent = False
+
+    async def wrapped() -> Message:
+        nonlocal sent
+        if not connected:
+            return {"type": "http.disconnect"}
+        if sent:
+            return await receive()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return wrapped
@@ -0,0 +1,108 @@
+from decimal import Decimal
+
+import pytest
+
+from account import ledger, reset_accounts
+from exchange import _Exchange
+from exchange.types import (
+    AmendOrderRequest,
+    CancelOrderRequest,
+    CancelReplaceRequest,
+    MassCancelRequest,
+    NewOrderRequest,
+    OrderSide,
+    OrderType,
+    QuoteLevel,
+)
+from fastlob.utils import order_ids, trade_ids
+
+SYMBOL = "BTCUSDT"
+
+
+def limit(side: str, price: str, quantity: str, client_order_id=None) -> NewOrderRequest:
+    return NewOrderRequest(
+        symbol=SYMBOL,
+        side=OrderSide(side),
+        type=OrderType.LIMIT_MAKER,
+        price=Decimal(price),
+        quantity=Decimal(quantity),
+        newClientOrderId=client_order_id,
+    )
+
+
+def market(side: str, quantity: str) -> NewOrderRequest:
+    return NewOrderRequest(
+        symbol=SYMBOL, side=OrderSide(side), type=OrderType.MARKET, quantity=Decimal(quantity)
+    )
+
+
+def balance(client_id: str, asset: str) -> tuple[Decimal, Decimal]:
+    """(available, reserved) of `client_id`."""
+    return ledger.balance(ledger.account_id(client_id), ledger.asset_id(asset))
+
+
+def run_flow(exchange):
+    """Some of every command, rejected ones included."""
+    exchange.new_book(SYMBOL)
+    for client_id in ("alice", "bob"):
+        exchange.deposit(client_id, "BTC", Decimal(100))
+        exchange.deposit(client_id, "USDT", Decimal(10_000))
+    exchange.new_order("alice", limit("SELL", "101", "2", "a1"))
+    exchange.new_order("alice", limit("SELL", "102", "1"))
+    exchange.new_orders("bob", [limit("BUY", "99", "1"), limit("BUY", "98", "3")])
+    exchange.new_order("bob", market("BUY", "1.5"))
+    exchange.mass_quote(
+        "bob", SYMBOL, [QuoteLevel(price=Decimal("97"), quantity=Decimal("1"))], []
+    )
+    exchange.amend_order("alice", AmendOrderRequest(symbol=SYMBOL, orderId=1, newQty=Decimal("0.25")))
+    exchange.cancel_replace(
+        "alice",
+        CancelReplaceRequest(
+            symbol=SYMBOL,
+            side=OrderSide.SELL,
+            type=OrderType.LIMIT_MAKER,
+            quantity=Decimal("1"),
+            price=Decimal("103"),
+            cancelOrderId=2,
+        ),
+    )
+    with pytest.raises(Exception):
+        exchange.new_order("alice", limit("BUY", "1", "100000"))  # not enough USDT
+    exchange.cancel_order("alice", CancelOrderRequest(symbol=SYMBOL, origClientOrderId="a1"))
+    exchange.mass_cancel("bob", MassCancelRequest(symbol=SYMBOL, side=OrderSide.BUY))
+    exchange.withdraw("alice", "USDT", Decimal(5))
+
+
+@pytest.fixture
+def new_exchange():
+    """
+    Factory of exchanges starting from an empty state: the ledger and the id
+    sequences are global, they are reset by each call. The books are stopped
+    and the journals closed on teardown.
+    """
+    created: list[_Exchange] = []
+
+    def make() -> _Exchange:
+        reset_accounts()
+        order_ids.restore(1)
+        trade_ids.restore(1)
+        exchange = _Exchange()
+        created.append(exchange)
+        return exchange
+
+    yield make
+    for exchange in created:
+        exchange.close_journal()
+        for book in exchange._books.values():
+            book.stop()
+
+
+@pytest.fixture
+def exchange(new_exchange):
+    """An exchange with a BTCUSDT book and two funded clients, alice and bob."""
+    exchange = new_exchange()
+    exchange.new_book(SYMBOL)
+    for client_id in ("alice", "bob"):
+        exchange.deposit(client_id, "BTC", Decimal(100))
+        exchange.deposit(client_id, "USDT", Decimal(10_000))
+    return exchange
@@ -0,0 +1,115 @@
+import json
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+
+from conftest import SYMBOL, balance, limit
+from exchange.replay import state_checksum
+from exchange.types import AmendOrderRequest, CancelReplaceRequest, OrderSide, OrderType
+
+
+def amend(exchange, client_id: str, order_id: int, quantity: str, price=None) -> dict:
+    request = AmendOrderRequest(
+        symbol=SYMBOL,
+        orderId=order_id,
+        newQty=Decimal(quantity),
+        price=None if price is None else Decimal(price),
+    )
+    return json.loads(exchange.amend_order(client_id, request))
+
+
+def queue(exchange, price: str) -> list[int]:
+    for _, level_price, orders in exchange._books[SYMBOL].resting_queues():
+        if level_price == Decimal(price):
+            return [order.id() for order in orders]
+    return []
+
+
+@pytest.fixture
+def queued(exchange):
+    """alice's order 1 then bob's order 2, bidding 2 and 1 at 99."""
+    exchange.new_order("alice", limit("BUY", "99", "2"))
+    exchange.new_order("bob", limit("BUY", "99", "1"))
+    return exchange
+
+
+def test_a_lower_quantity_keeps_the_queue_position(queued):
+    response = amend(queued, "alice", 1, "0.5")
+
+    assert response["keepPriority"] is True
+    assert queue(queued, "99") == [1, 2]
+    assert queued._books[SYMBOL].get_order_by_id(1).quantity() == Decimal("0.5")
+    assert balance("alice", "USDT") == (Decimal("9950.5"), Decimal("49.5"))
+
+
+def test_a_higher_quantity_goes_to_the_back(queued):
+    response = amend(queued, "alice", 1, "3")
+
+    assert response["keepPriority"] is False
+    new_id = response["amendedOrder"]["orderId"]
+    assert queue(queued, "99") == [2, new_id]
+    assert balance("alice", "USDT") == (Decimal(10_000 - 297), Decimal(297))
+
+
+def test_a_new_price_loses_the_queue_position(queued):
+    response = amend(queued, "alice", 1, "2", price="98")
+
+    new_id = response["amendedOrder"]["orderId"]
+    assert queue(queued, "99") == [2]
+    assert queue(queued, "98") == [new_id]
+
+
+@pytest.mark.parametrize(
+    "quantity, price, message",
+    [
+        ("1", "101", "would immediately match"),  # crossing bob's ask
+        ("200", "99", "Not enough available balance"),
+        ("0.00001", None, "must be > 0"),
+    ],
+)
+def test_a_rejected_amend_leaves_the_order(queued, quantity, price, message):
+    queued.new_order("bob", limit("SELL", "100", "1"))
+    before = state_checksum(queued)
+
+    with pytest.raises(Exception, match=message):
+        amend(queued, "alice", 1, quantity, price)
+
+    assert state_checksum(queued) == before
+
+
+def test_the_balance_of_the_canceled_order_counts(exchange):
+    exchange.new_order("alice", limit("BUY", "100", "60"))
+    # 6000 of the 10000 USDT are reserved, the new order needs 9000
+    amend(exchange, "alice", 1, "90", price="100")
+    assert balance("alice", "USDT") == (Decimal(1000), Decimal(9000))
+
+
+def test_amend_quantity_and_price_must_be_positive():
+    with pytest.raises(ValidationError):
+        AmendOrderRequest(symbol=SYMBOL, orderId=1, newQty=Decimal(0))
+    with pytest.raises(ValidationError):
+        AmendOrderRequest(symbol=SYMBOL, orderId=1, newQty=Decimal(1), price=Decimal(-5))
+
+
+def test_only_the_owner_can_amend(queued):
+    with pytest.raises(Exception, match="Order does not exist."):
+        amend(queued, "bob", 1, "1")
+
+
+def test_a_rejected_cancel_replace_leaves_the_order(queued):
+    queued.new_order("bob", limit("SELL", "100", "1"))
+    before = state_checksum(queued)
+    request = CancelReplaceRequest(
+        symbol=SYMBOL,
+        side=OrderSide.BUY,
+        type=OrderType.LIMIT_MAKER,
+        quantity=Decimal("1"),
+        price=Decimal("100"),
+        cancelOrderId=1,
+    )
+
+    with pytest.raises(Exception, match="would immediately match"):
+        queued.cancel_replace("alice", request)
+
+    assert state_checksum(queued) == before
@@ -0,0 +1,88 @@
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+
+from conftest import SYMBOL, limit, market, run_flow
+from exchange.journal import read_records
+from exchange.replay import state_checksum
+from exchange.types import (
+    CancelOrderRequest,
+    CancelReplaceRequest,
+    OrderQuery,
+    OrderSide,
+    OrderType,
+    TradesQuery,
+)
+from fastlob.utils import now, pin_time, time_asms
+
+
+def test_reopening_the_journal_rebuilds_the_same_state(new_exchange, tmp_path):
+    path = str(tmp_path / "journal.bin")
+    first = new_exchange()
+    first.open_journal(path, fsync=False)
+    run_flow(first)
+    first.close_journal()
+    expected = state_checksum(first)
+
+    second = new_exchange()
+    replayed = second.open_journal(path, fsync=False)
+
+    records, _ = read_records(path)
+    assert replayed == len(records)
+    assert state_checksum(second) == expected
+
+
+def test_the_clock_is_pinned_per_thread():
+    seen = []
+    pin_time(1_000)
+    try:
+        thread = threading.Thread(target=lambda: seen.append(now()))
+        thread.start()
+        thread.join()
+        assert time_asms() == 1_000
+    finally:
+        pin_time(None)
+    assert abs(seen[0] - time.time()) < 60
+    assert abs(now() - time.time()) < 60
+
+
+def test_only_the_owner_can_cancel(exchange):
+    exchange.new_order("bob", limit("BUY", "99", "1"))
+    request = CancelOrderRequest(symbol=SYMBOL, orderId=1)
+
+    assert exchange.cancel_order("alice", request) is None
+    assert exchange._books[SYMBOL].get_order_by_id(1).valid()
+
+    assert exchange.cancel_order("bob", request) is not None
+    assert not exchange._books[SYMBOL].has_order_id(1)
+
+
+def test_only_the_owner_can_cancel_replace(exchange):
+    exchange.new_order("bob", limit("BUY", "99", "1"))
+    request = CancelReplaceRequest(
+        symbol=SYMBOL,
+        side=OrderSide.BUY,
+        type=OrderType.LIMIT_MAKER,
+        quantity=Decimal("1"),
+        price=Decimal("98"),
+        cancelOrderId=1,
+    )
+    assert exchange.cancel_replace("alice", request) is None
+    assert exchange._books[SYMBOL].get_order_by_id(1).valid()
+
+
+def test_only_the_owner_can_read_an_order_and_its_trades(exchange):
+    exchange.new_order("bob", limit("BUY", "99", "1"))
+    exchange.new_order("alice", market("SELL", "0.5"))
+
+    assert '"orderId":1' in exchange.get_order("bob", OrderQuery(symbol=SYMBOL, orderId=1))
+    with pytest.raises(Exception, match="Order does not exist."):
+        exchange.get_order("alice", OrderQuery(symbol=SYMBOL, orderId=1))
+    with pytest.raises(Exception, match="Order does not exist."):
+        exchange.get_order("bob", OrderQuery(symbol=SYMBOL, orderId=99))
+
+    assert '"orderId":1' in exchange.get_trades("bob", TradesQuery(symbol=SYMBOL, orderId=1))
+    with pytest.raises(Exception, match="Order does not exist."):
+        exchange.get_trades("alice", TradesQuery(symbol=SYMBOL, orderId=1))
@@ -0,0 +1,104 @@
+import os
+import subprocess
+import sys
+from decimal import Decimal
+
+import pytest
+
+from account.ledger import LEDGER_DECIMALS, Ledger, from_units, quantize, to_units
+from apis.routes.account import DepositRequest
+from conftest import balance, limit, market
+
+
+@pytest.fixture
+def accounts():
+    ledger = Ledger()
+    return ledger, ledger.account_id("alice"), ledger.asset_id("BTC"), ledger.asset_id("USDT")
+
+
+def test_units_round_trip_exactly():
+    for amount in ("0", "1", "0.00000001", "123456.78901234", "-3.5"):
+        assert from_units(to_units(Decimal(amount))) == Decimal(amount)
+
+
+def test_to_units_rejects_more_decimals_than_the_ledger():
+    with pytest.raises(ValueError):
+        to_units(Decimal("0.000000001"))
+
+
+def test_quantize_rounds_down_to_the_ledger_precision():
+    assert quantize(Decimal("1.123456789")) == Decimal("1.12345678")
+    assert quantize(Decimal("0.000000009")) == 0
+    with pytest.raises(ValueError):
+        quantize(Decimal("1e30"))
+
+
+def test_deposit_request_rounds_the_amount_down():
+    assert DepositRequest(asset="BTC", amount="0.123456789").amount == Decimal("0.12345678")
+
+
+def test_reserve_and_release_move_between_available_and_reserved(accounts):
+    ledger, account, btc, _ = accounts
+    ledger.deposit(account, btc, Decimal("2"))
+    ledger.reserve(account, btc, Decimal("0.5"))
+    assert ledger.balance(account, btc) == (Decimal("1.5"), Decimal("0.5"))
+    ledger.release(account, btc, Decimal("0.5"))
+    assert ledger.balance(account, btc) == (Decimal("2"), 0)
+
+
+def test_reserve_more_than_available_changes_nothing(accounts):
+    ledger, account, btc, _ = accounts
+    ledger.deposit(account, btc, Decimal("1"))
+    with pytest.raises(ValueError):
+        ledger.reserve(account, btc, Decimal("1.00000001"))
+    assert ledger.balance(account, btc) == (Decimal("1"), 0)
+
+
+def test_settle_applies_both_legs(accounts):
+    ledger, account, btc, usdt = accounts
+    ledger.deposit(account, usdt, Decimal("100"))
+    ledger.reserve(account, usdt, Decimal("30"))
+    ledger.settle(account, usdt, Decimal("30"), True, btc, Decimal("0.25"))
+    assert ledger.balance(account, usdt) == (Decimal("70"), 0)
+    assert ledger.balance(account, btc) == (Decimal("0.25"), 0)
+
+
+def test_settle_failing_on_the_second_leg_undoes_the_first(accounts):
+    ledger, account, btc, usdt = accounts
+    ledger.deposit(account, usdt, Decimal("100"))
+    ledger.reserve(account, usdt, Decimal("30"))
+    ledger.deposit(account, btc, from_units(2**63 - 1))
+    with pytest.raises(ValueError):
+        ledger.settle(account, usdt, Decimal("30"), True, btc, Decimal("1"))
+    assert ledger.balance(account, usdt) == (Decimal("70"), Decimal("30"))
+    assert ledger.balance(account, btc) == (from_units(2**63 - 1), 0)
+
+
+def test_a_fill_settles_both_clients_exactly(exchange):
+    exchange.new_order("alice", limit("SELL", "10.1234", "1.5"))
+    assert balance("alice", "BTC") == (Decimal("98.5"), Decimal("1.5"))
+
+    exchange.new_order("bob", market("BUY", "1.2345"))
+
+    notional = Decimal("10.1234") * Decimal("1.2345")
+    assert balance("alice", "BTC") == (Decimal("98.5"), Decimal("0.2655"))
+    assert balance("alice", "USDT") == (10_000 + notional, 0)
+    assert balance("bob", "BTC") == (Decimal("101.2345"), 0)
+    assert balance("bob", "USDT") == (10_000 - notional, 0)
+
+
+def test_precisions_finer_than_the_ledger_are_refused_at_import():
+    env = {
+        **os.environ,
+        "FASTLOB_DECIMAL_PRECISION_PRICE": str(LEDGER_DECIMALS),
+        "FASTLOB_DECIMAL_PRECISION_QTY": "1",
+    }
+    run = subprocess.run(
+        [sys.executable, "-c", "import fastlob"],
+        cwd=os.path.dirname(os.path.dirname(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert run.returncode != 0
+    assert "exceed the 8 decimals of the ledger" in run.stderr
@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+from metrics.loop_monitor import LoopMonitor
+
+
+def test_an_unmonitored_loop_is_healthy():
+    healthy, details = LoopMonitor().health()
+    assert healthy
+    assert details["status"] == "unmonitored"
+    assert details["monitoring"] is False
+
+
+def test_a_monitored_loop_is_ok_then_overloaded_when_blocked():
+    monitor = LoopMonitor(interval_s=0.01)
+
+    async def run():
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            healthy, details = monitor.health(max_lag_s=0.5)
+            assert healthy and details["status"] == "ok"
+            time.sleep(0.1)  # blocks the loop
+            healthy, details = monitor.health(max_lag_s=0.05)
+            assert not healthy and details["status"] == "overloaded"
+        finally:
+            monitor.stop()
+
+    asyncio.run(run())
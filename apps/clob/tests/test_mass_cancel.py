@@ -0,0 +1,71 @@
+import importlib
+import json
+from decimal import Decimal
+
+import pytest
+from fastapi.dependencies.utils import get_flat_dependant
+
+from conftest import SYMBOL, balance, limit
+from exchange.types import MassCancelRequest, OrderSide
+
+
+@pytest.fixture
+def quoted(exchange):
+    """alice bids 97, 98, 99 and asks 101, 102 (tagged mm- at 98 and 101), bob bids 99."""
+    exchange.new_order("alice", limit("BUY", "97", "1"))
+    exchange.new_order("alice", limit("BUY", "98", "1", "mm-1"))
+    exchange.new_order("alice", limit("BUY", "99", "1"))
+    exchange.new_order("alice", limit("SELL", "101", "1", "mm-2"))
+    exchange.new_order("alice", limit("SELL", "102", "1"))
+    exchange.new_order("bob", limit("BUY", "99", "1"))
+    return exchange
+
+
+def mass_cancel(exchange, client_id="alice", **filters) -> list[int]:
+    request = MassCancelRequest(symbol=SYMBOL, **filters)
+    return sorted(order["orderId"] for order in json.loads(exchange.mass_cancel(client_id, request)))
+
+
+def open_ids(exchange, client_id="alice") -> list[int]:
+    return [order.id() for order in exchange._books[SYMBOL].get_open_orders_by_client_id(client_id)]
+
+
+def test_cancel_one_side(quoted):
+    assert mass_cancel(quoted, side=OrderSide.BUY) == [1, 2, 3]
+    assert open_ids(quoted) == [4, 5]
+    assert open_ids(quoted, "bob") == [6]
+    assert balance("alice", "USDT") == (Decimal(10_000), 0)
+
+
+def test_cancel_a_price_band(quoted):
+    assert mass_cancel(quoted, minPrice=Decimal(98), maxPrice=Decimal(101)) == [2, 3, 4]
+    assert open_ids(quoted) == [1, 5]
+
+
+def test_cancel_a_band_on_one_side(quoted):
+    assert mass_cancel(quoted, side=OrderSide.SELL, maxPrice=Decimal(101)) == [4]
+
+
+def test_cancel_by_tag(quoted):
+    assert mass_cancel(quoted, tag="mm-") == [2, 4]
+    assert open_ids(quoted) == [1, 3, 5]
+
+
+def test_cancel_everything(quoted):
+    assert mass_cancel(quoted) == [1, 2, 3, 4, 5]
+    assert open_ids(quoted, "bob") == [6]
+
+
+def test_nothing_matching(quoted):
+    assert mass_cancel(quoted, side=OrderSide.BUY, minPrice=Decimal(100)) == []
+    assert mass_cancel(quoted, client_id="carol") == []
+    assert len(open_ids(quoted)) == 5
+
+
+@pytest.mark.parametrize("module", ["apis.routes.trading", "apis.routes.gateway"])
+def test_the_filters_are_query_parameters(module):
+    router = importlib.import_module(module).router
+    route = next(route for route in router.routes if route.path.endswith("/order/massCancel"))
+    dependant = get_flat_dependant(route.dependant)
+    assert {param.name for param in dependant.query_params} >= {"symbol", "side", "minPrice", "maxPrice", "tag"}
+    assert not dependant.body_params
@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+import pytest
+
+from conftest import SYMBOL, balance, limit
+from exchange.replay import state_checksum
+from exchange.types import QuoteLevel
+
+
+def quotes(*levels: tuple[str, str]) -> list[QuoteLevel]:
+    return [QuoteLevel(price=Decimal(price), quantity=Decimal(quantity)) for price, quantity in levels]
+
+
+def queue(exchange, price: str) -> list[tuple[str, Decimal]]:
+    book = exchange._books[SYMBOL]
+    for _, level_price, orders in book.resting_queues():
+        if level_price == Decimal(price):
+            return [(order.client_id(), order.quantity()) for order in orders]
+    return []
+
+
+def test_quotes_replace_all_the_resting_orders_of_the_client(exchange):
+    exchange.mass_quote("alice", SYMBOL, quotes(("99", "1"), ("98", "2")), quotes(("101", "1")))
+    exchange.mass_quote("alice", SYMBOL, quotes(("97", "1")), quotes(("102", "3")))
+
+    assert queue(exchange, "99") == [] and queue(exchange, "98") == [] and queue(exchange, "101") == []
+    assert queue(exchange, "97") == [("alice", Decimal("1"))]
+    assert queue(exchange, "102") == [("alice", Decimal("3"))]
+    assert balance("alice", "USDT") == (Decimal(10_000 - 97), Decimal(97))
+    assert balance("alice", "BTC") == (Decimal(97), Decimal(3))
+
+
+def test_a_reduced_quote_keeps_its_queue_position(exchange):
+    exchange.mass_quote("alice", SYMBOL, quotes(("99", "2")), [])
+    exchange.new_order("bob", limit("BUY", "99", "1"))
+
+    exchange.mass_quote("alice", SYMBOL, quotes(("99", "1.5")), [])
+    assert queue(exchange, "99") == [("alice", Decimal("1.5")), ("bob", Decimal("1"))]
+
+    # more quantity than resting goes to the back
+    exchange.mass_quote("alice", SYMBOL, quotes(("99", "2")), [])
+    assert queue(exchange, "99") == [
+        ("alice", Decimal("1.5")),
+        ("bob", Decimal("1")),
+        ("alice", Decimal("0.5")),
+    ]
+
+
+@pytest.mark.parametrize(
+    "bids, asks",
+    [
+        (quotes(("99", "1000")), []),  # not enough USDT
+        (quotes(("99", "1")), quotes(("98", "1"))),  # crossed quotes
+        ([], quotes(("100", "1"))),  # crossing bob's bid
+        (quotes(("99", "0")), []),  # invalid quantity
+    ],
+)
+def test_rejected_quotes_leave_everything_untouched(exchange, bids, asks):
+    exchange.new_order("bob", limit("BUY", "100", "1"))
+    exchange.mass_quote("alice", SYMBOL, quotes(("95", "1")), quotes(("105", "1")))
+    before = state_checksum(exchange)
+
+    with pytest.raises(Exception):
+        exchange.mass_quote("alice", SYMBOL, bids, asks)
+
+    assert state_checksum(exchange) == before
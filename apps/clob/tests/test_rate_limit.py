@@ -0,0 +1,155 @@
+import asyncio
+import types
+
+import pytest
+
+from apis import rate_limit
+from apis.rate_limit import (
+    ORDERS,
+    REQUEST_WEIGHT,
+    RateLimit,
+    RateLimited,
+    RateLimiter,
+    TOO_MANY_ORDERS,
+    charge_orders,
+)
+from middleware import RateLimitMiddleware
+
+LIMITS = (RateLimit(REQUEST_WEIGHT, "MINUTE", 1, 60), RateLimit(ORDERS, "SECOND", 10, 5))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The monotonic clock of the rate limiter, set by hand."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(rate_limit, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def limiter(clock):
+    return RateLimiter(LIMITS)
+
+
+def test_a_client_can_burst_up_to_the_limit(limiter):
+    for n in range(1, 6):
+        assert limiter.acquire("alice", 1, 1) == [n, n]
+    with pytest.raises(RateLimited) as e:
+        limiter.acquire("alice", 1, 1)
+    assert e.value.code == TOO_MANY_ORDERS
+    assert e.value.limit.type == ORDERS
+    assert e.value.retry_after_s == pytest.approx(2)
+    assert e.value.used == [5, 5]
+
+
+def test_a_rejected_request_costs_nothing(limiter):
+    for _ in range(5):
+        limiter.acquire("alice", 1, 1)
+    for _ in range(3):
+        with pytest.raises(RateLimited):
+            limiter.acquire("alice", 1, 1)
+    assert limiter.usage("alice") == [5, 5]
+
+
+def test_buckets_refill_continuously(limiter, clock):
+    for _ in range(5):
+        limiter.acquire("alice", 1, 1)
+    # 2 of weight and 1 order are back
+    clock.now += 2
+    assert limiter.acquire("alice", 1, 1) == [4, 5]
+    with pytest.raises(RateLimited):
+        limiter.acquire("alice", 1, 1)
+    clock.now += 60
+    assert limiter.usage("alice") == [0, 0]
+
+
+def test_clients_have_their_own_buckets(limiter):
+    for _ in range(5):
+        limiter.acquire("alice", 1, 1)
+    assert limiter.acquire("bob", 1, 1) == [1, 1]
+
+
+def test_no_limits(clock):
+    limiter = RateLimiter(())
+    assert not limiter.enabled()
+    for _ in range(1000):
+        assert limiter.acquire("alice", 100, 100) == []
+    assert limiter.rate_limits_json() == "[]"
+
+
+def test_charge_orders_charges_a_batch_past_its_first_order(limiter):
+    limiter.acquire("alice", 5, 1)
+    charge_orders("alice", 4, limiter)
+    assert limiter.usage("alice") == [5, 4]
+    charge_orders("alice", 1, limiter)
+    assert limiter.usage("alice") == [5, 4]
+    with pytest.raises(RateLimited):
+        charge_orders("alice", 3, limiter)
+    assert limiter.usage("alice") == [5, 4]
+
+
+def call(middleware, method: str, path: str, headers=(), client=("10.0.0.1", 1234)) -> tuple[int, dict]:
+    """Run one request through `middleware`, returns its status and headers."""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": list(headers),
+        "client": client,
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    start = messages[0]
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def test_requests_over_the_limit_are_answered_429(limiter):
+    middleware = RateLimitMiddleware(ok_app, limiter)
+    key = [(b"x-api-key", b"alice")]
+    for n in range(1, 6):
+        status, headers = call(middleware, "POST", "/order", key)
+        assert status == 200
+        assert headers["x-mbx-order-count-10s"] == str(n)
+        assert headers["x-mbx-used-weight-1m"] == str(n)
+
+    status, headers = call(middleware, "POST", "/order", key)
+    assert status == 429
+    assert headers["retry-after"] == "2"
+    assert headers["x-mbx-order-count-10s"] == "5"
+
+    # reads place no order
+    status, _ = call(middleware, "GET", "/depth", key)
+    assert status == 200
+
+
+def test_requests_without_a_key_are_limited_by_address(limiter):
+    middleware = RateLimitMiddleware(ok_app, limiter)
+    for _ in range(5):
+        assert call(middleware, "DELETE", "/order")[0] == 200
+    assert call(middleware, "DELETE", "/order")[0] == 429
+    assert call(middleware, "DELETE", "/order", client=("10.0.0.2", 1))[0] == 200
+    # the address does not share the buckets of a key
+    assert call(middleware, "DELETE", "/order", [(b"x-api-key", b"ip:10.0.0.1")])[0] == 200
+
+
+def test_usage_headers_include_the_orders_charged_by_the_route(limiter):
+    async def batch_app(scope, receive, send):
+        charge_orders("alice", 3, limiter)
+        await ok_app(scope, receive, send)
+
+    middleware = RateLimitMiddleware(batch_app, limiter)
+    status, headers = call(middleware, "POST", "/batchOrders", [(b"x-api-key", b"alice")])
+    assert status == 200
+    assert headers["x-mbx-order-count-10s"] == "3"
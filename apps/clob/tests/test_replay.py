@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from conftest import run_flow
+from exchange.replay import replay, state_checksum
+
+
+def record(new_exchange, path: str) -> str:
+    recorder = new_exchange()
+    recorder.open_journal(path, fsync=False)
+    run_flow(recorder)
+    recorder.close_journal()
+    return state_checksum(recorder)
+
+
+def test_replay_ends_in_the_recorded_state(new_exchange, tmp_path):
+    path = str(tmp_path / "journal.bin")
+    expected = record(new_exchange, path)
+
+    result = replay(path, new_exchange())
+
+    assert result.checksum == expected
+    assert result.commands > 0
+    # the order rejected for its balance fails again
+    assert result.failed == 1
+
+
+def test_replays_are_deterministic(new_exchange, tmp_path):
+    path = str(tmp_path / "journal.bin")
+    record(new_exchange, path)
+
+    first = replay(path, new_exchange()).checksum
+    second = replay(path, new_exchange(), speed=1000).checksum
+    assert first == second
+
+
+def test_replay_from_a_snapshot(new_exchange, tmp_path):
+    journal, snapshot = str(tmp_path / "journal.bin"), str(tmp_path / "state.snap")
+    recorder = new_exchange()
+    recorder.open_journal(journal, fsync=False)
+    run_flow(recorder)
+    recorder.checkpoint(snapshot)
+    recorder.withdraw("bob", "BTC", Decimal(1))
+    recorder.close_journal()
+    expected = state_checksum(recorder)
+
+    result = replay(journal, new_exchange(), snapshot_path=snapshot)
+    assert result.commands == 1
+    assert result.checksum == expected
@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+from conftest import SYMBOL, balance, limit, market
+from exchange.replay import state_checksum
+from exchange.types import CancelOrderRequest
+from fastlob.utils import order_ids, trade_ids
+
+
+def trade(exchange):
+    """Resting orders on both sides, a partial fill, a cancel and a second book."""
+    exchange.new_order("alice", limit("SELL", "101", "2", "a1"))
+    exchange.new_order("bob", limit("SELL", "101", "1"))
+    exchange.new_order("alice", limit("BUY", "99", "1.5"))
+    exchange.new_order("bob", market("BUY", "0.5"))
+    exchange.new_order("bob", limit("BUY", "98", "1"))
+    exchange.cancel_order("bob", CancelOrderRequest(symbol=SYMBOL, orderId=5))
+    exchange.new_book("ETHUSDT")
+
+
+def test_a_loaded_snapshot_has_the_state_it_was_written_from(exchange, new_exchange, tmp_path):
+    path = str(tmp_path / "state.snap")
+    trade(exchange)
+    exchange.checkpoint(path)
+    expected = state_checksum(exchange)
+
+    restored = new_exchange()
+    assert restored.load_snapshot(path)
+    assert state_checksum(restored) == expected
+
+    book = restored._books[SYMBOL]
+    asks = {price: [order.id() for order in orders] for _, price, orders in book.resting_queues()}
+    assert asks[Decimal("101")] == [1, 2]
+    assert book.get_order_by_id(1).quantity() == Decimal("1.5")
+    assert balance("alice", "BTC") == (Decimal("98"), Decimal("1.5"))
+
+
+def test_a_restored_exchange_continues_the_id_sequences(exchange, new_exchange, tmp_path):
+    path = str(tmp_path / "state.snap")
+    trade(exchange)
+    exchange.checkpoint(path)
+    next_order_id, next_trade_id = order_ids.peek(), trade_ids.peek()
+
+    restored = new_exchange()
+    restored.load_snapshot(path)
+    restored.new_order("bob", market("BUY", "1"))
+
+    assert restored._books[SYMBOL].has_order_id(next_order_id)
+    assert trade_ids.peek() > next_trade_id
+
+
+def test_snapshot_and_journal_tail_rebuild_the_state(new_exchange, tmp_path):
+    snapshot, journal = str(tmp_path / "state.snap"), str(tmp_path / "journal.bin")
+    first = new_exchange()
+    first.open_journal(journal, fsync=False)
+    first.new_book(SYMBOL)
+    for client_id in ("alice", "bob"):
+        first.deposit(client_id, "BTC", Decimal(100))
+        first.deposit(client_id, "USDT", Decimal(10_000))
+    trade(first)
+    first.checkpoint(snapshot)
+    first.new_order("alice", market("SELL", "0.25"))
+    first.new_order("bob", limit("SELL", "105", "3"))
+    first.close_journal()
+    expected = state_checksum(first)
+
+    second = new_exchange()
+    assert second.load_snapshot(snapshot)
+    assert second.open_journal(journal, fsync=False) == 2
+    assert state_checksum(second) == expected
+
+
+def test_no_snapshot_to_load(new_exchange, tmp_path):
+    assert not new_exchange().load_snapshot(str(tmp_path / "missing.snap"))